@@ -0,0 +1,239 @@
+"""
+Background job queue for contract analysis, backed by the `analysis_jobs` collection.
+
+Jobs are claimed atomically with find_one_and_update, so they can be executed either
+by tasks inside the API process or by one or more standalone workers (worker.py).
+Running jobs heartbeat through `updated_at`; jobs whose process died are requeued by
+the work loop, and a job that fails with HTTP 503 (busy extraction pool) is retried.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+JOB_HEARTBEAT_SECONDS = 60
+# A running job without a heartbeat for this long belongs to a process that died
+JOB_STALE_SECONDS = 300
+# Wait before retrying a job after a 503 without Retry-After; doubles per attempt
+JOB_RETRY_DELAY_SECONDS = 10
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def describe_progress(stage: str, detail: dict) -> str:
+    """Human readable progress line, e.g. 'ocr page 3/40' or 'chunk 2/5'"""
+    if stage == "ocr" and "page" in detail:
+        return f"ocr page {detail['page']}/{detail['pages']}"
+    if stage == "analyzing" and "chunk" in detail:
+        return f"chunk {detail['chunk']}/{detail['chunks']}"
+    return stage
+
+
+def retry_delay(error: Exception, attempt: int):
+    """Seconds to wait before running a job again after `error`, or None if it is not retryable"""
+    if getattr(error, "status_code", None) != 503:
+        return None
+    retry_after = (getattr(error, "headers", None) or {}).get("Retry-After", "")
+    base = int(retry_after) if retry_after.isdigit() else JOB_RETRY_DELAY_SECONDS
+    return base * 2 ** (attempt - 1)
+
+
+class AnalysisJobQueue:
+    """
+    `runner(job, progress)` performs the work for a claimed job and returns the
+    resulting contract analysis id; `progress(stage, **detail)` records stage progress.
+    `cleanup(job)` is called once a job has completed or failed for good. A job is
+    run at most `max_attempts` times (503 retries and requeues after a crash).
+    """
+
+    def __init__(self, collection, runner, concurrency: int = 2, cleanup=None, max_attempts: int = 5):
+        self.collection = collection
+        self.runner = runner
+        self.concurrency = concurrency
+        self.cleanup = cleanup
+        self.max_attempts = max_attempts
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+
+    async def create(self, **fields) -> dict:
+        job = {
+            "id": str(uuid.uuid4()),
+            "status": JOB_QUEUED,
+            "stage": "queued",
+            "progress": {},
+            "message": "queued",
+            "result_id": None,
+            "error": None,
+            "created_at": _now(),
+            "updated_at": _now(),
+            **fields
+        }
+        await self.collection.insert_one(dict(job))
+        return job
+
+    async def get(self, job_id: str):
+        return await self.collection.find_one({"id": job_id}, {"_id": 0})
+
+    async def claim(self, job_id: str = None):
+        """Atomically move a queued job (a specific one, or the oldest) to running"""
+        query = {"status": JOB_QUEUED}
+        if job_id:
+            query["id"] = job_id
+        return await self.collection.find_one_and_update(
+            query,
+            {"$set": {"status": JOB_RUNNING, "stage": "starting", "message": "starting", "updated_at": _now()},
+             "$inc": {"attempts": 1}},
+            sort=[("created_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _set(self, job_id: str, **fields):
+        fields["updated_at"] = _now()
+        await self.collection.update_one({"id": job_id}, {"$set": fields})
+
+    def _cleanup(self, job: dict):
+        if self.cleanup is None:
+            return
+        try:
+            self.cleanup(job)
+        except Exception as e:
+            logging.warning(f"Cleanup of analysis job {job['id']} failed: {str(e)}")
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                await self._set(job_id)
+            except Exception as e:
+                logging.warning(f"Analysis job {job_id} heartbeat failed: {str(e)}")
+
+    async def run(self, job: dict):
+        """Execute a claimed job and record its outcome"""
+        job_id = job["id"]
+        attempt = job.get("attempts", 1)
+
+        async def progress(stage: str, **detail):
+            await self._set(job_id, stage=stage, progress=detail, message=describe_progress(stage, detail))
+
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        finished = False
+        try:
+            while True:
+                try:
+                    result_id = await self.runner(job, progress)
+                    break
+                except Exception as e:
+                    delay = retry_delay(e, attempt)
+                    if delay is None or attempt >= self.max_attempts:
+                        raise
+                    logging.warning(f"Analysis job {job_id} retrying in {delay}s after: {getattr(e, 'detail', None) or str(e)}")
+                    await self._set(job_id, stage="waiting", progress={}, message=f"server busy, retrying in {delay}s")
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    await self.collection.update_one({"id": job_id}, {"$inc": {"attempts": 1}})
+            await self._set(job_id, status=JOB_COMPLETED, stage="completed", message="completed", result_id=result_id)
+            finished = True
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e) or type(e).__name__
+            logging.error(f"Analysis job {job_id} failed: {detail}")
+            await self._set(job_id, status=JOB_FAILED, stage="failed", message="failed", error=detail)
+            finished = True
+        finally:
+            heartbeat.cancel()
+            # Only once the final status is stored: a job still marked running is
+            # requeued by requeue_stale and needs its upload for the rerun
+            if finished:
+                self._cleanup(job)
+
+    async def _run_in_process(self, job_id: str):
+        async with self._semaphore:
+            job = await self.claim(job_id)
+            if job:
+                await self.run(job)
+
+    def start_in_process(self, job_id: str):
+        """Run a queued job as a task of the current (API) process"""
+        task = asyncio.create_task(self._run_in_process(job_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def requeue_stale(self, max_age_seconds: int = JOB_STALE_SECONDS):
+        """Put jobs whose process died mid-run back in the queue, or fail them after max_attempts runs"""
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=max_age_seconds)).isoformat()
+        stale = await self.collection.find(
+            {"status": JOB_RUNNING, "updated_at": {"$lt": cutoff}}, {"_id": 0}
+        ).to_list(None)
+        requeued = 0
+        for job in stale:
+            exhausted = job.get("attempts", 1) >= self.max_attempts
+            if exhausted:
+                update = {"status": JOB_FAILED, "stage": "failed", "message": "failed",
+                          "error": "Analysis was interrupted too many times. Please upload the document again."}
+            else:
+                update = {"status": JOB_QUEUED, "stage": "queued", "message": "requeued"}
+            # Matching updated_at skips jobs that sent a heartbeat in the meantime
+            result = await self.collection.update_one(
+                {"id": job["id"], "status": JOB_RUNNING, "updated_at": job["updated_at"]},
+                {"$set": {**update, "updated_at": _now()}}
+            )
+            if not result.modified_count:
+                continue
+            if exhausted:
+                logging.error(f"Analysis job {job['id']} failed after {job.get('attempts', 1)} interrupted runs")
+                self._cleanup(job)
+            else:
+                requeued += 1
+        if requeued:
+            logging.warning(f"Requeued {requeued} stale analysis jobs")
+
+    async def work_forever(self, poll_interval: float = 2.0):
+        """
+        Worker loop: keep up to `concurrency` claimed jobs running, polling for new
+        ones, and requeue stale jobs every heartbeat interval
+        """
+        logging.info(f"Analysis worker started (concurrency={self.concurrency})")
+        loop = asyncio.get_running_loop()
+        next_requeue = loop.time()
+        while True:
+            await self._semaphore.acquire()
+            try:
+                if loop.time() >= next_requeue:
+                    next_requeue = loop.time() + JOB_HEARTBEAT_SECONDS
+                    await self.requeue_stale()
+                job = await self.claim()
+            except Exception as e:
+                logging.error(f"Analysis worker could not poll for jobs: {str(e)}")
+                job = None
+            if not job:
+                self._semaphore.release()
+                await asyncio.sleep(poll_interval)
+                continue
+
+            async def run_and_release(job=job):
+                try:
+                    await self.run(job)
+                finally:
+                    self._semaphore.release()
+
+            task = asyncio.create_task(run_and_release())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def start_worker_in_process(self, poll_interval: float = 10.0):
+        """
+        Run work_forever as a task of the API process (ANALYSIS_JOB_MODE=inprocess), so
+        jobs queued or running when the previous process stopped are picked up again
+        """
+        task = asyncio.create_task(self.work_forever(poll_interval))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
@@ -0,0 +1,180 @@
+"""
+Synthetic contract corpus for the benchmarks.
+
+Documents are generated deterministically from a seed: German rental / employment
+clauses (including a few the rule engine flags) laid out as text PDFs, scanned
+(image-only) PDFs, DOCX, XLSX, PPTX and PNG files of a given page count.
+"""
+import random
+from dataclasses import dataclass
+from pathlib import Path
+
+CLAUSES = [
+    ("§ {n} Mietzins", "Die monatliche Miete beträgt {amount} EUR zuzüglich Nebenkosten in Höhe von {fee} EUR. "
+                      "Die Miete ist spätestens am dritten Werktag eines jeden Monats im Voraus zu zahlen."),
+    ("§ {n} Kaution", "Der Mieter leistet eine Mietsicherheit in Höhe von fünf Monatsmieten. "
+                     "Die Kaution ist vor Übergabe der Wohnung in bar zu zahlen."),
+    ("§ {n} Kündigung", "Das Mietverhältnis kann von beiden Parteien mit einer Frist von zwei Wochen gekündigt werden. "
+                       "Die Kündigung bedarf der Schriftform."),
+    ("§ {n} Schönheitsreparaturen", "Der Mieter ist verpflichtet, die Wohnung bei Auszug unabhängig vom Zustand "
+                                   "vollständig zu renovieren und alle Wände weiß zu streichen."),
+    ("§ {n} Arbeitszeit", "Die regelmäßige Arbeitszeit beträgt {hours} Stunden pro Woche. Überstunden sind mit dem "
+                         "Gehalt abgegolten und werden nicht gesondert vergütet."),
+    ("§ {n} Vergütung", "Der Arbeitnehmer erhält ein monatliches Bruttogehalt von {amount} EUR. "
+                       "Eine Bearbeitungsgebühr von {fee} EUR wird vorab per Western Union überwiesen."),
+    ("§ {n} Haftung", "Der Vermieter haftet nicht für Schäden, gleich aus welchem Rechtsgrund, auch nicht bei "
+                     "grober Fahrlässigkeit oder Vorsatz."),
+    ("§ {n} Datenschutz", "Personenbezogene Daten werden ausschließlich zur Durchführung dieses Vertrages verarbeitet "
+                         "und nach Beendigung gelöscht."),
+]
+
+LINES_PER_PAGE = 28
+
+# Formats whose layout has pages (the others are single-page by nature)
+PAGED_FORMATS = ("pdf", "scanned_pdf", "docx", "xlsx", "pptx")
+
+
+@dataclass(frozen=True)
+class CorpusDocument:
+    path: Path
+    format: str
+    pages: int
+    size: int
+
+
+def contract_pages(pages: int, seed: int = 0) -> list:
+    """`pages` pages of clause text, each a list of lines"""
+    rng = random.Random(seed)
+    result = []
+    number = 1
+    for _ in range(pages):
+        lines = []
+        while len(lines) < LINES_PER_PAGE:
+            heading, body = rng.choice(CLAUSES)
+            values = {"n": number, "amount": rng.randrange(600, 3000), "fee": rng.randrange(50, 400), "hours": rng.choice([38, 40, 48])}
+            lines.append(heading.format(**values))
+            words = body.format(**values).split()
+            # Wrap at ~80 characters
+            line = []
+            for word in words:
+                if sum(len(w) + 1 for w in line) + len(word) > 80:
+                    lines.append(" ".join(line))
+                    line = []
+                line.append(word)
+            lines.append(" ".join(line))
+            lines.append("")
+            number += 1
+        result.append(lines[:LINES_PER_PAGE])
+    return result
+
+
+def write_text_pdf(path: Path, pages: list):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    pdf = canvas.Canvas(str(path), pagesize=A4)
+    for lines in pages:
+        text = pdf.beginText(50, 800)
+        text.setFont("Helvetica", 10)
+        for line in lines:
+            text.textLine(line)
+        pdf.drawText(text)
+        pdf.showPage()
+    pdf.save()
+
+
+def render_page_image(lines: list, dpi: int = 150):
+    """A4 page as a grayscale image, as a scanner would produce it"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    font_size = dpi // 7
+    font = ImageFont.load_default(size=font_size)
+    y = dpi // 2
+    for line in lines:
+        draw.text((dpi // 2, y), line, fill=0, font=font)
+        y += int(font_size * 1.6)
+    return image
+
+
+def write_scanned_pdf(path: Path, pages: list, dpi: int = 150):
+    images = [render_page_image(lines, dpi) for lines in pages]
+    images[0].save(path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+
+
+def write_docx(path: Path, pages: list):
+    from docx import Document
+
+    document = Document()
+    for i, lines in enumerate(pages):
+        for line in lines:
+            if line:
+                document.add_paragraph(line)
+        if i < len(pages) - 1:
+            document.add_page_break()
+    document.save(path)
+
+
+def write_xlsx(path: Path, pages: list):
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for i, lines in enumerate(pages):
+        sheet = workbook.create_sheet(f"Seite {i + 1}")
+        for row, line in enumerate(lines, start=1):
+            sheet.cell(row=row, column=1, value=line)
+    workbook.save(path)
+
+
+def write_pptx(path: Path, pages: list):
+    from pptx import Presentation
+    from pptx.util import Inches, Pt
+
+    presentation = Presentation()
+    layout = presentation.slide_layouts[6]  # blank
+    for lines in pages:
+        slide = presentation.slides.add_slide(layout)
+        frame = slide.shapes.add_textbox(Inches(0.3), Inches(0.3), Inches(9.4), Inches(6.9)).text_frame
+        frame.text = "\n".join(lines)
+        for paragraph in frame.paragraphs:
+            for run in paragraph.runs:
+                run.font.size = Pt(8)
+    presentation.save(path)
+
+
+def write_png(path: Path, pages: list):
+    render_page_image(pages[0]).save(path, "PNG")
+
+
+WRITERS = {
+    "pdf": (".pdf", write_text_pdf),
+    "scanned_pdf": (".pdf", write_scanned_pdf),
+    "docx": (".docx", write_docx),
+    "xlsx": (".xlsx", write_xlsx),
+    "pptx": (".pptx", write_pptx),
+    "png": (".png", write_png),
+}
+
+
+def build_corpus(directory: Path, plan: dict, seed: int = 0) -> list:
+    """
+    Write one document per (format, page count) in `plan` ({format: [pages, ...]})
+    to `directory`; existing files are reused since generation is deterministic.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    documents = []
+    for fmt, page_counts in plan.items():
+        suffix, writer = WRITERS[fmt]
+        for pages in page_counts:
+            if fmt not in PAGED_FORMATS:
+                pages = 1
+            path = directory / f"{fmt}_{pages}p_s{seed}{suffix}"
+            if not path.exists():
+                tmp_path = path.with_name(f"tmp_{path.name}")
+                writer(tmp_path, contract_pages(pages, seed))
+                tmp_path.replace(path)
+            documents.append(CorpusDocument(path=path, format=fmt, pages=pages, size=path.stat().st_size))
+    return documents
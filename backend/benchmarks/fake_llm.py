@@ -0,0 +1,156 @@
+"""
+Local stand-in for Groq's OpenAI-compatible /chat/completions endpoint.
+
+Replies are canned but shaped like the real ones (the risk assessment and final
+analysis formats parsed by server.py), after a configurable latency. Point the
+backend at it with GROQ_BASE_URL:
+
+    python -m benchmarks.fake_llm --port 8089 --latency 0.8
+    GROQ_BASE_URL=http://127.0.0.1:8089/v1 GROQ_API_KEY=bench uvicorn server:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import time
+
+from aiohttp import web
+
+from prompts import RISK_SYSTEM_MESSAGE, MERGE_SYSTEM_MESSAGE
+
+RISK_REPLY = """SCAM_CONFIDENCE: 15
+SCAM_INDICATORS:
+None
+LEGAL_RISK_CONFIDENCE: 40
+LEGAL_CONCERNS:
+- Deposit may exceed three monthly rents
+- Notice period shorter than the statutory minimum
+RISK_EXPLANATION: The contract is mostly standard, but the deposit and notice clauses deviate from the BGB."""
+
+MERGE_REPLY = """TYPE: rental
+SUMMARY: This is a residential lease. The deposit exceeds [§ 551 BGB – Rental Deposit](https://www.gesetze-im-internet.de/bgb/__551.html) limits and the notice period is shorter than allowed.
+RECOMMENDATIONS: Ask the landlord to reduce the deposit to three monthly rents and to apply the statutory notice period of [§ 573c BGB – Notice Periods](https://www.gesetze-im-internet.de/bgb/__573c.html).
+KEY_EXCERPTS:
+The tenant pays a deposit of five monthly rents before moving in.
+Either party may terminate with a notice period of two weeks.
+RELEVANT_LAWS:
+- [§ 551 BGB – Rental Deposit](https://www.gesetze-im-internet.de/bgb/__551.html)
+- [§ 573c BGB – Notice Periods](https://www.gesetze-im-internet.de/bgb/__573c.html)"""
+
+SECTION_REPLY = (
+    "This section of a rental agreement sets out the rent, the deposit and the notice period. "
+    "The deposit of five monthly rents exceeds the statutory maximum. No other deadlines or fees are mentioned."
+)
+
+
+def canned_reply(system_message: str) -> str:
+    if system_message == RISK_SYSTEM_MESSAGE:
+        return RISK_REPLY
+    if system_message == MERGE_SYSTEM_MESSAGE:
+        return MERGE_REPLY
+    return SECTION_REPLY
+
+
+class FakeLlmServer:
+    """
+    `latency` seconds (+/- `jitter`) before each reply; streams emit one word every
+    `token_delay` seconds. A share `error_rate` of requests fails with HTTP 503.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.5, jitter: float = 0.1,
+                 token_delay: float = 0.01, error_rate: float = 0.0, seed: int = 0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._runner = None
+        self.requests = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    async def _completions(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        payload = await request.json()
+        messages = payload.get("messages", [])
+        system_message = next((m["content"] for m in messages if m["role"] == "system"), "")
+        prompt_chars = sum(len(m["content"]) for m in messages)
+
+        await asyncio.sleep(self._delay())
+        if self._random.random() < self.error_rate:
+            return web.json_response({"error": {"message": "fake overload"}}, status=503)
+
+        reply = canned_reply(system_message)
+        if not payload.get("stream"):
+            return web.json_response({
+                "id": f"fake-{self.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(reply) // 4}
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in reply.split(" "):
+            chunk = {"choices": [{"index": 0, "delta": {"content": word + " "}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            await asyncio.sleep(self.token_delay)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._completions)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        # Bind first so that port 0 resolves to the free port actually used
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        self.port = sock.getsockname()[1]
+        await web.SockSite(self._runner, sock).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve_forever(server: FakeLlmServer):
+    await server.start()
+    print(f"Fake LLM listening on {server.base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before each reply")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--token-delay", type=float, default=0.01, help="seconds between streamed words")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    args = parser.parse_args()
+    server = FakeLlmServer(args.host, args.port, args.latency, args.jitter, args.token_delay, args.error_rate)
+    try:
+        asyncio.run(serve_forever(server))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
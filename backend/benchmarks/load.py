@@ -0,0 +1,345 @@
+"""
+Load test for the chat and history endpoints.
+
+Seeds `chat_messages`, `chat_sessions` and `contract_chats` at scale, then drives the
+FastAPI app in-process (one event loop, i.e. one uvicorn worker without the HTTP
+parsing) with closed-loop virtual users against the fake LLM from fake_llm.py.
+Each endpoint is loaded on its own and then in a mixed workload, at every requested
+concurrency, reporting throughput, tail latency and event-loop lag per phase; mixed
+phases add a row per endpoint.
+
+Run from the backend directory against a local mongod:
+
+    python -m benchmarks.load --sessions 10000 --messages 1000000 --concurrency 8 32 128
+    python -m benchmarks.load --mongo-uri mock --sessions 200 --messages 5000   # mongomock-motor, smoke runs only
+
+mongomock-motor is pinned in requirements.txt.
+
+Seeded data is kept in --db-name and reused by later runs with the same sizes;
+pass --reseed to rebuild it or --drop to remove it afterwards.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.fake_llm import FakeLlmServer
+from benchmarks.run import percentile
+
+USER_MESSAGES = [
+    "Mein Vermieter verlangt eine Kaution von fünf Monatsmieten, ist das erlaubt?",
+    "Wie lange ist die Kündigungsfrist für meinen Arbeitsvertrag?",
+    "Can my landlord increase the rent twice in one year?",
+    "Muss ich bei Auszug renovieren, wenn die Wohnung unrenoviert übergeben wurde?",
+    "Is a two week notice period in a rental contract valid in Germany?",
+    "Darf mein Arbeitgeber Überstunden pauschal mit dem Gehalt abgelten?",
+]
+
+INSERT_BATCH = 5000
+
+# Mixed workload: share of each scenario
+MIXED_WEIGHTS = {"chat": 0.15, "chat_stream": 0.05, "history": 0.3, "messages": 0.35, "contract_history": 0.15}
+
+
+def session_sizes(sessions: int, messages: int, rng: random.Random) -> list:
+    """Messages per session: heavy tailed (a few very long sessions), summing to `messages`"""
+    weights = [rng.paretovariate(1.2) for _ in range(sessions)]
+    total = sum(weights)
+    sizes = [max(1, int(messages * w / total)) for w in weights]
+    sizes[0] += messages - sum(sizes)  # rounding remainder goes to one session
+    return sizes
+
+
+async def insert_batched(collection, docs):
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= INSERT_BATCH:
+            await collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+
+
+def chat_documents(session_id: str, count: int, start: datetime, response_chars: int, rng: random.Random):
+    for i in range(count):
+        yield {
+            "id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "user_message": rng.choice(USER_MESSAGES),
+            "ai_response": ("Nach § 551 BGB darf die Kaution höchstens drei Nettokaltmieten betragen. " * 20)[:response_chars],
+            "timestamp": (start + timedelta(seconds=30 * i)).isoformat()
+        }
+
+
+async def seed(db, args):
+    """Seed the collections unless a dataset of the same size is already there"""
+    wanted = {"sessions": args.sessions, "messages": args.messages, "contracts": args.contracts,
+              "contract_messages": args.contract_messages, "response_chars": args.response_chars, "seed": args.seed}
+    marker = await db.load_test_dataset.find_one({}, {"_id": 0})
+    if marker == wanted and not args.reseed:
+        print(f"Reusing seeded dataset {wanted}")
+    else:
+        for name in ("chat_messages", "chat_sessions", "contract_chats", "load_test_dataset"):
+            await db.drop_collection(name)
+        rng = random.Random(args.seed)
+        started = time.perf_counter()
+        epoch = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        sizes = session_sizes(args.sessions, args.messages, rng)
+
+        def all_messages():
+            for n, size in enumerate(sizes):
+                yield from chat_documents(f"load-session-{n}", size, epoch + timedelta(minutes=n), args.response_chars, rng)
+
+        await insert_batched(db.chat_messages, all_messages())
+        await insert_batched(db.chat_sessions, (
+            {
+                "session_id": f"load-session-{n}",
+                "title": None,
+                "preview": USER_MESSAGES[n % len(USER_MESSAGES)][:60],
+                "created_at": (epoch + timedelta(minutes=n)).isoformat(),
+                "timestamp": (epoch + timedelta(minutes=n, seconds=30 * (size - 1))).isoformat(),
+                "message_count": size
+            }
+            for n, size in enumerate(sizes)
+        ))
+
+        contract_sizes = session_sizes(args.contracts, args.contract_messages, rng)
+
+        def all_contract_messages():
+            for n, size in enumerate(contract_sizes):
+                for doc in chat_documents(f"load-contract-session-{n}", size, epoch, args.response_chars, rng):
+                    doc["contract_id"] = f"load-contract-{n}"
+                    yield doc
+
+        await insert_batched(db.contract_chats, all_contract_messages())
+        await db.load_test_dataset.insert_one(dict(wanted))
+        print(f"Seeded {wanted} in {time.perf_counter() - started:.1f}s")
+
+
+class LoopLagMonitor:
+    """Samples how late a `interval` sleep wakes up, i.e. how long the loop was busy"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def start(self):
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> list:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        return self.samples
+
+
+class Scenarios:
+    """One request per scenario; returns the HTTP status"""
+
+    def __init__(self, client, args, rng: random.Random):
+        self.client = client
+        self.args = args
+        self.rng = rng
+
+    def _session(self) -> str:
+        return f"load-session-{self.rng.randrange(self.args.sessions)}"
+
+    async def chat(self) -> int:
+        response = await self.client.post("/api/chat", json={"session_id": self._session(), "message": self.rng.choice(USER_MESSAGES)})
+        return response.status_code
+
+    async def chat_stream(self) -> int:
+        response = await self.client.post("/api/chat/stream", json={"session_id": self._session(), "message": self.rng.choice(USER_MESSAGES)})
+        return response.status_code
+
+    async def history(self) -> int:
+        # Mostly the first page, sometimes a user scrolling a few pages down
+        response = await self.client.get("/api/chat/history", params={"limit": 50})
+        for _ in range(self.rng.choice([0, 0, 0, 1, 3])):
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor or response.status_code != 200:
+                break
+            response = await self.client.get("/api/chat/history", params={"limit": 50, "before": cursor})
+        return response.status_code
+
+    async def messages(self) -> int:
+        session_id = self._session()
+        response = await self.client.get(f"/api/chat/{session_id}/messages", params={"limit": 200})
+        if self.rng.random() < 0.2 and response.headers.get("x-next-cursor"):
+            response = await self.client.get(
+                f"/api/chat/{session_id}/messages", params={"limit": 200, "before": response.headers["x-next-cursor"]}
+            )
+        return response.status_code
+
+    async def contract_history(self) -> int:
+        n = self.rng.randrange(self.args.contracts)
+        response = await self.client.get(
+            f"/api/contract/load-contract-{n}/chat/history", params={"session_id": f"load-contract-session-{n}", "limit": 200}
+        )
+        return response.status_code
+
+
+async def run_phase(scenarios: Scenarios, weights: dict, concurrency: int, duration: float) -> dict:
+    names = list(weights)
+    shares = list(weights.values())
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    deadline = time.perf_counter() + duration
+    monitor = LoopLagMonitor()
+
+    async def virtual_user(rng: random.Random):
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, shares)[0]
+            started = time.perf_counter()
+            try:
+                status = await getattr(scenarios, name)()
+            except Exception:
+                status = 0
+            latencies[name].append(time.perf_counter() - started)
+            if status >= 400 or status == 0:
+                errors[name] += 1
+
+    monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(*[virtual_user(random.Random(i)) for i in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    lag = await monitor.stop()
+
+    every = [value for values in latencies.values() for value in values]
+    result = summarize(every, sum(errors.values()), elapsed)
+    result.update({
+        "lag_p50": percentile(lag, 50),
+        "lag_p99": percentile(lag, 99),
+        "lag_max": max(lag, default=0.0),
+    })
+    if len(names) > 1:
+        result["scenarios"] = {name: summarize(latencies[name], errors[name], elapsed) for name in names}
+    return result
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies, default=0.0),
+    }
+
+
+def print_row(phase: str, concurrency: int, result: dict):
+    # Event-loop lag is measured per phase, so per-scenario rows leave it blank
+    lag = (
+        f"{result['lag_p50'] * 1000:>9.1f}{result['lag_p99'] * 1000:>9.1f}{result['lag_max'] * 1000:>9.1f}"
+        if "lag_p50" in result else ""
+    )
+    print(
+        f"{phase:<19}{concurrency:>5}{result['requests']:>9}{result['errors']:>7}{result['rps']:>9.1f}"
+        f"{result['p50'] * 1000:>9.0f}{result['p95'] * 1000:>9.0f}{result['p99'] * 1000:>9.0f}{result['max'] * 1000:>9.0f}"
+        f"{lag}"
+    )
+
+
+def configure_server_env(args, llm_url: str):
+    os.environ.update({
+        "MONGODB_URI": "mongodb://mock" if args.mongo_uri == "mock" else args.mongo_uri,
+        "DB_NAME": args.db_name,
+        "GROQ_API_KEY": "load-test",
+        "GROQ_BASE_URL": llm_url,
+        "LLM_MAX_CONCURRENCY": str(args.llm_concurrency),
+        "LLM_RATE_LIMIT_RPM": "0",
+        "LLM_RATE_LIMIT_TPM": "0",
+        "MONGO_QUERY_AUDIT": "false",
+    })
+    if args.mongo_uri == "mock":
+        # server.py builds its client at import time; swap the class before that happens
+        import motor.motor_asyncio
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("--mongo-uri mock needs mongomock-motor: pip install -r requirements.txt")
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+
+
+async def main_async(args):
+    import httpx
+
+    fake_llm = FakeLlmServer(latency=args.llm_latency, jitter=args.llm_latency / 5, token_delay=args.token_delay)
+    await fake_llm.start()
+    configure_server_env(args, fake_llm.base_url)
+    import server
+
+    try:
+        await seed(server.db, args)
+        await server.prepare_database()
+
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=120) as client:
+            scenarios = Scenarios(client, args, random.Random(args.seed))
+            phases = [(name, {name: 1.0}) for name in args.scenarios]
+            if "mixed" in args.phases:
+                phases.append(("mixed", MIXED_WEIGHTS))
+            if "each" not in args.phases:
+                phases = [phase for phase in phases if phase[0] == "mixed"]
+
+            print(f"{'phase':<19}{'users':>5}{'requests':>9}{'errors':>7}{'req/s':>9}"
+                  f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'lag p50':>9}{'lag p99':>9}{'lag max':>9}")
+            for name, weights in phases:
+                for concurrency in args.concurrency:
+                    result = await run_phase(scenarios, weights, concurrency, args.duration)
+                    print_row(name, concurrency, result)
+                    for scenario, scenario_result in result.get("scenarios", {}).items():
+                        print_row(f"  {scenario}", concurrency, scenario_result)
+        print(f"Fake LLM served {fake_llm.requests} requests")
+    finally:
+        if args.drop:
+            await server.client.drop_database(args.db_name)
+        server.client.close()
+        server.extraction_executor.shutdown()
+        await server.llm.close()
+        await fake_llm.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the chat and history endpoints")
+    parser.add_argument("--mongo-uri", default=os.environ.get("BENCH_MONGODB_URI", "mongodb://localhost:27017"),
+                        help='"mock" uses mongomock-motor (in-memory, slow at scale)')
+    parser.add_argument("--db-name", default="legalme_load")
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--contracts", type=int, default=1000)
+    parser.add_argument("--contract-messages", type=int, default=50000)
+    parser.add_argument("--response-chars", type=int, default=600, help="length of seeded AI replies")
+    parser.add_argument("--reseed", action="store_true")
+    parser.add_argument("--drop", action="store_true", help="drop the database afterwards")
+    parser.add_argument("--scenarios", nargs="*", default=list(MIXED_WEIGHTS), choices=list(MIXED_WEIGHTS))
+    parser.add_argument("--phases", nargs="*", default=["each", "mixed"], choices=["each", "mixed"])
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 8, 32], help="virtual users per phase")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per phase")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="fake LLM seconds before a reply")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="fake LLM seconds between streamed words")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="LLM_MAX_CONCURRENCY for the app")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
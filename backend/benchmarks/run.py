@@ -0,0 +1,256 @@
+"""
+Offline benchmark for the contract analysis pipeline.
+
+Generates a synthetic corpus (see corpus.py), measures text extraction throughput
+per format through the extraction process pool (OCR pages/sec for scanned PDFs),
+then runs the full analysis pipeline against a local fake LLM (see fake_llm.py) and
+a Mongo database, reporting end-to-end p50 / p95 latency and peak RSS. Results are
+compared with the stored baseline; the command exits non-zero on a regression, and
+with status 2 if no baseline was recorded for the profile yet.
+
+Run from the backend directory (needs tesseract/poppler and a reachable mongod):
+
+    python -m benchmarks.run                        # quick profile, compare with baseline
+    python -m benchmarks.run --profile full
+    python -m benchmarks.run --update-baseline      # record this machine's numbers
+    python -m benchmarks.run --skip-e2e             # extraction only, no Mongo needed
+
+Baselines are machine specific and not committed: record them with
+--update-baseline on the machine (or CI runner class) that later runs the comparison.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.corpus import build_corpus
+from benchmarks.fake_llm import FakeLlmServer
+
+BENCH_DIR = Path(__file__).parent
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+DEFAULT_CORPUS_DIR = BENCH_DIR.parent / ".cache" / "bench_corpus"
+
+PROFILES = {
+    "quick": {"pdf": [1, 10], "scanned_pdf": [1, 3], "docx": [10], "xlsx": [10], "pptx": [10], "png": [1]},
+    "full": {"pdf": [1, 10, 50, 200], "scanned_pdf": [1, 20, 200], "docx": [1, 50, 200], "xlsx": [50], "pptx": [50], "png": [1]},
+}
+
+# Metric name suffixes where a larger value is better; everything else should not grow
+HIGHER_IS_BETTER = ("_per_sec",)
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    return statistics.quantiles(ordered, n=100, method="inclusive")[int(q) - 1]
+
+
+def peak_rss_mb(who: int) -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)
+
+
+async def bench_extraction(documents: list, workers: int, runs: int) -> dict:
+    """Pages/sec and MB/sec per format through the extraction pool"""
+    from extraction_pool import ExtractionExecutor
+
+    executor = ExtractionExecutor(max_workers=workers, queue_limit=len(documents))
+    totals = {}
+    try:
+        # Warm up the pool so process start-up is not billed to the first format
+        smallest = min(documents, key=lambda d: d.size)
+        await executor.extract(str(smallest.path), smallest.path.name)
+
+        for document in documents:
+            for _ in range(runs):
+                started = time.perf_counter()
+                text, _ = await executor.extract(str(document.path), document.path.name)
+                elapsed = time.perf_counter() - started
+                if not text.strip():
+                    raise RuntimeError(f"No text extracted from {document.path.name}")
+                total = totals.setdefault(document.format, {"pages": 0, "bytes": 0, "seconds": 0.0})
+                total["pages"] += document.pages
+                total["bytes"] += document.size
+                total["seconds"] += elapsed
+                print(f"  extract {document.path.name}: {elapsed:.2f}s")
+    finally:
+        executor.shutdown(wait=True)
+
+    metrics = {}
+    for fmt, total in totals.items():
+        prefix = "ocr" if fmt in ("scanned_pdf", "png") else "extraction"
+        metrics[f"{prefix}.{fmt}.pages_per_sec"] = round(total["pages"] / total["seconds"], 2)
+        metrics[f"{prefix}.{fmt}.mb_per_sec"] = round(total["bytes"] / total["seconds"] / 1e6, 2)
+    return metrics
+
+
+def configure_server_env(mongo_uri: str, db_name: str, llm_url: str, workers: int, scratch: Path):
+    """Environment for importing server.py against the fake LLM, with every cache off"""
+    os.environ.update({
+        "MONGODB_URI": mongo_uri,
+        "DB_NAME": db_name,
+        "GROQ_API_KEY": "benchmark",
+        "GROQ_BASE_URL": llm_url,
+        "LLM_RATE_LIMIT_RPM": "0",
+        "LLM_RATE_LIMIT_TPM": "0",
+        "LLM_CACHE_ENABLED": "false",
+        "EXTRACTION_CACHE": "off",
+        "EXTRACTION_WORKERS": str(workers),
+        "UPLOAD_DIR": str(scratch / "uploads"),
+        "REPORT_CACHE_DIR": str(scratch / "reports"),
+        "MONGO_QUERY_AUDIT": "false",
+    })
+
+
+async def bench_end_to_end(documents: list, args, scratch: Path) -> dict:
+    """Latency of run_analysis_pipeline per upload, with the fake LLM answering"""
+    fake_llm = FakeLlmServer(latency=args.llm_latency, jitter=args.llm_latency / 5)
+    await fake_llm.start()
+    db_name = f"legalme_bench_{os.getpid()}"
+    configure_server_env(args.mongo_uri, db_name, fake_llm.base_url, args.workers, scratch)
+
+    import server
+    from db_indexes import ensure_indexes
+    from uploads import StoredUpload
+
+    try:
+        await asyncio.wait_for(server.client.admin.command("ping"), 10)
+    except Exception as e:
+        await fake_llm.stop()
+        raise SystemExit(f"Mongo at {args.mongo_uri} is not reachable ({e}); start mongod or pass --skip-e2e")
+
+    latencies = {}
+    try:
+        await ensure_indexes(server.db)
+        upload_dir = scratch / "uploads"
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        for document in documents:
+            digest = hashlib.sha256(document.path.read_bytes()).hexdigest()
+            for run in range(args.runs):
+                path = upload_dir / f"{run}_{document.path.name}"
+                shutil.copyfile(document.path, path)
+                upload = StoredUpload(path=str(path), filename=document.path.name, sha256=digest, size=document.size)
+                started = time.perf_counter()
+                analysis = await server.run_analysis_pipeline(upload, no_cache=True)
+                elapsed = time.perf_counter() - started
+                upload.remove()
+                if analysis.degraded:
+                    raise RuntimeError(f"Analysis of {document.path.name} fell back to pattern matching; check the fake LLM")
+                latencies.setdefault(document.format, []).append(elapsed)
+                print(f"  analyze {document.path.name}: {elapsed:.2f}s ({len(analysis.sections)} sections)")
+    finally:
+        await server.client.drop_database(db_name)
+        server.client.close()
+        server.extraction_executor.shutdown(wait=True)
+        await server.llm.close()
+        await fake_llm.stop()
+
+    every = [value for values in latencies.values() for value in values]
+    metrics = {
+        "e2e.p50_seconds": round(percentile(every, 50), 3),
+        "e2e.p95_seconds": round(percentile(every, 95), 3),
+        "e2e.llm_requests": fake_llm.requests,
+    }
+    for fmt, values in latencies.items():
+        metrics[f"e2e.{fmt}.p50_seconds"] = round(percentile(values, 50), 3)
+    return metrics
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Human readable regressions of `results` against `baseline` metrics"""
+    regressions = []
+    for name, expected in baseline.items():
+        actual = results.get(name)
+        if actual is None or not isinstance(expected, (int, float)) or name.endswith("llm_requests"):
+            continue
+        if name.endswith(HIGHER_IS_BETTER):
+            if actual < expected * (1 - tolerance):
+                regressions.append(f"{name}: {actual} < baseline {expected} (-{(1 - actual / expected) * 100:.0f}%)")
+        elif actual > expected * (1 + tolerance):
+            regressions.append(f"{name}: {actual} > baseline {expected} (+{(actual / expected - 1) * 100:.0f}%)")
+    return regressions
+
+
+async def run(args) -> int:
+    baseline_path = Path(args.baseline)
+    baselines = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    if args.profile not in baselines and not args.update_baseline:
+        # Fail before the (long) run: without a baseline nothing can be compared
+        print(f"No baseline for profile '{args.profile}' in {baseline_path}; run with --update-baseline to record one")
+        return 2
+
+    plan = {fmt: pages for fmt, pages in PROFILES[args.profile].items() if not args.formats or fmt in args.formats}
+    print(f"Building corpus ({args.profile}) in {args.corpus_dir}")
+    documents = build_corpus(Path(args.corpus_dir), plan, seed=args.seed)
+
+    results = {}
+    print("Extraction")
+    results.update(await bench_extraction(documents, args.workers, args.runs))
+    if not args.skip_e2e:
+        print("End to end")
+        scratch = Path(tempfile.mkdtemp(prefix="legalme_bench_"))
+        try:
+            e2e_documents = [d for d in documents if d.pages <= args.e2e_max_pages]
+            results.update(await bench_end_to_end(e2e_documents, args, scratch))
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+    results["peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_SELF)
+    results["peak_worker_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+
+    settings = {"workers": args.workers, "runs": args.runs, "llm_latency": args.llm_latency, "seed": args.seed}
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if args.output:
+        Path(args.output).write_text(json.dumps({"settings": settings, "results": results}, indent=2, sort_keys=True))
+
+    if args.update_baseline:
+        baselines[args.profile] = {"settings": settings, "results": results}
+        baseline_path.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline for profile '{args.profile}' written to {baseline_path}")
+        return 0
+
+    if baselines[args.profile]["settings"] != settings:
+        print(f"Warning: baseline was recorded with {baselines[args.profile]['settings']}, this run used {settings}")
+
+    regressions = compare(results, baselines[args.profile]["results"], args.tolerance)
+    if regressions:
+        print("REGRESSIONS:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"No regressions beyond {args.tolerance:.0%} of the baseline")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the contract analysis pipeline")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--formats", nargs="*", choices=sorted(PROFILES["full"]), help="limit to these formats")
+    parser.add_argument("--runs", type=int, default=3, help="repetitions per document")
+    parser.add_argument("--workers", type=int, default=2, help="extraction processes")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="fake LLM seconds per reply")
+    parser.add_argument("--e2e-max-pages", type=int, default=50, help="skip larger documents in the end-to-end phase")
+    parser.add_argument("--skip-e2e", action="store_true", help="only benchmark extraction (no Mongo needed)")
+    parser.add_argument("--mongo-uri", default=os.environ.get("BENCH_MONGODB_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--corpus-dir", default=str(DEFAULT_CORPUS_DIR))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--update-baseline", action="store_true", help="record this run as the profile's baseline (required before the first comparison)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before failing")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Per-session summaries for the chat sidebar, kept in the `chat_sessions` collection.
+
+The summary is updated whenever a chat message is saved, a session is renamed or
+deleted, so /api/chat/history reads a small indexed collection instead of grouping
+every message ever sent.
+"""
+import logging
+
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from pagination import keyset_filter, encode_cursor
+
+PREVIEW_LENGTH = 60
+
+
+def message_preview(message: str) -> str:
+    return message[:PREVIEW_LENGTH] + "..." if len(message) > PREVIEW_LENGTH else message
+
+
+class ChatSessionStore:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def record_message(self, session_id: str, user_message: str, timestamp: str):
+        update = {
+            "$set": {"preview": message_preview(user_message), "timestamp": timestamp},
+            "$inc": {"message_count": 1}
+        }
+        try:
+            await self.collection.update_one(
+                {"session_id": session_id},
+                {**update, "$setOnInsert": {"session_id": session_id, "title": None, "created_at": timestamp}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # The first two messages of a new session raced to create it; the other one won
+            await self.collection.update_one({"session_id": session_id}, update)
+
+    async def rename(self, session_id: str, title: str) -> bool:
+        result = await self.collection.update_one({"session_id": session_id}, {"$set": {"title": title}})
+        return result.matched_count > 0
+
+    async def delete(self, session_id: str):
+        await self.collection.delete_one({"session_id": session_id})
+
+    async def page(self, limit: int, before: str = None) -> tuple:
+        """Most recent sessions first. Returns (sessions, next_cursor or None)"""
+        query = keyset_filter(before, "before", id_field="session_id") if before else {}
+        sessions = await self.collection.find(query, {"_id": 0}).sort(
+            [("timestamp", DESCENDING), ("session_id", DESCENDING)]
+        ).limit(limit + 1).to_list(limit + 1)
+
+        next_cursor = None
+        if len(sessions) > limit:
+            sessions = sessions[:limit]
+            last = sessions[-1]
+            next_cursor = encode_cursor(last["timestamp"], last["session_id"])
+        return sessions, next_cursor
+
+    async def backfill(self, messages_collection, batch_size: int = 500):
+        """Build summaries from existing chat_messages (once, when the collection is still empty)"""
+        if await self.collection.estimated_document_count() > 0:
+            return
+        pipeline = [
+            {"$sort": {"session_id": 1, "timestamp": 1}},
+            {"$group": {
+                "_id": "$session_id",
+                "last_message": {"$last": "$user_message"},
+                "timestamp": {"$last": "$timestamp"},
+                "created_at": {"$first": "$timestamp"},
+                "title": {"$last": "$session_name"},
+                "message_count": {"$sum": 1}
+            }}
+        ]
+        operations = []
+        total = 0
+        async for session in messages_collection.aggregate(pipeline, allowDiskUse=True):
+            operations.append(UpdateOne(
+                {"session_id": session["_id"]},
+                {"$set": {
+                    "session_id": session["_id"],
+                    "preview": message_preview(session["last_message"]),
+                    "timestamp": session["timestamp"],
+                    "created_at": session["created_at"],
+                    "title": session.get("title"),
+                    "message_count": session["message_count"]
+                }},
+                upsert=True
+            ))
+            if len(operations) >= batch_size:
+                await self.collection.bulk_write(operations, ordered=False)
+                total += len(operations)
+                operations = []
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+            total += len(operations)
+        if total:
+            logging.info(f"Backfilled {total} chat session summaries")
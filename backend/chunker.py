@@ -0,0 +1,236 @@
+"""
+Token-aware, structure-preserving document chunker.
+
+The document is cut into blocks at page markers, headings / § markers and blank
+lines; blocks are then packed into chunks of at most `max_tokens` tokens, with the
+trailing blocks of each chunk repeated at the start of the next (overlap). Every chunk
+is a contiguous span of the original text, so paragraph structure is kept and each
+chunk knows its character offsets and page range.
+
+With `anchored=True` chunk boundaries are content-defined: once a chunk is half
+full, it ends before the next "anchor" block, chosen by a hash of the block's own
+heading line (headings preferred). An edit therefore only moves the boundaries
+around it, and the other chunks of a revised document come out identical (see
+incremental re-analysis in server.py).
+"""
+import bisect
+import hashlib
+import math
+import re
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from tokenizer import count_tokens
+
+# Page markers written by text_extractor.format_pages (duplicated to keep this module light)
+_PAGE_MARKER = re.compile(r"\n--- Page (\d+) ---\n")
+
+PAGE_MARKER_TEXT = re.compile(r"--- Page \d+ ---")
+
+# Lines that open a section: § 5, Art. 3, 4.2 Kündigung, HEADINGS
+_HEADING_PATTERN = r"[ \t]*(?:§|Art\.|Artikel|Section|Abschnitt|\d+(?:\.\d+)*\.?[ \t]+[A-ZÄÖÜ]|[A-ZÄÖÜ][A-ZÄÖÜ \t\-]{3,}\n)"
+_HEADING = re.compile(_HEADING_PATTERN)
+
+# Positions where a new block starts: after blank lines, before page markers and before headings
+_BLOCK_START = re.compile(
+    r"\n[ \t]*\n+"
+    r"|\n(?=--- Page \d+ ---\n)"
+    r"|\n(?=" + _HEADING_PATTERN + ")"
+)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+# Rough chars per token, the first guess when hard-splitting text without sentence breaks
+_CHARS_PER_TOKEN = 4
+
+# Anchored chunks end at an anchor after half of max_tokens, so they are about this full on average
+AVERAGE_FILL = 0.75
+
+
+@dataclass(frozen=True)
+class Chunk:
+    index: int
+    text: str
+    start: int  # character offsets into the document
+    end: int
+    tokens: int
+    page_start: Optional[int] = None  # None for documents without page markers
+    page_end: Optional[int] = None
+
+    def label(self) -> str:
+        """e.g. '3 (pages 4-5)' for section headers in prompts"""
+        if self.page_start is None:
+            return str(self.index + 1)
+        if self.page_start == self.page_end:
+            return f"{self.index + 1} (page {self.page_start})"
+        return f"{self.index + 1} (pages {self.page_start}-{self.page_end})"
+
+    def metadata(self) -> dict:
+        return {
+            "index": self.index,
+            "start": self.start,
+            "end": self.end,
+            "tokens": self.tokens,
+            "page_start": self.page_start,
+            "page_end": self.page_end
+        }
+
+
+def _blocks(text: str) -> Iterator[tuple]:
+    """(start, end) spans of structural blocks, in order, skipping whitespace-only ones"""
+    start = 0
+    for match in _BLOCK_START.finditer(text):
+        if text[start:match.start()].strip():
+            yield start, match.start()
+        start = match.end()
+    if text[start:].strip():
+        yield start, len(text)
+
+
+def _hard_split(text: str, start: int, end: int, max_tokens: int) -> Iterator[tuple]:
+    """Cut text without sentence breaks into pieces of at most max_tokens tokens"""
+    while start < end:
+        cut = min(end, start + max_tokens * _CHARS_PER_TOKEN)
+        tokens = count_tokens(text[start:cut])
+        if tokens > max_tokens:
+            # Denser than the guess (long compounds, digit runs): longest prefix that fits
+            low, high = start + 1, cut - 1
+            while low < high:
+                middle = (low + high + 1) // 2
+                if count_tokens(text[start:middle]) <= max_tokens:
+                    low = middle
+                else:
+                    high = middle - 1
+            cut = low
+            tokens = count_tokens(text[start:cut])
+        yield start, cut, tokens
+        start = cut
+
+
+def _split_oversized(text: str, start: int, end: int, max_tokens: int) -> Iterator[tuple]:
+    """Break a block longer than max_tokens at sentence ends, or hard at worst"""
+    piece_start = start
+    piece_tokens = 0
+    boundaries = [m.end() + start for m in _SENTENCE_END.finditer(text[start:end])] + [end]
+    sentence_start = start
+    for boundary in boundaries:
+        tokens = count_tokens(text[sentence_start:boundary])
+        if tokens > max_tokens:
+            if piece_start < sentence_start:
+                yield piece_start, sentence_start, piece_tokens
+            yield from _hard_split(text, sentence_start, boundary, max_tokens)
+            piece_start, piece_tokens = boundary, 0
+        elif piece_tokens + tokens > max_tokens:
+            yield piece_start, sentence_start, piece_tokens
+            piece_start, piece_tokens = sentence_start, tokens
+        else:
+            piece_tokens += tokens
+        sentence_start = boundary
+    if piece_start < end and text[piece_start:end].strip():
+        yield piece_start, end, piece_tokens
+
+
+def _sized_blocks(text: str, max_tokens: int) -> Iterator[tuple]:
+    for start, end in _blocks(text):
+        tokens = count_tokens(text[start:end])
+        if tokens <= max_tokens:
+            yield start, end, tokens
+        else:
+            yield from _split_oversized(text, start, end, max_tokens)
+
+
+def _anchor_level(block_text: str) -> int:
+    """
+    Trailing zero bits of the hash of a block's first line (its heading, if any).
+    Page markers are skipped: an edit earlier in the document moves them, and they
+    can also split the rest of a block differently.
+    """
+    lines = [line for line in PAGE_MARKER_TEXT.sub("", block_text).splitlines() if line.strip()]
+    normalized = " ".join(lines[0].lower().split()) if lines else ""
+    digest = int.from_bytes(hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest(), "big")
+    return (digest & -digest).bit_length() - 1 if digest else 64
+
+
+def _anchors(text: str, blocks: list, max_tokens: int) -> list:
+    """
+    For each block, whether a chunk may end right before it. Anchors are headings
+    (or any block, in documents with few headings) whose hash has enough trailing
+    zero bits to give about one anchor per quarter chunk.
+    """
+    total_tokens = sum(tokens for _, _, tokens in blocks)
+    spacing = max_tokens / 4
+    headings = [_HEADING.match(text, start) is not None for start, _, _ in blocks]
+    if sum(headings) * spacing >= total_tokens:
+        candidates = headings
+    else:
+        candidates = [not PAGE_MARKER_TEXT.fullmatch(text[start:end].strip()) for start, end, _ in blocks]
+    if not any(candidates):
+        return candidates
+    mean_tokens = total_tokens / sum(candidates)
+    bits = max(0, round(math.log2(spacing / mean_tokens))) if mean_tokens < spacing else 0
+    return [
+        candidate and _anchor_level(text[start:end]) >= bits
+        for candidate, (start, end, _) in zip(candidates, blocks)
+    ]
+
+
+def iter_chunks(text: str, max_tokens: int = 1500, overlap_tokens: int = 100, anchored: bool = False) -> Iterator[Chunk]:
+    """Yield Chunk objects covering `text` in order; see the module docstring for `anchored`"""
+    markers = [(m.start(), int(m.group(1))) for m in _PAGE_MARKER.finditer(text)]
+    marker_offsets = [offset for offset, _ in markers]
+
+    def page_at(offset: int):
+        if not markers:
+            return None
+        i = bisect.bisect_right(marker_offsets, offset) - 1
+        return markers[max(i, 0)][1]
+
+    def make_chunk(index: int, blocks: list) -> Chunk:
+        start, end = blocks[0][0], blocks[-1][1]
+        return Chunk(
+            index=index,
+            text=text[start:end].strip(),
+            start=start,
+            end=end,
+            tokens=sum(tokens for _, _, tokens in blocks),
+            page_start=page_at(start),
+            page_end=page_at(end - 1)
+        )
+
+    blocks = list(_sized_blocks(text, max_tokens))
+    anchors = _anchors(text, blocks, max_tokens) if anchored else [False] * len(blocks)
+
+    index = 0
+    current = []
+    current_tokens = 0
+    for block, anchor in zip(blocks, anchors):
+        full = current_tokens + block[2] > max_tokens
+        if current and (full or (anchor and current_tokens >= max_tokens // 2)):
+            yield make_chunk(index, current)
+            index += 1
+            # Carry trailing blocks into the next chunk as overlap
+            overlap = []
+            overlap_total = 0
+            for previous in reversed(current):
+                if overlap_total + previous[2] > overlap_tokens or overlap_total + previous[2] + block[2] > max_tokens:
+                    break
+                overlap.insert(0, previous)
+                overlap_total += previous[2]
+            current, current_tokens = overlap, overlap_total
+        current.append(block)
+        current_tokens += block[2]
+    if current:
+        yield make_chunk(index, current)
+
+
+def chunk_size_for(document_tokens: int, base_tokens: int, max_chunks: int, max_chunk_tokens: int) -> int:
+    """
+    Chunk size that covers the whole document in about `max_chunks` chunks, never
+    below `base_tokens` and never above `max_chunk_tokens`. Sizes are `base_tokens`
+    times a power of two, so small edits to a long document keep its chunk size.
+    """
+    needed = document_tokens / (max_chunks * AVERAGE_FILL)
+    size = base_tokens
+    while size < needed and size < max_chunk_tokens:
+        size *= 2
+    return min(size, max(base_tokens, max_chunk_tokens))
@@ -0,0 +1,113 @@
+"""
+Mongo index declarations, one per query shape used by the API and the analysis worker.
+
+`ensure_indexes` runs at startup (createIndexes is a no-op for indexes that already
+exist). `audit_query_shapes` optionally explains each known query and logs the ones
+that would still fall back to a collection scan.
+"""
+import logging
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+# Cached extraction results are dropped by Mongo this long after they were written
+EXTRACTION_CACHE_TTL_SECONDS = 30 * 24 * 3600
+
+INDEXES = {
+    "chat_messages": [
+        # /chat/{session_id}/messages and chat context: session messages in order
+        IndexModel([("session_id", ASCENDING), ("timestamp", ASCENDING), ("id", ASCENDING)], name="session_timestamp_id"),
+    ],
+    "chat_sessions": [
+        IndexModel([("session_id", ASCENDING)], name="session_id_unique", unique=True),
+        # /chat/history: keyset pages of the most recent sessions
+        IndexModel([("timestamp", DESCENDING), ("session_id", DESCENDING)], name="timestamp_session_desc"),
+    ],
+    "session_memory": [
+        IndexModel([("session_id", ASCENDING)], name="session_id_unique", unique=True),
+    ],
+    "contract_chats": [
+        IndexModel([("contract_id", ASCENDING), ("session_id", ASCENDING), ("timestamp", ASCENDING), ("id", ASCENDING)], name="contract_session_timestamp_id"),
+    ],
+    "contract_analyses": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Incremental re-analysis: earlier uploads sharing a section fingerprint
+        IndexModel([("chunk_fingerprints", ASCENDING), ("timestamp", DESCENDING)], name="chunk_fingerprints_timestamp"),
+    ],
+    "contract_texts": [
+        IndexModel([("contract_id", ASCENDING), ("seq", ASCENDING)], name="contract_seq_unique", unique=True),
+    ],
+    "contract_index_segments": [
+        IndexModel([("contract_id", ASCENDING), ("seq", ASCENDING)], name="contract_seq_unique", unique=True),
+    ],
+    "extraction_cache": [
+        IndexModel([("key", ASCENDING)], name="key_unique", unique=True),
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=EXTRACTION_CACHE_TTL_SECONDS),
+    ],
+    "analysis_jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Workers claim the oldest queued job
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at"),
+        # Requeueing jobs whose worker died
+        IndexModel([("status", ASCENDING), ("updated_at", ASCENDING)], name="status_updated_at"),
+    ],
+}
+
+# (description, collection, filter, sort) for every query the endpoints issue
+QUERY_SHAPES = [
+    ("chat messages by session", "chat_messages", {"session_id": "audit"}, [("timestamp", DESCENDING), ("id", DESCENDING)]),
+    ("chat history", "chat_sessions", {}, [("timestamp", DESCENDING), ("session_id", DESCENDING)]),
+    ("chat session by id", "chat_sessions", {"session_id": "audit"}, None),
+    ("session memory by session", "session_memory", {"session_id": "audit"}, None),
+    ("contract chat by session", "contract_chats", {"contract_id": "audit", "session_id": "audit"}, [("timestamp", DESCENDING), ("id", DESCENDING)]),
+    ("contract analysis by id", "contract_analyses", {"id": "audit"}, None),
+    ("analyses sharing a section", "contract_analyses", {"chunk_fingerprints": {"$in": ["audit"]}}, [("timestamp", DESCENDING)]),
+    ("contract text segments", "contract_texts", {"contract_id": "audit"}, [("seq", ASCENDING)]),
+    ("contract index segments", "contract_index_segments", {"contract_id": "audit"}, [("seq", ASCENDING)]),
+    ("extraction cache by key", "extraction_cache", {"key": "audit"}, None),
+    ("analysis job by id", "analysis_jobs", {"id": "audit"}, None),
+    ("oldest queued job", "analysis_jobs", {"status": "queued"}, [("created_at", ASCENDING)]),
+    ("stale running jobs", "analysis_jobs", {"status": "running", "updated_at": {"$lt": "audit"}}, None),
+]
+
+
+async def ensure_indexes(db):
+    """Create every declared index. Failures are logged, not raised, so the API still starts"""
+    for collection, indexes in INDEXES.items():
+        try:
+            names = await db[collection].create_indexes(indexes)
+            logging.info(f"Indexes ensured on {collection}: {', '.join(names)}")
+        except Exception as e:
+            logging.error(f"Could not create indexes on {collection}: {str(e)}")
+
+
+def _plan_stages(plan: dict):
+    """All stage names in an explain() plan tree"""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("queryPlan", "inputStage"):
+        yield from _plan_stages(plan.get(key))
+    for child in plan.get("inputStages", ()):
+        yield from _plan_stages(child)
+
+
+async def audit_query_shapes(db) -> list:
+    """Explain each known query shape; log and return the ones that use COLLSCAN"""
+    scans = []
+    for description, collection, query, sort in QUERY_SHAPES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            explained = await cursor.explain()
+        except Exception as e:
+            logging.warning(f"Query audit could not explain '{description}': {str(e)}")
+            continue
+        winning_plan = explained.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in set(_plan_stages(winning_plan)):
+            logging.warning(f"Query audit: '{description}' on {collection} uses a collection scan")
+            scans.append(description)
+    if not scans:
+        logging.info(f"Query audit: all {len(QUERY_SHAPES)} query shapes use an index")
+    return scans
@@ -0,0 +1,198 @@
+"""
+Content-addressed cache for extracted document text.
+Keyed by SHA-256 of the upload bytes plus EXTRACTOR_VERSION, so re-uploading the
+same file skips PyPDF2 / Tesseract entirely.
+"""
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+
+from bson.binary import Binary
+
+from text_extractor import EXTRACTOR_VERSION
+
+COMPRESSION_LEVEL = 6
+
+
+def _compress(text: str) -> bytes:
+    return zlib.compress(text.encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def _decompress(blob: bytes) -> str:
+    return zlib.decompress(blob).decode('utf-8')
+
+
+def extraction_cache_key(content_hash: str) -> str:
+    return f"{content_hash}:{EXTRACTOR_VERSION}"
+
+
+def evict_lru(directory: Path, pattern: str, max_bytes: int):
+    """Delete the least recently modified files matching `pattern` until the total fits `max_bytes`"""
+    entries = []
+    total = 0
+    for path in directory.glob(pattern):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+    if total <= max_bytes:
+        return
+    for _, size, path in sorted(entries):
+        path.unlink(missing_ok=True)
+        total -= size
+        if total <= max_bytes:
+            break
+
+
+class ExtractionCache:
+    """Base class: hit/miss accounting plus a no-op store (used when caching is off)"""
+
+    backend = "off"
+
+    def __init__(self, max_entry_bytes: int = 8 * 1024 * 1024):
+        self.max_entry_bytes = max_entry_bytes
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str):
+        """Returns (extracted_text, page_count) or None"""
+        result = await self._load(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    async def set(self, key: str, extracted_text: str, page_count: int):
+        if len(extracted_text.encode('utf-8')) > self.max_entry_bytes:
+            logging.info(f"Extraction result for {key[:12]} too large to cache")
+            return
+        try:
+            await self._store(key, extracted_text, page_count)
+        except Exception as e:
+            # The cache is an optimization - never fail an upload because of it
+            logging.warning(f"Extraction cache write failed: {str(e)}")
+
+    async def _load(self, key: str):
+        return None
+
+    async def _store(self, key: str, extracted_text: str, page_count: int):
+        pass
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0
+        }
+
+
+class MongoExtractionCache(ExtractionCache):
+    """
+    Stores extraction results zlib-compressed in a Mongo collection (shared by all
+    workers). Entries expire through the TTL index on `created_at` (see db_indexes).
+    """
+
+    backend = "mongo"
+
+    def __init__(self, collection, max_entry_bytes: int = 8 * 1024 * 1024):
+        super().__init__(max_entry_bytes)
+        self.collection = collection
+
+    async def _load(self, key: str):
+        try:
+            doc = await self.collection.find_one({"key": key}, {"_id": 0, "data": 1, "page_count": 1})
+        except Exception as e:
+            logging.warning(f"Extraction cache read failed: {str(e)}")
+            return None
+        if not doc or "data" not in doc:
+            # Missing, or an uncompressed entry from before compression (rewritten on the next store)
+            return None
+        extracted_text = await asyncio.to_thread(_decompress, bytes(doc["data"]))
+        return extracted_text, doc["page_count"]
+
+    async def _store(self, key: str, extracted_text: str, page_count: int):
+        blob = await asyncio.to_thread(_compress, extracted_text)
+        await self.collection.update_one(
+            {"key": key},
+            {"$set": {
+                "key": key,
+                "data": Binary(blob),
+                "page_count": page_count,
+                # A BSON date, as the TTL index requires
+                "created_at": datetime.now(timezone.utc)
+            }, "$unset": {"extracted_text": ""}},
+            upsert=True
+        )
+
+
+class DiskExtractionCache(ExtractionCache):
+    """
+    Stores extraction results as JSON files in a local directory.
+    Least recently used entries are evicted once the directory exceeds `max_bytes`.
+    """
+
+    backend = "disk"
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024, max_entry_bytes: int = 8 * 1024 * 1024):
+        super().__init__(max_entry_bytes)
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key.replace(':', '_')}.json"
+
+    def _read(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                doc = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        # Touch so eviction sees this entry as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by a concurrent write in the meantime
+            return None
+        return doc["extracted_text"], doc["page_count"]
+
+    def _write(self, key: str, extracted_text: str, page_count: int):
+        path = self._path(key)
+        # A temp file per write: the same document may be extracted by concurrent uploads
+        with tempfile.NamedTemporaryFile("w", encoding='utf-8', dir=self.directory, prefix=f"{path.stem}.", suffix=".tmp", delete=False) as f:
+            json.dump({"extracted_text": extracted_text, "page_count": page_count}, f)
+        try:
+            os.replace(f.name, path)
+        except OSError:
+            Path(f.name).unlink(missing_ok=True)
+            raise
+        self._evict()
+
+    def _evict(self):
+        evict_lru(self.directory, "*.json", self.max_bytes)
+
+    async def _load(self, key: str):
+        return await asyncio.to_thread(self._read, key)
+
+    async def _store(self, key: str, extracted_text: str, page_count: int):
+        await asyncio.to_thread(self._write, key, extracted_text, page_count)
+
+
+def create_extraction_cache(backend: str, db=None, directory: str = None, max_bytes: int = None) -> ExtractionCache:
+    """Build the cache configured by EXTRACTION_CACHE (mongo | disk | off)"""
+    if backend == "mongo":
+        return MongoExtractionCache(db.extraction_cache)
+    if backend == "disk":
+        return DiskExtractionCache(directory, max_bytes=max_bytes)
+    return ExtractionCache()
@@ -0,0 +1,135 @@
+import asyncio
+import inspect
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import HTTPException
+
+from metrics import span
+from text_extractor import (
+    ExtractionError,
+    extract_text_from_file,
+    extract_pdf_text,
+    pdf_needs_ocr,
+    ocr_pdf_window,
+    page_windows,
+    format_pages,
+)
+
+
+class ExtractionExecutor:
+    """
+    Runs blocking text extraction / OCR in a process pool so the event loop stays free.
+    Admission is bounded: at most `max_workers + queue_limit` documents may be
+    running or waiting at once; further uploads are rejected with HTTP 503.
+    Scanned PDFs are OCR'd as page windows fanned out across the pool.
+    """
+
+    def __init__(self, max_workers: int = 2, queue_limit: int = 8, start_method: str = "spawn"):
+        self.max_workers = max_workers
+        self.queue_limit = queue_limit
+        self.start_method = start_method
+        self._pool = None
+        self._pending = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.queue_limit
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Created lazily so importing the server does not spawn processes
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context(self.start_method)
+            )
+        return self._pool
+
+    def _admit(self):
+        if self._pending >= self.capacity:
+            logging.warning(f"Extraction pool saturated ({self._pending}/{self.capacity}), rejecting upload")
+            raise HTTPException(
+                status_code=503,
+                detail="The server is busy processing other documents. Please try again shortly.",
+                headers={"Retry-After": "10"}
+            )
+
+    async def _submit(self, func, *args):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_pool(), func, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a huge scan); start a fresh pool for the next upload
+            logging.error("Extraction worker crashed, recreating process pool")
+            self.shutdown()
+            raise HTTPException(status_code=503, detail="Document processing failed. Please try again.")
+
+    async def run(self, func, *args):
+        """Run `func(*args)` in the pool, applying backpressure when saturated"""
+        self._admit()
+        self._pending += 1
+        try:
+            return await self._submit(func, *args)
+        finally:
+            self._pending -= 1
+
+    async def _ocr_pdf(self, path: str, page_count: int, on_progress=None) -> str:
+        """OCR a scanned PDF window by window, at most `max_workers` windows in flight"""
+        logging.info(f"PDF has no text, running OCR on {page_count} pages...")
+        semaphore = asyncio.Semaphore(self.max_workers)
+        pages_done = 0
+
+        async def run_window(first_page, last_page):
+            nonlocal pages_done
+            async with semaphore:
+                pages = await self._submit(ocr_pdf_window, path, first_page, last_page)
+            pages_done += len(pages)
+            if on_progress:
+                result = on_progress(pages_done, page_count)
+                if inspect.isawaitable(result):
+                    await result
+            return pages
+
+        windows = await asyncio.gather(*[run_window(first, last) for first, last in page_windows(page_count)])
+        extracted_text = format_pages([page for window in windows for page in window])
+        logging.info(f"OCR extracted {len(extracted_text)} characters")
+        return extracted_text
+
+    async def extract(self, path: str, filename: str, on_progress=None) -> tuple:
+        """
+        Async counterpart of extract_text_from_file for the upload stored at `path`.
+        `on_progress(pages_done, page_count)` (sync or async) is called as OCR windows finish.
+        Returns: (extracted_text, page_count)
+        """
+        self._admit()
+        self._pending += 1
+        try:
+            file_ext = filename.lower().split('.')[-1]
+            if file_ext != 'pdf':
+                with span("extract.file", format=file_ext):
+                    return await self._submit(extract_text_from_file, path, filename)
+
+            with span("extract.pdf_text"):
+                extracted_text, page_count = await self._submit(extract_pdf_text, path)
+            if pdf_needs_ocr(extracted_text):
+                with span("extract.ocr", pages=page_count):
+                    extracted_text = await self._ocr_pdf(path, page_count, on_progress)
+            return extracted_text, page_count
+        except (HTTPException, ExtractionError):
+            raise
+        except Exception as e:
+            logging.error(f"Text extraction error for pdf: {str(e)}")
+            raise ExtractionError(f"Could not extract text from file: {str(e)}")
+        finally:
+            self._pending -= 1
+
+    def shutdown(self, wait: bool = False):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,446 @@
+"""
+Gateway for every call to the LLM provider (Groq's OpenAI-compatible API).
+
+All requests go through one pooled HTTP client and are shaped by a concurrency
+limit, token-bucket rate limits matched to the provider quota, retries with
+exponential backoff and jitter for 429 / 5xx responses, and a circuit breaker that
+fails fast while the provider is down.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+
+import httpx
+from cachetools import TTLCache
+
+from metrics import span, LLM_TOKENS, LLM_CACHE_REQUESTS
+from tokenizer import count_tokens
+
+LLM_PROVIDER = "groq"
+LLM_MODEL = "llama-3.3-70b-versatile"
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+
+# Responses worth retrying: rate limited, or the provider is having trouble
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# Rough completion size reserved against the tokens-per-minute quota
+COMPLETION_TOKEN_ESTIMATE = 500
+
+
+class LlmError(Exception):
+    """Non-success response from the LLM provider"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"LLM provider returned {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+class LlmUnavailable(Exception):
+    """Raised without contacting the provider while the circuit breaker is open"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM provider unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def prompt_fingerprint(model: str, system_message: str, prompt: str) -> str:
+    """Stable cache key for a single-turn completion"""
+    digest = hashlib.sha256()
+    for part in (model, system_message, prompt):
+        digest.update(part.encode('utf-8'))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def parse_retry_after(value: str):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class LlmResponseCache:
+    """
+    TTL + LRU-bounded cache of completions keyed by prompt fingerprint.
+    Identical requests that are already in flight share one upstream call.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 86400):
+        self._entries = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def contains(self, key: str) -> bool:
+        """True if get_or_call would be answered without a new upstream call"""
+        return key in self._entries or key in self._in_flight
+
+    async def get_or_call(self, key: str, call):
+        if key in self._entries:
+            self.hits += 1
+            return self._entries[key]
+        if key in self._in_flight:
+            self.hits += 1
+            return await asyncio.shield(self._in_flight[key])
+
+        self.misses += 1
+        future = asyncio.ensure_future(call())
+        self._in_flight[key] = future
+        try:
+            result = await asyncio.shield(future)
+        finally:
+            self._in_flight.pop(key, None)
+        self._entries[key] = result
+        return result
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0
+        }
+
+
+class TokenBucket:
+    """
+    Refills at `rate_per_minute` up to `capacity`. Waiters are served in arrival order.
+    Requests larger than the capacity are clamped so they can still proceed.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Take `amount` tokens, sleeping until they are available. Returns the seconds waited"""
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            waited = 0.0
+            if self._tokens < amount:
+                waited = (amount - self._tokens) / self.rate
+                await asyncio.sleep(waited)
+                self._refill()
+            self._tokens -= amount
+            return waited
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failed calls and rejects calls for
+    `reset_timeout` seconds; then lets a single probe through (half-open) and closes
+    again if it succeeds.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected"""
+        if self.state == self.OPEN:
+            return self.retry_after() > 0
+        return self.state == self.HALF_OPEN and self._probe_in_flight
+
+    def before_call(self):
+        if self.state == self.OPEN and self.retry_after() <= 0:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.is_open():
+            self.rejected += 1
+            raise LlmUnavailable(self.retry_after() or self.reset_timeout)
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = True
+
+    def release_probe(self):
+        """The half-open probe was abandoned (e.g. the client went away) without an outcome"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logging.info("LLM circuit breaker closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logging.warning(f"LLM circuit breaker opened after {self.failures} failures")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+
+class LlmScheduler:
+    """
+    Process-wide gate for LLM calls.
+    Bounds the number of in-flight requests to the provider, keeps within the
+    requests / tokens per minute quota, retries transient failures and applies a
+    per-attempt timeout, so a burst of uploads cannot open unbounded connections.
+    Single-turn completions can be served from an optional response cache.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        max_concurrency: int = 4,
+        timeout: float = 60.0,
+        cache: LlmResponseCache = None,
+        base_url: str = GROQ_BASE_URL,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_retries: int = 3,
+        backoff_base: float = 1.0,
+        backoff_max: float = 20.0,
+        breaker: CircuitBreaker = None
+    ):
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.cache = cache
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._http = None
+        self.retries = 0
+        self.throttled_seconds = 0.0
+
+    def _http_client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            )
+        return self._http
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def available(self) -> bool:
+        """False while the circuit breaker rejects calls"""
+        return not self.breaker.is_open()
+
+    def stats(self) -> dict:
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "rejected": self.breaker.rejected,
+            "retries": self.retries,
+            "throttled_seconds": round(self.throttled_seconds, 3)
+        }
+
+    async def _throttle(self, system_message: str, prompt: str):
+        if self._request_bucket:
+            self.throttled_seconds += await self._request_bucket.acquire(1)
+        if self._token_bucket:
+            tokens = count_tokens(system_message) + count_tokens(prompt) + COMPLETION_TOKEN_ESTIMATE
+            self.throttled_seconds += await self._token_bucket.acquire(tokens)
+
+    def _backoff(self, attempt: int, retry_after: float = None) -> float:
+        """Exponential backoff with full jitter, never shorter than the provider's Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    def _payload(self, system_message: str, prompt: str, stream: bool = False) -> dict:
+        payload = {
+            "model": LLM_MODEL,
+            "messages": [
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ]
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    async def _call(self, system_message: str, prompt: str, timeout: float) -> tuple:
+        self.breaker.before_call()
+        try:
+            return await self._attempt_call(system_message, prompt, timeout or self.timeout)
+        except asyncio.CancelledError:
+            self.breaker.release_probe()
+            raise
+
+    async def _attempt_call(self, system_message: str, prompt: str, timeout: float) -> tuple:
+        """(completion text, provider usage dict)"""
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            # Every HTTP attempt counts against the quota, retries of a 429 included
+            await self._throttle(system_message, prompt)
+            try:
+                async with self._semaphore:
+                    response = await asyncio.wait_for(
+                        self._http_client().post(
+                            "/chat/completions",
+                            json=self._payload(system_message, prompt),
+                            timeout=httpx.Timeout(timeout, connect=10.0)
+                        ),
+                        timeout
+                    )
+            except (asyncio.TimeoutError, httpx.TimeoutException):
+                logging.warning(f"LLM request timed out after {timeout}s")
+                self.breaker.record_failure()
+                raise asyncio.TimeoutError()
+            except httpx.TransportError as e:
+                error = LlmError(503, f"{type(e).__name__}: {str(e)}")
+            else:
+                if response.status_code == 200:
+                    self.breaker.record_success()
+                    body = response.json()
+                    return body["choices"][0]["message"]["content"], body.get("usage") or {}
+                error = LlmError(response.status_code, response.text[:500])
+                if response.status_code not in RETRYABLE_STATUS:
+                    # A rejected request, not a provider outage
+                    self.breaker.record_success()
+                    raise error
+                retry_after = parse_retry_after(response.headers.get("retry-after"))
+
+            if attempt == self.max_retries:
+                break
+            delay = self._backoff(attempt, retry_after)
+            logging.warning(f"LLM request failed ({error.status_code}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+        self.breaker.record_failure()
+        raise error
+
+    def _record_usage(self, operation: str, current_span, usage: dict, system_message: str, prompt: str, completion: str):
+        # Provider-reported usage when available, local estimates otherwise
+        prompt_tokens = usage.get("prompt_tokens") or count_tokens(system_message) + count_tokens(prompt)
+        completion_tokens = usage.get("completion_tokens") or count_tokens(completion)
+        LLM_TOKENS.inc(prompt_tokens, operation=operation, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, operation=operation, kind="completion")
+        current_span.set("llm.prompt_tokens", prompt_tokens)
+        current_span.set("llm.completion_tokens", completion_tokens)
+
+    async def send(self, system_message: str, prompt: str, timeout: float = None, use_cache: bool = False, operation: str = "completion") -> str:
+        """
+        Send a single prompt and return the completion text.
+        With use_cache=True, identical (model, system message, prompt) requests are answered from cache.
+        `operation` names the call in metrics and traces.
+        """
+        with span(f"llm.{operation}", **{"llm.model": LLM_MODEL}) as current_span:
+            if not use_cache or self.cache is None:
+                completion, usage = await self._call(system_message, prompt, timeout)
+                self._record_usage(operation, current_span, usage, system_message, prompt, completion)
+                return completion
+
+            key = prompt_fingerprint(f"{LLM_PROVIDER}/{LLM_MODEL}", system_message, prompt)
+            cached = self.cache.contains(key)
+            LLM_CACHE_REQUESTS.inc(operation=operation, result="hit" if cached else "miss")
+            current_span.set("llm.cache_hit", cached)
+            completion, usage = await self.cache.get_or_call(key, lambda: self._call(system_message, prompt, timeout))
+            if not cached:
+                self._record_usage(operation, current_span, usage, system_message, prompt, completion)
+            return completion
+
+    async def stream(self, system_message: str, prompt: str, timeout: float = None, operation: str = "stream"):
+        """
+        Yield completion text as it is generated.
+        Uses the provider's streaming endpoint; `timeout` bounds the wait for each
+        chunk rather than the whole generation. Failures are retried only until the
+        first token has been received.
+        """
+        self.breaker.before_call()
+        with span(f"llm.{operation}", **{"llm.model": LLM_MODEL}) as current_span:
+            tokens = []
+            try:
+                async for token in self._attempt_stream(system_message, prompt, timeout or self.timeout):
+                    tokens.append(token)
+                    yield token
+            except (asyncio.CancelledError, GeneratorExit):
+                self.breaker.release_probe()
+                raise
+            finally:
+                if tokens:
+                    self._record_usage(operation, current_span, {}, system_message, prompt, "".join(tokens))
+
+    async def _attempt_stream(self, system_message: str, prompt: str, timeout: float):
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            started = False
+            await self._throttle(system_message, prompt)
+            try:
+                async with self._semaphore:
+                    async with self._http_client().stream(
+                        "POST",
+                        "/chat/completions",
+                        json=self._payload(system_message, prompt, stream=True),
+                        timeout=httpx.Timeout(timeout, connect=10.0)
+                    ) as response:
+                        if response.status_code == 200:
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[len("data:"):].strip()
+                                if data == "[DONE]":
+                                    break
+                                chunk = json.loads(data)
+                                choices = chunk.get("choices") or [{}]
+                                token = (choices[0].get("delta") or {}).get("content")
+                                if token:
+                                    started = True
+                                    yield token
+                            self.breaker.record_success()
+                            return
+                        body = await response.aread()
+                        error = LlmError(response.status_code, body.decode("utf-8", errors="ignore")[:500])
+                        if response.status_code not in RETRYABLE_STATUS:
+                            self.breaker.record_success()
+                            raise error
+                        retry_after = parse_retry_after(response.headers.get("retry-after"))
+            except httpx.TransportError as e:
+                if started:
+                    self.breaker.record_failure()
+                    raise
+                error = LlmError(503, f"{type(e).__name__}: {str(e)}")
+
+            if attempt == self.max_retries:
+                break
+            delay = self._backoff(attempt, retry_after)
+            logging.warning(f"LLM stream failed ({error.status_code}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+        self.breaker.record_failure()
+        raise error
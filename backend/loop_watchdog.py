@@ -0,0 +1,130 @@
+"""
+Opt-in detector for code that blocks the event loop (LOOP_WATCHDOG=true).
+
+Every callback the loop runs is timed. Callbacks slower than the threshold are
+counted per route in /metrics and logged, together with the stack of the loop
+thread, which a watchdog thread samples while the loop is still stuck. A heartbeat
+task records the loop lag everything else experienced.
+
+Timing hooks into asyncio's Handle, so it covers the default asyncio loop only
+(not uvloop); the heartbeat lag metric works with either.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from asyncio import events
+
+from metrics import REGISTRY, request_scope, route_of
+
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "legalme_event_loop_lag_seconds", "How late the event loop heartbeat woke up",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+BLOCKED_SECONDS = REGISTRY.counter(
+    "legalme_event_loop_blocked_seconds_total", "Time spent in event loop callbacks slower than the threshold", ("route",)
+)
+SLOW_CALLBACKS = REGISTRY.counter(
+    "legalme_event_loop_slow_callbacks_total", "Event loop callbacks slower than the threshold", ("route",)
+)
+
+
+def _callback_route(handle) -> str:
+    # Tasks run their steps in the request's context, so child tasks count for it too
+    context = getattr(handle, "_context", None)
+    return route_of(context.get(request_scope) if context is not None else None)
+
+
+class LoopWatchdog:
+    """
+    `threshold` seconds: a callback running longer counts as blocking.
+    `interval` seconds: how often the heartbeat and the stack sampler run.
+    """
+
+    def __init__(self, threshold: float = 0.1, interval: float = 0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self._loop_thread = None
+        self._running = None  # (handle, started) of the callback the loop is in, if any
+        self._sampled = None
+        self._original_run = None
+        self._heartbeat_task = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._loop_thread = threading.get_ident()
+        self._patch()
+        self._heartbeat_task = loop.create_task(self._heartbeat())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logging.info(f"Event loop watchdog started (threshold {self.threshold * 1000:.0f} ms)")
+
+    async def stop(self):
+        self._stop.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+        if self._original_run is not None:
+            events.Handle._run = self._original_run
+            self._original_run = None
+
+    def _patch(self):
+        original_run = self._original_run = events.Handle._run
+        watchdog = self
+
+        def timed_run(handle):
+            if threading.get_ident() != watchdog._loop_thread:
+                # Loops in other threads (e.g. asyncio.run in a worker thread) are not watched
+                return original_run(handle)
+            running = (handle, time.perf_counter())
+            watchdog._running = running
+            try:
+                return original_run(handle)
+            finally:
+                watchdog._running = None
+                elapsed = time.perf_counter() - running[1]
+                if elapsed >= watchdog.threshold:
+                    watchdog._report(handle, elapsed, sampled=watchdog._sampled is running)
+
+        events.Handle._run = timed_run
+
+    def _report(self, handle, elapsed: float, sampled: bool):
+        route = _callback_route(handle)
+        SLOW_CALLBACKS.inc(route=route)
+        BLOCKED_SECONDS.inc(elapsed, route=route)
+        # The stack was already logged by the sampler while the loop was stuck
+        detail = "" if sampled else f" in {repr(handle)[:300]}"
+        logging.warning(f"Event loop blocked for {elapsed * 1000:.0f} ms (route {route}){detail}")
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - expected))
+
+    def _watch(self):
+        """Runs in its own thread: log the loop thread's stack once per blocking callback"""
+        while not self._stop.wait(self.interval):
+            running = self._running
+            if running is None or running is self._sampled:
+                continue
+            blocked = time.perf_counter() - running[1]
+            if blocked < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            self._sampled = running
+            stack = "".join(traceback.format_stack(frame))
+            logging.warning(
+                f"Event loop blocked for {blocked * 1000:.0f} ms so far (route {_callback_route(running[0])}), "
+                f"loop thread stack:\n{stack}"
+            )
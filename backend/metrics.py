@@ -0,0 +1,257 @@
+"""
+Latency and usage metrics, exposed in the Prometheus text format on /metrics.
+
+Pipeline stages and LLM calls are timed with `span(name)`, which records into the
+stage histogram and, when OTEL_EXPORTER_OTLP_ENDPOINT is configured and the
+OpenTelemetry SDK is installed, also emits a trace span. HTTP requests are timed
+per route by MetricsMiddleware.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> list:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def _samples(self) -> list:
+        lines = []
+        for key, series in self._series.items():
+            for bound, count in zip(self.buckets + (float("inf"),), series[:len(self.buckets)] + [series[-1]]):
+                le = 'le="%s"' % _format_value(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: tuple = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "legalme_http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "legalme_stage_duration_seconds", "Duration of pipeline stages and LLM calls", ("stage", "outcome")
+)
+LLM_TOKENS = REGISTRY.counter(
+    "legalme_llm_tokens_total", "Tokens sent to / received from the LLM provider", ("operation", "kind")
+)
+LLM_CACHE_REQUESTS = REGISTRY.counter(
+    "legalme_llm_cache_requests_total", "LLM completions requested through the response cache", ("operation", "result")
+)
+
+# ASGI scope of the HTTP request being handled; inherited by tasks the request spawns
+request_scope = ContextVar("request_scope", default=None)
+
+
+def route_of(scope) -> str:
+    """Route template of a request scope, e.g. /api/chat/{session_id}/messages"""
+    if scope is None:
+        return "none"
+    # Route templates, not raw paths, to keep label cardinality bounded
+    return getattr(scope.get("route"), "path", "unmatched")
+
+
+# Set when tracing is configured; spans are only timed into STAGE_SECONDS otherwise
+_tracer = None
+
+
+def configure_tracing(endpoint: str, service_name: str = "legalme-backend"):
+    """Export spans over OTLP/HTTP to `endpoint` (e.g. a local collector), if the SDK is installed"""
+    global _tracer
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError as e:
+        logging.warning(f"OpenTelemetry SDK not installed, tracing disabled: {str(e)}")
+        return
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=f"{endpoint.rstrip('/')}/v1/traces")))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("legalme")
+    logging.info(f"Exporting traces to {endpoint}")
+
+
+class Span:
+    """Attributes collected while a span is open, forwarded to the trace span if any"""
+
+    def __init__(self, otel_span=None):
+        self.attributes = {}
+        self._otel_span = otel_span
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+        if self._otel_span is not None:
+            self._otel_span.set_attribute(key, value)
+
+
+@contextmanager
+def _otel_span(name: str):
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(name) as otel_span:
+        yield otel_span
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time the enclosed block as stage `name`; works in sync and async code"""
+    started = time.perf_counter()
+    outcome = "ok"
+    with _otel_span(name) as otel_span:
+        current = Span(otel_span)
+        for key, value in attributes.items():
+            current.set(key, value)
+        try:
+            yield current
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage=name, outcome=outcome)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each HTTP request until its response has been fully sent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_scope.reset(token)
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope["method"], route=route_of(scope), status=status)
+
+
+async def timed(name: str, awaitable, **attributes):
+    """Await `awaitable` inside span(name); for stages run concurrently with asyncio.gather"""
+    with span(name, **attributes):
+        return await awaitable
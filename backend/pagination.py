@@ -0,0 +1,74 @@
+"""
+Keyset pagination helpers.
+
+A cursor is an opaque, URL-safe encoding of the (timestamp, id) pair of the last item
+on a page. Queries sort on both fields so items with equal timestamps are neither
+skipped nor repeated between pages.
+"""
+import base64
+import json
+
+from fastapi import HTTPException
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(timestamp: str, item_id: str) -> str:
+    raw = json.dumps([timestamp, item_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Returns (timestamp, id); raises 400 for malformed cursors"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, item_id = json.loads(raw)
+        if not isinstance(timestamp, str) or not isinstance(item_id, str):
+            raise ValueError("cursor fields must be strings")
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {str(e)}")
+    return timestamp, item_id
+
+
+def keyset_filter(cursor: str, direction: str, time_field: str = "timestamp", id_field: str = "id") -> dict:
+    """Filter for items strictly before or after `cursor` in (time_field, id_field) order"""
+    timestamp, item_id = decode_cursor(cursor)
+    op = "$lt" if direction == "before" else "$gt"
+    return {"$or": [
+        {time_field: {op: timestamp}},
+        {time_field: timestamp, id_field: {op: item_id}}
+    ]}
+
+
+def clamp_limit(limit: int, maximum: int) -> int:
+    return max(1, min(limit, maximum))
+
+
+async def keyset_page(collection, query: dict, limit: int, before: str = None, after: str = None) -> tuple:
+    """
+    One page of a chronological collection, returned oldest first.
+
+    Without a cursor this is the most recent `limit` items. With `before` it is the
+    items just older than the cursor, with `after` the items just newer. Returns
+    (items, next_cursor), where next_cursor continues in the same direction
+    (older for the default and `before`, newer for `after`) or is None at the end.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Pass either 'before' or 'after', not both")
+
+    if after:
+        query = {"$and": [query, keyset_filter(after, "after")]}
+        sort = [("timestamp", 1), ("id", 1)]
+    else:
+        if before:
+            query = {"$and": [query, keyset_filter(before, "before")]}
+        sort = [("timestamp", -1), ("id", -1)]
+
+    items = await collection.find(query, {"_id": 0}).sort(sort).limit(limit + 1).to_list(limit + 1)
+    has_more = len(items) > limit
+    items = items[:limit]
+    next_cursor = encode_cursor(items[-1]["timestamp"], items[-1]["id"]) if has_more else None
+
+    if not after:
+        items.reverse()
+    return items, next_cursor
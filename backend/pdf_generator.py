@@ -7,6 +7,9 @@ from reportlab.lib import colors
 from datetime import datetime
 import io
 
+# Bump whenever the report layout changes, so cached PDFs are re-rendered
+REPORT_TEMPLATE_VERSION = "1"
+
 def generate_contract_pdf(analysis_data):
     """
     Generate a professional PDF report for contract analysis
@@ -166,6 +169,12 @@ def generate_contract_pdf(analysis_data):
     buffer.seek(0)
     return buffer
 
+def render_contract_pdf(analysis_data) -> bytes:
+    """
+    PDF report as bytes (picklable, for rendering in a worker process)
+    """
+    return generate_contract_pdf(analysis_data).getvalue()
+
 def get_risk_emoji(risk_level):
     if risk_level == 'scam':
         return '🚨'
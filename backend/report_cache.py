@@ -0,0 +1,89 @@
+"""
+Disk cache for rendered analysis PDFs.
+
+Analyses never change once saved, so a report is fully identified by the contract id
+and REPORT_TEMPLATE_VERSION; it is rendered once and served from disk afterwards.
+"""
+import asyncio
+import os
+import tempfile
+from pathlib import Path
+
+from extraction_cache import evict_lru
+from pdf_generator import REPORT_TEMPLATE_VERSION
+
+
+def report_etag(contract_id: str) -> str:
+    # Weak: re-rendering yields an equivalent report, not identical bytes (timestamps)
+    return f'W/"{contract_id}-{REPORT_TEMPLATE_VERSION}"'
+
+
+def _opaque_tag(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses weak comparison
+    return "*" in candidates or any(_opaque_tag(tag) == _opaque_tag(etag) for tag in candidates)
+
+
+class ReportCache:
+    """Rendered PDFs as files, evicted least recently used once `max_bytes` is exceeded"""
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, contract_id: str) -> Path:
+        return self.directory / f"{contract_id}_v{REPORT_TEMPLATE_VERSION}.pdf"
+
+    def _read(self, contract_id: str):
+        path = self._path(contract_id)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        # Touch so eviction sees this report as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by a concurrent write in the meantime
+            return None
+        return data
+
+    def _write(self, contract_id: str, data: bytes):
+        path = self._path(contract_id)
+        # A temp file per write: concurrent downloads of one report may render it at the same time
+        with tempfile.NamedTemporaryFile(dir=self.directory, prefix=f"{path.stem}.", suffix=".tmp", delete=False) as f:
+            f.write(data)
+        try:
+            os.replace(f.name, path)
+        except OSError:
+            Path(f.name).unlink(missing_ok=True)
+            raise
+        evict_lru(self.directory, "*.pdf", self.max_bytes)
+
+    async def get(self, contract_id: str):
+        data = await asyncio.to_thread(self._read, contract_id)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    async def set(self, contract_id: str, data: bytes):
+        await asyncio.to_thread(self._write, contract_id, data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0
+        }
@@ -0,0 +1,134 @@
+"""
+BM25 passage index over a contract's text, used to ground contract chat answers.
+
+The index is built once at analysis time from the document's passages and stored
+as a plain dict (compressed, see text_store.ContractIndexStore), so each chat turn
+only scores the question against precomputed term frequencies. Passages are kept
+as character offsets into the document; `attach_text` adds their text on load.
+"""
+import math
+import re
+from collections import Counter
+
+from tokenizer import count_tokens
+
+RETRIEVAL_INDEX_VERSION = 3
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have i if in is it its my of on or that the this to was
+were will with what which who can do does how me you your not no
+der die das den dem des ein eine einer eines einem einen und oder ist sind zu im in am an auf
+aus bei mit nach von vom zum zur für über unter als auch es er sie wir ich du nicht kein keine
+wie was wer wann wo kann darf muss mein meine ihr ihre sich so nur noch
+""".split())
+
+
+def terms(text: str) -> list:
+    """Lowercased word terms, without stopwords and single characters"""
+    return [t for t in _TERM_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def build_index(passages: list) -> dict:
+    """Term statistics for `passages` (chunker.Chunk objects, in document order)"""
+    entries = []
+    doc_freq = Counter()
+    for passage in passages:
+        term_counts = Counter(terms(passage.text))
+        doc_freq.update(term_counts.keys())
+        entries.append({
+            "start": passage.start,
+            "end": passage.end,
+            "tokens": passage.tokens or count_tokens(passage.text),
+            "length": sum(term_counts.values()),
+            "terms": dict(term_counts),
+            "page_start": passage.page_start,
+            "page_end": passage.page_end
+        })
+    total_length = sum(entry["length"] for entry in entries)
+    return {
+        "version": RETRIEVAL_INDEX_VERSION,
+        "passages": entries,
+        "doc_freq": dict(doc_freq),
+        "avg_length": total_length / len(entries) if entries else 0.0
+    }
+
+
+def attach_text(index: dict, document: str) -> dict:
+    """Copy of `index` whose passages carry their text, sliced from `document`"""
+    passages = [{**passage, "text": document[passage["start"]:passage["end"]].strip()} for passage in index["passages"]]
+    return {**index, "passages": passages}
+
+
+def search(index: dict, query: str, top_k: int = 5) -> list:
+    """BM25-ranked (score, passage position) pairs for `query`, best first"""
+    passages = index["passages"]
+    query_terms = set(terms(query))
+    if not passages or not query_terms:
+        return []
+
+    n = len(passages)
+    avg_length = index["avg_length"] or 1.0
+    idf = {}
+    for term in query_terms:
+        df = index["doc_freq"].get(term)
+        if df:
+            idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    scored = []
+    for position, passage in enumerate(passages):
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * passage["length"] / avg_length)
+        score = 0.0
+        for term, weight in idf.items():
+            tf = passage["terms"].get(term)
+            if tf:
+                score += weight * tf * (BM25_K1 + 1) / (tf + norm)
+        if score > 0:
+            scored.append((score, position))
+
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return scored[:top_k]
+
+
+def select_passages(index: dict, query: str, token_budget: int = 1500, top_k: int = 5) -> list:
+    """
+    Best matching passages for `query` that fit in `token_budget` tokens, returned in
+    document order as (position, text). `index` must have its text attached. Falls back to the opening passages when
+    nothing in the document matches the question.
+    """
+    ranked = [position for _, position in search(index, query, top_k)]
+    if not ranked:
+        ranked = list(range(min(top_k, len(index["passages"]))))
+
+    selected = []
+    used = 0
+    for position in ranked:
+        passage = index["passages"][position]
+        if used + passage["tokens"] > token_budget:
+            continue
+        selected.append(position)
+        used += passage["tokens"]
+
+    if not selected and ranked:
+        # Budget smaller than a single passage: keep a trimmed version of the best one
+        position = ranked[0]
+        text = index["passages"][position]["text"]
+        return [(position, text[:token_budget * 4])]
+
+    return [(position, index["passages"][position]["text"]) for position in sorted(selected)]
+
+
+def passage_label(index: dict, position: int) -> str:
+    """e.g. 'Passage 3, pages 4-5' for citing a passage in prompts"""
+    passage = index["passages"][position]
+    label = f"Passage {position + 1}"
+    page_start, page_end = passage.get("page_start"), passage.get("page_end")
+    if page_start is None:
+        return label
+    if page_start == page_end:
+        return f"{label}, page {page_start}"
+    return f"{label}, pages {page_start}-{page_end}"
@@ -0,0 +1,219 @@
+"""
+Precompiled rule engine for the regex clause / scam databases.
+
+All patterns are compiled once at startup. A single combined keyword scan over the
+document decides which rules can possibly match, so only those regexes run. Rules
+whose pattern has no required literal prefix are always evaluated.
+
+Rules run on a whitespace-normalized copy of the document (every run of spaces and
+line breaks collapsed to one space), so clauses wrapped across lines still match;
+match offsets are mapped back to the original text.
+"""
+import bisect
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+_REGEX_META = set(".^$*+?{}[]\\|()")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+@dataclass(frozen=True)
+class Rule:
+    id: str
+    kind: str  # "clause" | "scam"
+    pattern: re.Pattern
+    keywords: Optional[tuple]  # literal prefilter; None = always evaluate
+    data: dict  # the original database entry
+    law: Optional[dict] = None
+
+
+@dataclass(frozen=True)
+class RuleMatch:
+    rule: Rule
+    start: int
+    end: int
+    text: str
+
+    def snippet(self, document: str, context: int = 50) -> str:
+        return " ".join(document[max(0, self.start - context):min(len(document), self.end + context)].split())
+
+
+class NormalizedText:
+    """`text` with whitespace runs collapsed to single spaces, plus the offset mapping back"""
+
+    def __init__(self, text: str):
+        parts = []
+        self._starts = [0]  # normalized offsets where the shift to the original grows
+        self._shifts = [0]
+        removed = 0
+        length = 0
+        last = 0
+        for match in _WHITESPACE.finditer(text):
+            parts.append(text[last:match.start()])
+            parts.append(" ")
+            length += match.start() - last + 1
+            if match.end() - match.start() > 1:
+                removed += match.end() - match.start() - 1
+                self._starts.append(length)
+                self._shifts.append(removed)
+            last = match.end()
+        parts.append(text[last:])
+        self.text = "".join(parts)
+
+    def original_offset(self, offset: int) -> int:
+        return offset + self._shifts[bisect.bisect_right(self._starts, offset) - 1]
+
+
+def leading_literals(pattern: str) -> Optional[tuple]:
+    """
+    Return the literal alternatives of a leading `(a|b|c)` group (optionally preceded
+    by a word boundary `\\b`) if every match of `pattern` must start with one of them,
+    else None.
+    """
+    if pattern.startswith("\\b"):
+        pattern = pattern[2:]
+    if not pattern.startswith("("):
+        return None
+
+    depth = 0
+    close = None
+    for i, ch in enumerate(pattern):
+        if ch == "\\":
+            return None
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                close = i
+                break
+    if close is None:
+        return None
+
+    alternatives = pattern[1:close].split("|")
+    if any(not alt or set(alt) & _REGEX_META for alt in alternatives):
+        return None
+
+    # An optional group, or a top-level alternation after it, means the literals are not required
+    rest = pattern[close + 1:]
+    if rest[:1] in ("?", "*", "{"):
+        return None
+    depth = 0
+    in_class = False
+    escaped = False
+    for ch in rest:
+        if escaped:
+            escaped = False
+            continue
+        if ch == "\\":
+            escaped = True
+        elif in_class:
+            in_class = ch != "]"
+        elif ch == "[":
+            in_class = True
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            return None
+
+    return tuple(alt.lower() for alt in alternatives)
+
+
+class RuleEngine:
+    """Compiled clause + scam rules with a shared keyword prefilter"""
+
+    def __init__(self, clause_database: list, scam_patterns: list, law_database: list):
+        self.laws = {law["id"]: law for law in law_database}
+        self.rules = []
+        for i, entry in enumerate(clause_database):
+            self.rules.append(self._compile(f"clause_{i}", "clause", entry))
+        for i, entry in enumerate(scam_patterns):
+            self.rules.append(self._compile(f"scam_{i}", "scam", entry))
+
+        self._always = [rule for rule in self.rules if rule.keywords is None]
+        keyword_rules = {}
+        for rule in self.rules:
+            for keyword in rule.keywords or ():
+                keyword_rules.setdefault(keyword, []).append(rule)
+
+        # The prefilter reports only the longest keyword at each position, so a hit
+        # on a keyword also triggers the rules of every keyword that is its prefix.
+        self._triggers = {
+            keyword: [rule for other, rules in keyword_rules.items() if keyword.startswith(other) for rule in rules]
+            for keyword in keyword_rules
+        }
+        keywords = sorted(keyword_rules, key=len, reverse=True)
+        self._prefilter = re.compile(
+            "(?=(" + "|".join(re.escape(k) for k in keywords) + "))", re.IGNORECASE
+        ) if keywords else None
+
+    def _compile(self, rule_id: str, kind: str, entry: dict) -> Rule:
+        keywords = entry.get("keywords")
+        return Rule(
+            id=rule_id,
+            kind=kind,
+            pattern=re.compile(entry["pattern"], re.IGNORECASE),
+            keywords=tuple(k.lower() for k in keywords) if keywords else leading_literals(entry["pattern"]),
+            data=entry,
+            law=self.laws.get(entry.get("law_ref"))
+        )
+
+    def candidate_rules(self, text: str) -> list:
+        """Rules that can possibly match `text`, in database order"""
+        candidates = {rule.id: rule for rule in self._always}
+        if self._prefilter is not None:
+            for match in self._prefilter.finditer(text):
+                for rule in self._triggers.get(match.group(1).lower(), ()):
+                    candidates[rule.id] = rule
+        return [rule for rule in self.rules if rule.id in candidates]
+
+    def scan(self, text: str, kind: str = None) -> list:
+        """
+        Run all (or one kind of) rules over `text`. Returns RuleMatch objects ordered
+        by offset; offsets refer to `text`, the matched text is whitespace-normalized.
+        """
+        normalized = NormalizedText(text)
+        matches = []
+        for rule in self.candidate_rules(normalized.text):
+            if kind and rule.kind != kind:
+                continue
+            for match in rule.pattern.finditer(normalized.text):
+                matches.append(RuleMatch(
+                    rule=rule,
+                    start=normalized.original_offset(match.start()),
+                    end=normalized.original_offset(match.end()),
+                    text=match.group(0)
+                ))
+        matches.sort(key=lambda m: (m.start, m.end))
+        return matches
+
+
+@dataclass
+class MatchGroup:
+    """Overlapping rule hits collapsed into one span of the document"""
+    start: int
+    end: int
+    matches: list
+
+
+def group_overlapping(matches: list, document_length: int, context: int = 50, max_span: int = 600) -> list:
+    """
+    Merge matches whose snippet windows (match +/- `context` chars) overlap.
+    `matches` must be sorted by start offset. Groups stop growing at `max_span`
+    chars so dense documents do not collapse into one giant clause.
+    """
+    groups = []
+    for match in matches:
+        start = max(0, match.start - context)
+        end = min(document_length, match.end + context)
+        current = groups[-1] if groups else None
+        if current and start <= current.end and max(end, current.end) - current.start <= max_span:
+            current.end = max(current.end, end)
+            current.matches.append(match)
+        else:
+            groups.append(MatchGroup(start=start, end=end, matches=[match]))
+    return groups
@@ -1,5 +1,5 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -9,20 +9,31 @@ from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional
 import uuid
+import asyncio
+import hashlib
+import json
 from datetime import datetime, timezone
-from emergentintegrations.llm.chat import LlmChat, UserMessage
-from PyPDF2 import PdfReader
-import io
-import re
-from pdf_generator import generate_contract_pdf
-from docx import Document
-import pytesseract
-from PIL import Image
-from pdf2image import convert_from_bytes
-from pptx import Presentation
-from openpyxl import load_workbook
-from odf import text as odf_text, teletype
-from odf.opendocument import load as odf_load
+from llm_client import LlmScheduler, LlmResponseCache, CircuitBreaker, LlmError, LlmUnavailable
+from pdf_generator import render_contract_pdf
+from text_extractor import ExtractionError
+from rule_engine import RuleEngine, group_overlapping
+from extraction_pool import ExtractionExecutor
+from extraction_cache import create_extraction_cache, extraction_cache_key
+from uploads import store_upload, check_content_length, StoredUpload
+from analysis_jobs import AnalysisJobQueue
+from retrieval import build_index, attach_text, select_passages, passage_label, RETRIEVAL_INDEX_VERSION
+from chunker import iter_chunks, chunk_size_for, PAGE_MARKER_TEXT
+from tokenizer import count_tokens
+from cachetools import LRUCache
+from db_indexes import ensure_indexes, audit_query_shapes
+from chat_sessions import ChatSessionStore
+from pagination import NEXT_CURSOR_HEADER, clamp_limit, keyset_page
+from text_store import ContractTextStore, ContractIndexStore
+from report_cache import ReportCache, report_etag, etag_matches
+from session_memory import SessionMemory
+from metrics import REGISTRY, CONTENT_TYPE, MetricsMiddleware, configure_tracing, span, timed
+from loop_watchdog import LoopWatchdog
+from prompts import build_prompt_registry, RISK_SYSTEM_MESSAGE, CHUNK_SYSTEM_MESSAGE, MERGE_SYSTEM_MESSAGE, REDUCE_SYSTEM_MESSAGE
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -41,6 +52,85 @@ if not groq_api_key:
 client = AsyncIOMotorClient(mongodb_uri)
 db = client[db_name]
 
+# Shared LLM gateway - pooled connections, rate limits, retries and circuit breaker for all Groq calls
+llm = LlmScheduler(
+    groq_api_key,
+    max_concurrency=int(os.environ.get('LLM_MAX_CONCURRENCY', '4')),
+    timeout=float(os.environ.get('LLM_TIMEOUT_SECONDS', '60')),
+    base_url=os.environ.get('GROQ_BASE_URL', 'https://api.groq.com/openai/v1'),
+    requests_per_minute=float(os.environ.get('LLM_RATE_LIMIT_RPM', '30')),
+    tokens_per_minute=float(os.environ.get('LLM_RATE_LIMIT_TPM', '12000')),
+    max_retries=int(os.environ.get('LLM_MAX_RETRIES', '3')),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.environ.get('LLM_BREAKER_FAILURES', '5')),
+        reset_timeout=float(os.environ.get('LLM_BREAKER_RESET_SECONDS', '30'))
+    ),
+    cache=LlmResponseCache(
+        max_entries=int(os.environ.get('LLM_CACHE_MAX_ENTRIES', '1000')),
+        ttl=float(os.environ.get('LLM_CACHE_TTL_SECONDS', '86400'))
+    ) if os.environ.get('LLM_CACHE_ENABLED', 'true').lower() == 'true' else None
+)
+
+# Process pool for text extraction / OCR - keeps blocking parsers off the event loop
+extraction_executor = ExtractionExecutor(
+    max_workers=int(os.environ.get('EXTRACTION_WORKERS', '2')),
+    queue_limit=int(os.environ.get('EXTRACTION_QUEUE_LIMIT', '8'))
+)
+
+# Extracted text cache keyed by upload hash (mongo | disk | off)
+extraction_cache = create_extraction_cache(
+    os.environ.get('EXTRACTION_CACHE', 'mongo'),
+    db=db,
+    directory=os.environ.get('EXTRACTION_CACHE_DIR', str(ROOT_DIR / '.cache' / 'extraction')),
+    max_bytes=int(os.environ.get('EXTRACTION_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+)
+
+# Rendered analysis PDFs, keyed by contract id + report template version
+report_cache = ReportCache(
+    os.environ.get('REPORT_CACHE_DIR', str(ROOT_DIR / '.cache' / 'reports')),
+    max_bytes=int(os.environ.get('REPORT_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+)
+
+# Uploads are streamed to disk and size-limited while reading
+UPLOAD_DIR = os.environ.get('UPLOAD_DIR', str(ROOT_DIR / '.cache' / 'uploads'))
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', str(50 * 1024 * 1024)))
+
+# Section analysis: chunks grow from ANALYSIS_CHUNK_TOKENS up to ANALYSIS_MAX_CHUNK_TOKENS so
+# that the whole document fits in about ANALYSIS_MAX_CHUNKS sections; section findings are then
+# combined until they fit MERGE_TOKEN_BUDGET tokens for the final summary
+ANALYSIS_CHUNK_TOKENS = int(os.environ.get('ANALYSIS_CHUNK_TOKENS', '1500'))
+ANALYSIS_MAX_CHUNK_TOKENS = int(os.environ.get('ANALYSIS_MAX_CHUNK_TOKENS', '6000'))
+ANALYSIS_MAX_CHUNKS = int(os.environ.get('ANALYSIS_MAX_CHUNKS', '16'))
+ANALYSIS_CHUNK_OVERLAP_TOKENS = int(os.environ.get('ANALYSIS_CHUNK_OVERLAP_TOKENS', '100'))
+MERGE_TOKEN_BUDGET = int(os.environ.get('MERGE_TOKEN_BUDGET', '3000'))
+REDUCE_GROUP_SIZE = 4
+
+# Contract chat retrieval: passage size, passages per turn and their token budget
+RETRIEVAL_CHUNK_TOKENS = int(os.environ.get('RETRIEVAL_CHUNK_TOKENS', '300'))
+RETRIEVAL_TOP_K = int(os.environ.get('RETRIEVAL_TOP_K', '5'))
+RETRIEVAL_TOKEN_BUDGET = int(os.environ.get('RETRIEVAL_TOKEN_BUDGET', '1500'))
+
+# Per-contract chat context (analysis header + passage index); analyses never change once saved
+contract_context_cache = LRUCache(maxsize=int(os.environ.get('CONTRACT_CONTEXT_CACHE_SIZE', '128')))
+
+# Sidebar summaries of chat sessions, maintained whenever messages are written
+chat_sessions = ChatSessionStore(db.chat_sessions)
+
+# Extracted document text lives compressed in contract_texts, not in contract_analyses
+contract_texts = ContractTextStore(db.contract_texts)
+
+# Passage indexes for contract chat (offsets + term statistics), compressed the same way
+contract_indexes = ContractIndexStore(db.contract_index_segments)
+
+# Rolling summary + recent turns used as chat history in prompts
+session_memory = SessionMemory(
+    db.session_memory,
+    db.chat_messages,
+    llm,
+    recent_turns=int(os.environ.get('CHAT_MEMORY_RECENT_TURNS', '6')),
+    summary_batch=int(os.environ.get('CHAT_MEMORY_SUMMARY_BATCH', '4'))
+)
+
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
@@ -84,55 +174,55 @@ LAW_DATABASE = [
     }
 ]
 
-# Scam Detection Patterns
+# Scam Detection Patterns (word-bounded, so e.g. "Mietpreis" or "Pinnwand" do not match)
 SCAM_PATTERNS = [
     {
-        "pattern": r"(pay|zahlen|send|überweisen|transfer).{0,100}(advance|voraus|upfront|sofort|immediately|western union|gift card|bitcoin|crypto)",
+        "pattern": r"\b(pay|zahlen|send|überweisen|transfer)\b.{0,100}\b(advance|voraus|upfront|sofort|immediately|western union|gift card|bitcoin|crypto)\b",
         "indicator": "Advance payment request",
         "severity": "high"
     },
     {
-        "pattern": r"(lottery|gewinn|prize|preis|inheritance|erbe|million|jackpot).{0,100}(won|gewonnen|claim|anspruch)",
+        "pattern": r"\b(lottery|gewinn|prize|preis|inheritance|erbe|million|jackpot)\b.{0,100}\b(won|gewonnen|claim|anspruch)\b",
         "indicator": "Lottery/prize scam",
         "severity": "high"
     },
     {
-        "pattern": r"(urgent|dringend|immediately|sofort|act now|limited time|befristet).{0,100}(action|handeln|respond|antworten|expire|ablaufen)",
+        "pattern": r"\b(urgent|dringend|immediately|sofort|act now|limited time|befristet)\b.{0,100}\b(action|handeln|respond|antworten|expire|ablaufen)\b",
         "indicator": "Urgency pressure tactic",
         "severity": "medium"
     },
     {
-        "pattern": r"(bank account|bankkonto|credit card|kreditkarte|password|passwort|pin|social security|personal information|ssn)",
+        "pattern": r"\b(bank account|bankkonto|credit card|kreditkarte|password|passwort|pin|social security|personal information|ssn)\b",
         "indicator": "Requests sensitive personal information",
         "severity": "high"
     },
     {
-        "pattern": r"(nigerian prince|prince|princess|diplomat|government official|minister).{0,100}(money|geld|transfer|fund)",
+        "pattern": r"\b(nigerian prince|prince|princess|diplomat|government official|minister)\b.{0,100}\b(money|geld|transfer|fund)\b",
         "indicator": "Nigerian prince/419 scam pattern",
         "severity": "high"
     },
     {
-        "pattern": r"(work from home|heimarbeit|make money fast|schnell geld|guaranteed income|garantiertes einkommen).{0,100}(no experience|keine erfahrung|easy|einfach)",
+        "pattern": r"\b(work from home|heimarbeit|make money fast|schnell geld|guaranteed income|garantiertes einkommen)\b.{0,100}\b(no experience|keine erfahrung|easy|einfach)\b",
         "indicator": "Work-from-home scam",
         "severity": "medium"
     },
     {
-        "pattern": r"(IRS|tax authority|finanzamt|legal action|rechtliche schritte|arrest|warrant|haftbefehl).{0,100}(unless|außer|payment|zahlung|immediately|sofort)",
+        "pattern": r"\b(IRS|tax authority|finanzamt|legal action|rechtliche schritte|arrest|warrant|haftbefehl)\b.{0,100}\b(unless|außer|payment|zahlung|immediately|sofort)\b",
         "indicator": "Government impersonation scam",
         "severity": "high"
     },
     {
-        "pattern": r"(click here|klicken sie hier|verify account|konto verifizieren|suspended|gesperrt|update information)",
+        "pattern": r"\b(click here|klicken sie hier|verify account|konto verifizieren|suspended|gesperrt|update information)\b",
         "indicator": "Phishing attempt",
         "severity": "high"
     },
     {
-        "pattern": r"(refund|rückerstattung|overpayment|überzahlung).{0,100}(send back|zurücksenden|return|zurückgeben|difference|differenz)",
+        "pattern": r"\b(refund|rückerstattung|overpayment|überzahlung)\b.{0,100}\b(send back|zurücksenden|return|zurückgeben|difference|differenz)\b",
         "indicator": "Overpayment scam",
         "severity": "high"
     },
     {
-        "pattern": r"(romance|dating|love|liebe).{0,100}(money|geld|help|hilfe|emergency|notfall|hospital|krankenhaus)",
+        "pattern": r"\b(romance|dating|love|liebe)\b.{0,100}\b(money|geld|help|hilfe|emergency|notfall|hospital|krankenhaus)\b",
         "indicator": "Romance scam",
         "severity": "high"
     }
@@ -190,6 +280,12 @@ CLAUSE_DATABASE = [
     }
 ]
 
+# All clause and scam patterns, compiled once at startup
+rule_engine = RuleEngine(CLAUSE_DATABASE, SCAM_PATTERNS, LAW_DATABASE)
+
+# Prompt templates with the static law / link sections rendered once
+prompt_registry = build_prompt_registry(LAW_DATABASE)
+
 # Comprehensive Trusted Resources Database
 TRUSTED_LINKS_DATABASE = {
     "rental": {
@@ -327,6 +423,13 @@ class ContractAnalysis(BaseModel):
     recommendations: str
     relevant_laws: List[str]
     key_excerpts: List[str]
+    # Incremental re-analysis: per-section fingerprints and reusable LLM analyses
+    chunk_fingerprints: List[str] = []
+    chunk_analyses: List[dict] = []
+    changed_sections: List[int] = []
+    sections: List[dict] = []  # offsets, token counts and page ranges of the analyzed sections
+    previous_analysis_id: Optional[str] = None
+    degraded: bool = False  # True when the AI was unavailable and only pattern matching ran
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 @api_router.get("/")
@@ -346,712 +449,818 @@ async def get_topics():
         {"id": "tax", "name": "Tax Law", "icon": "calculator"}
     ]
 
+async def build_chat_system_message(session_id: str) -> str:
+    """System prompt for the general legal chat, including this session's memory"""
+    # Summary of older turns plus the most recent turns verbatim
+    summary, recent_turns = await session_memory.context(session_id)
+    conversation_context = ""
+    if summary or recent_turns:
+        conversation_context = "\n\n" + session_memory.render(summary, recent_turns) + "\n"
+    
+    system_message = prompt_registry.render("chat_system", conversation_context=conversation_context, session_id=session_id)
+    
+    return system_message
+
+async def save_chat_message(session_id: str, user_message: str, ai_response: str) -> ChatMessage:
+    chat_doc = ChatMessage(
+        session_id=session_id,
+        user_message=user_message,
+        ai_response=ai_response
+    )
+    doc = chat_doc.model_dump()
+    doc['timestamp'] = doc['timestamp'].isoformat()
+    await db.chat_messages.insert_one(doc)
+    await chat_sessions.record_message(session_id, user_message, doc['timestamp'])
+    session_memory.schedule_refresh(session_id)
+    return chat_doc
+
+def llm_failure(e: Exception) -> HTTPException:
+    """HTTP error for a reply the LLM gateway could not produce"""
+    if isinstance(e, LlmUnavailable):
+        return HTTPException(
+            status_code=503,
+            detail="AI service is temporarily unavailable. Please try again shortly.",
+            headers={"Retry-After": str(int(e.retry_after) + 1)}
+        )
+    if e.status_code == 429:
+        return HTTPException(status_code=503, detail="AI service is busy. Please try again shortly.")
+    return HTTPException(status_code=502, detail="AI service returned an error. Please try again.")
+
 @api_router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     try:
-        # Load conversation history for this session
-        conversation_history = await db.chat_messages.find(
-            {"session_id": request.session_id},
-            {"_id": 0}
-        ).sort("timestamp", 1).to_list(100)
-        
-        # Build conversation context
-        conversation_context = ""
-        if conversation_history:
-            conversation_context = "\n\nCONVERSATION HISTORY (for context):\n"
-            for msg in conversation_history[-10:]:  # Last 10 messages for context
-                conversation_context += f"User: {msg['user_message']}\n"
-                conversation_context += f"Assistant: {msg['ai_response'][:200]}...\n\n"
-        
-        # Create system message with law database context and trusted links
-        law_context = "\n".join([f"- {law['title']}: {law['description']} (Link: {law['url']})" for law in LAW_DATABASE])
-        
-        # Create trusted links context for AI
-        links_context = """
-TRUSTED LINKS BY CATEGORY (Always use these for Next Steps):
-
-RENTAL:
-- Authorities: Mieterschutzbund (https://www.mieterschutzbund.de), Berlin Tenant Advisory (https://www.berlin.de/sen/stadtentwicklung/wohnen/mieterschutz/)
-- Alternatives: ImmobilienScout24 (https://www.immobilienscout24.de), Rental templates (https://www.mietrecht.de/mustervertrag/)
-- Report: Verbraucherzentrale (https://www.verbraucherzentrale.de/beschwerde)
-
-EMPLOYMENT:
-- Authorities: Bundesagentur für Arbeit (https://www.arbeitsagentur.de), DGB Union (https://www.dgb.de)
-- Alternatives: Employment contract templates (https://www.arbeitsvertrag.org), Job search (https://www.arbeitsagentur.de/jobsuche/)
-- Report: DGB contact (https://www.dgb.de/service/kontakt)
-
-IMMIGRATION:
-- Authorities: Immigration Berlin (https://service.berlin.de/dienstleistung/324284/), BAMF (https://www.bamf.de)
-- Alternatives: Visa guide (https://www.germany.info/us-en/service/visa), Integration courses (https://www.bamf.de/EN/Themen/Integration/)
-- Report: BAMF Service (https://www.bamf.de/EN/Service/ServiceCenter/servicecenter-node.html)
-
-SUBSCRIPTION:
-- Authorities: Verbraucherzentrale (https://www.verbraucherzentrale.de)
-- Alternatives: Cancel guide (https://www.verbraucherzentrale.de/wissen/vertraege-reklamation/kundenrechte/so-kuendigen-sie-richtig-6892)
-- Report: Consumer complaint (https://www.verbraucherzentrale.de/beschwerde)
-
-TAX:
-- Authorities: Finanzamt (https://www.finanzamt.de), Tax advisor (https://www.steuerkanzlei.de)
-- Alternatives: ELSTER tax portal (https://www.elster.de), Tax calculator (https://www.bmf-steuerrechner.de)
-- Report: Tax consultation (https://www.finanzamt.de/beratung)
-
-GENERAL FALLBACK:
-- Verbraucherzentrale (https://www.verbraucherzentrale.de)
-- Legal portal (https://www.gesetze-im-internet.de)
-- Legal advice (https://www.anwaltauskunft.de)
-"""
-        
-        system_message = f"""You are LegalMe, a professional German legal assistant. 
-
-CRITICAL: ALWAYS INCLUDE LAW REFERENCES IN YOUR RESPONSES
-- EVERY legal answer MUST cite specific German laws
-- Format: "According to [§ XXX BGB – Description](URL), you can..."
-- Example: "According to [§ 551 BGB – Rental Deposit Limit](https://www.gesetze-im-internet.de/bgb/__551.html), deposits cannot exceed 3 months rent."
-
-MANDATORY LINK FORMATTING (NO EXCEPTIONS):
-- ALWAYS use markdown link format: [Blue Clickable Text](URL)
-- NEVER show raw URLs
-- NEVER use HTML <a> tags
-- Every law reference MUST be a masked link
-- Integrate law links naturally into your explanations
-
-FORMATTING RULES:
-- Use # ## ### for headers
-- Use **bold** for key points
-- Use bullet lists with -
-- Use --- for horizontal dividers
-
-OFFICIAL GERMAN LAW SOURCES (ONLY USE THESE):
-1. Gesetze im Internet: https://www.gesetze-im-internet.de/
-   - BGB (Civil Code): https://www.gesetze-im-internet.de/bgb/
-   - StGB (Criminal Code): https://www.gesetze-im-internet.de/stgb/
-   - AufenthG (Residence Act): https://www.gesetze-im-internet.de/aufenthg_2004/
-   - EStG (Income Tax): https://www.gesetze-im-internet.de/estg/
-   - Format: https://www.gesetze-im-internet.de/[LAW_CODE]/__[SECTION].html
-
-2. Official German Laws Available:
-{law_context}
-
-HOW TO DYNAMICALLY GENERATE LAW LINKS:
-- Rental issues → § 535-580 BGB → https://www.gesetze-im-internet.de/bgb/__[section].html
-- Employment issues → § 611a-630 BGB → https://www.gesetze-im-internet.de/bgb/__[section].html
-- Consumer rights → § 312-312m BGB → https://www.gesetze-im-internet.de/bgb/__[section].html
-- Criminal law → § 1-358 StGB → https://www.gesetze-im-internet.de/stgb/__[section].html
-- Immigration → § 1-104 AufenthG → https://www.gesetze-im-internet.de/aufenthg_2004/__[section].html
-
-KEY BGB SECTIONS YOU MUST KNOW:
-- § 535: Basic rental obligations
-- § 551: Rental deposit (max 3 months)
-- § 558: Rent increases
-- § 573: Termination by landlord
-- § 611a: Employment contract basics
-- § 622: Notice periods for employment
-- § 626: Extraordinary termination
-- § 312g: Right of withdrawal
-- § 307: Unfair contract terms
-
-{links_context}
-
-MANDATORY REQUIREMENTS FOR EVERY RESPONSE:
-
-1. CITE LAWS IN YOUR MAIN ANSWER:
-   - As you explain, cite specific German laws inline
-   - Example: "Your landlord's request is illegal. According to [§ 551 BGB – Rental Deposit](https://www.gesetze-im-internet.de/bgb/__551.html), the maximum deposit is 3 months rent."
-   - Example: "You have rights here. Under [§ 622 BGB – Notice Periods](https://www.gesetze-im-internet.de/bgb/__622.html), your employer must provide proper notice."
-   - DO NOT just list laws at the end - integrate them into your explanation!
-
-2. INCLUDE "Relevant Laws" SECTION:
-   After explaining with inline citations, also include this section (before Next Steps):
-
-   ---
-   
-   ## Relevant Laws
-   - [§ XXX BGB – Description](https://www.gesetze-im-internet.de/bgb/__XXX.html)
-   - [§ YYY BGB – Description](https://www.gesetze-im-internet.de/bgb/__YYY.html)
-
-3. IF NO EXACT LAW EXISTS:
-   State: "No specific law covers this exactly, but the closest framework is..."
-   Then link to the general legal area
-
-4. DETECT USER INTENT and provide context-aware Next Steps:
-   - Rental issues → Mieterschutzbund, rental templates
-   - Employment → Arbeitsagentur, DGB
-   - Immigration → BAMF, Immigration office
-   - Subscription → Verbraucherzentrale, cancellation guides
-
-5. END YOUR RESPONSE WITH:
-
----
-
-## Relevant Laws
-- [§ XXX LAW – Description](official_url)
-- [§ YYY LAW – Description](official_url)
-
----
-
-## Next Steps
-### 1. [Context-aware action]
-[Masked Link Name](URL)
-
-### 2. [Context-aware resource]
-[Masked Link Name](URL)
-
-### 3. Upload another document
-[Analyze another contract](/contract)
-
-EXAMPLE for rental deposit question:
-User: "My landlord wants 4 months deposit"
-
-Response:
-This is **illegal in Germany**. According to [§ 551 BGB – Rental Deposit Limits](https://www.gesetze-im-internet.de/bgb/__551.html), rental deposits are limited to a maximum of **3 months' cold rent**. 
-
-Your landlord's demand exceeds this legal limit. Such excessive deposit clauses are also considered unfair under [§ 307 BGB – Unfair Contract Terms](https://www.gesetze-im-internet.de/bgb/__307.html) and are therefore **invalid**.
-
-**What you should do:**
-- Inform your landlord that the deposit request violates German law
-- Offer to pay the legal maximum (3 months rent)
-- Document everything in writing
-
----
-
-## Relevant Laws
-- [§ 551 BGB – Rental Deposit Limits](https://www.gesetze-im-internet.de/bgb/__551.html)
-- [§ 307 BGB – Unfair Contract Terms](https://www.gesetze-im-internet.de/bgb/__307.html)
-
----
-
-## Next Steps
-### 1. Get legal help
-[Tenant Protection Association](https://www.mieterschutzbund.de)
-
-### 2. Report this violation
-[Consumer Protection Center](https://www.verbraucherzentrale.de/beschwerde)
-
-### 3. Upload another document
-[Analyze another contract](/contract)
-
-Be professional, concise, and ALWAYS include masked law links.
-
-CONVERSATION MEMORY:
-You are continuing a conversation with this user. Here is the recent history:
-{conversation_context}
-
-CRITICAL MEMORY RULES:
-- This is session ID: {request.session_id}
-- ONLY use conversation history from THIS session
-- DO NOT mix up different chat sessions
-- Remember what the user asked before in THIS conversation
-- Reference previous topics from THIS session if relevant
-- Don't repeat information already provided in THIS session
-- Maintain continuity based on THIS conversation's context
-- If this is a new session with no history, treat it as a fresh conversation"""
-        
-        # Initialize chat with memory
-        chat_client = LlmChat(
-            api_key=groq_api_key,
-            session_id=request.session_id,
-            system_message=system_message
-        )
-        chat_client.with_model("groq", "llama-3.3-70b-versatile")
+        system_message = await build_chat_system_message(request.session_id)
         
         # Send message
-        user_msg = UserMessage(text=request.message)
-        ai_response = await chat_client.send_message(user_msg)
+        ai_response = await llm.send(system_message, request.message, operation="chat")
         
         # Store in database
-        chat_doc = ChatMessage(
-            session_id=request.session_id,
-            user_message=request.message,
-            ai_response=ai_response
-        )
-        doc = chat_doc.model_dump()
-        doc['timestamp'] = doc['timestamp'].isoformat()
-        await db.chat_messages.insert_one(doc)
+        await save_chat_message(request.session_id, request.message, ai_response)
         
         return ChatResponse(response=ai_response, session_id=request.session_id)
+    except (LlmUnavailable, LlmError) as e:
+        logging.error(f"Chat error: {str(e)}")
+        raise llm_failure(e)
+    except asyncio.TimeoutError:
+        logging.error("Chat error: LLM request timed out")
+        raise HTTPException(status_code=504, detail="AI response timed out. Please try again.")
     except Exception as e:
         logging.error(f"Chat error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-def chunk_text(text: str, chunk_size: int = 3000) -> list:
-    """Split text into manageable chunks for analysis"""
-    words = text.split()
-    chunks = []
-    current_chunk = []
-    current_length = 0
+def sse_event(data: dict, event: str = None) -> str:
+    """Format one Server-Sent Events message"""
+    message = f"data: {json.dumps(data)}\n\n"
+    return f"event: {event}\n{message}" if event else message
+
+async def stream_reply(system_message: str, prompt: str, on_complete, operation: str = "chat_stream"):
+    """
+    SSE body: one `data: {"token": ...}` event per generated chunk, then
+    `event: done` once `on_complete(full_response)` has persisted the answer.
+    Errors after the stream started are reported as `event: error`.
+    """
+    parts = []
+    try:
+        async for token in llm.stream(system_message, prompt, operation=operation):
+            parts.append(token)
+            yield sse_event({"token": token})
+    except Exception as e:
+        logging.error(f"Streaming chat error: {str(e)}")
+        yield sse_event({"detail": "AI response failed. Please try again."}, event="error")
+        return
     
-    for word in words:
-        current_length += len(word) + 1
-        if current_length > chunk_size:
-            chunks.append(' '.join(current_chunk))
-            current_chunk = [word]
-            current_length = len(word)
-        else:
-            current_chunk.append(word)
+    ai_response = "".join(parts)
+    try:
+        saved = await on_complete(ai_response)
+    except Exception as e:
+        # The tokens were shown, but the reply is not in the history: tell the client
+        logging.error(f"Streaming chat error: could not save the reply: {str(e)}")
+        yield sse_event({"detail": "The reply could not be saved. Please try again."}, event="error")
+        return
+    yield sse_event({"id": saved["id"], "response": ai_response}, event="done")
+
+def sse_response(body) -> StreamingResponse:
+    return StreamingResponse(
+        body,
+        media_type="text/event-stream",
+        # Disable proxy buffering so tokens reach the browser immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Streaming variant of /chat: tokens are sent as Server-Sent Events as they are generated"""
+    if not llm.available():
+        raise llm_failure(LlmUnavailable(llm.breaker.retry_after()))
+    try:
+        system_message = await build_chat_system_message(request.session_id)
+    except Exception as e:
+        logging.error(f"Chat error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
     
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
+    async def persist(ai_response):
+        chat_doc = await save_chat_message(request.session_id, request.message, ai_response)
+        return {"id": chat_doc.id}
     
-    return chunks
+    return sse_response(stream_reply(system_message, request.message, persist))
+
+def analysis_chunks(text: str) -> list:
+    """Sections for per-chunk analysis, sized so that they cover the whole document"""
+    chunk_tokens = chunk_size_for(count_tokens(text), ANALYSIS_CHUNK_TOKENS, ANALYSIS_MAX_CHUNKS, ANALYSIS_MAX_CHUNK_TOKENS)
+    # Anchored boundaries keep unchanged sections identical across revisions of a document
+    return list(iter_chunks(text, max_tokens=chunk_tokens, overlap_tokens=ANALYSIS_CHUNK_OVERLAP_TOKENS, anchored=True))
 
-def extract_text_from_file(content: bytes, filename: str) -> tuple:
+def build_contract_index(text: str) -> dict:
+    """BM25 passage index used to ground contract chat answers"""
+    return build_index(list(iter_chunks(text, max_tokens=RETRIEVAL_CHUNK_TOKENS, overlap_tokens=0)))
+
+async def save_contract_index(contract_id: str, index: dict):
+    """Store a passage index. Failures are only logged: contract chat rebuilds a missing index"""
+    try:
+        await contract_indexes.save(contract_id, index)
+    except Exception as e:
+        logging.warning(f"Could not save the passage index of {contract_id}: {str(e)}")
+
+async def assess_risk(extracted_text: str, use_cache: bool = True) -> Optional[dict]:
     """
-    Extract text from ANY file type (PDF, DOCX, TXT, Images, XLSX, PPTX, etc.)
-    Returns: (extracted_text, page_count)
-    Handles files of any size with chunking and OCR
+    Ask the LLM for scam / legal risk confidences and parse the structured reply.
+    Returns None if the LLM is unavailable (see rule_based_risk).
     """
-    file_ext = filename.lower().split('.')[-1]
+    logging.info("Starting AI-powered risk assessment...")
     
+    risk_assessment_prompt = prompt_registry.render("risk_assessment", document=extracted_text[:5000])
+
     try:
-        # PDF files
-        if file_ext == 'pdf':
-            pdf_reader = PdfReader(io.BytesIO(content))
-            page_count = len(pdf_reader.pages)
-            extracted_text = ""
-            
-            # Try regular text extraction first
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    extracted_text += page_text + "\n"
-            
-            # If no text extracted, it's likely a scanned PDF - use OCR
-            if len(extracted_text.strip()) < 50:
-                logging.info("PDF has no text, attempting OCR...")
-                images = convert_from_bytes(content)
-                extracted_text = ""
-                for i, image in enumerate(images):
-                    text = pytesseract.image_to_string(image)
-                    extracted_text += f"\n--- Page {i+1} ---\n{text}\n"
-                logging.info(f"OCR extracted {len(extracted_text)} characters")
-            
-            return extracted_text, page_count
-        
-        # DOCX files
-        elif file_ext in ['docx', 'doc']:
-            doc = Document(io.BytesIO(content))
-            extracted_text = "\n".join([para.text for para in doc.paragraphs])
-            # Also extract from tables
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        extracted_text += "\n" + cell.text
-            return extracted_text, len(doc.paragraphs) // 20 or 1
-        
-        # Excel files
-        elif file_ext in ['xlsx', 'xls']:
-            wb = load_workbook(io.BytesIO(content), data_only=True)
-            extracted_text = ""
-            for sheet in wb.worksheets:
-                extracted_text += f"\n--- Sheet: {sheet.title} ---\n"
-                for row in sheet.iter_rows(values_only=True):
-                    row_text = " | ".join([str(cell) if cell else "" for cell in row])
-                    extracted_text += row_text + "\n"
-            return extracted_text, len(wb.worksheets)
-        
-        # PowerPoint files
-        elif file_ext in ['pptx', 'ppt']:
-            prs = Presentation(io.BytesIO(content))
-            extracted_text = ""
-            for i, slide in enumerate(prs.slides):
-                extracted_text += f"\n--- Slide {i+1} ---\n"
-                for shape in slide.shapes:
-                    if hasattr(shape, "text"):
-                        extracted_text += shape.text + "\n"
-            return extracted_text, len(prs.slides)
-        
-        # OpenDocument files
-        elif file_ext in ['odt', 'ods']:
-            doc = odf_load(io.BytesIO(content))
-            extracted_text = ""
-            for para in doc.getElementsByType(odf_text.P):
-                extracted_text += teletype.extractText(para) + "\n"
-            return extracted_text, 1
-        
-        # TXT and other text files
-        elif file_ext in ['txt', 'log', 'md', 'rtf', 'csv']:
-            try:
-                extracted_text = content.decode('utf-8', errors='ignore')
-            except:
-                extracted_text = content.decode('latin-1', errors='ignore')
-            return extracted_text, len(extracted_text) // 3000 or 1
-        
-        # All image files with OCR
-        elif file_ext in ['jpg', 'jpeg', 'png', 'bmp', 'tiff', 'tif', 'gif', 'webp', 'heic', 'heif']:
-            logging.info(f"Processing image file with OCR: {file_ext}")
-            image = Image.open(io.BytesIO(content))
-            # Convert to RGB if needed
-            if image.mode in ('RGBA', 'LA', 'P'):
-                image = image.convert('RGB')
-            extracted_text = pytesseract.image_to_string(image)
-            logging.info(f"OCR extracted {len(extracted_text)} characters from image")
-            return extracted_text, 1
-        
-        # Fallback: Try to extract as text or use OCR
-        else:
-            logging.warning(f"Unknown file type: {file_ext}, attempting extraction...")
-            # Try as text first
-            try:
-                extracted_text = content.decode('utf-8', errors='ignore')
-                if len(extracted_text.strip()) > 50:
-                    return extracted_text, 1
-            except:
-                pass
-            
-            # Try as image with OCR
-            try:
-                image = Image.open(io.BytesIO(content))
-                extracted_text = pytesseract.image_to_string(image)
-                if len(extracted_text.strip()) > 10:
-                    logging.info(f"Fallback OCR succeeded for {file_ext}")
-                    return extracted_text, 1
-            except:
-                pass
-            
-            raise HTTPException(status_code=400, detail=f"Could not extract text from {file_ext} file. The file may be corrupted or in an unsupported format.")
+        ai_risk_response = await llm.send(RISK_SYSTEM_MESSAGE, risk_assessment_prompt, use_cache=use_cache, operation="risk_assessment")
+    except (LlmUnavailable, LlmError) as e:
+        logging.warning(f"AI risk assessment unavailable: {str(e)}")
+        return None
+    except asyncio.TimeoutError:
+        logging.warning("AI risk assessment unavailable: LLM request timed out")
+        return None
+    logging.info(f"AI Risk Assessment: {ai_risk_response[:200]}...")
     
-    except HTTPException:
-        raise
-    except Exception as e:
-        logging.error(f"Text extraction error for {file_ext}: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Could not extract text from file: {str(e)}")
+    # Parse AI risk assessment
+    scam_confidence = 0
+    legal_risk_confidence = 0
+    scam_indicators = []
+    legal_concerns = []
+    risk_explanation = "Document analyzed"
+    
+    if "SCAM_CONFIDENCE:" in ai_risk_response:
+        try:
+            scam_conf_text = ai_risk_response.split("SCAM_CONFIDENCE:")[1].split("\n")[0].strip()
+            scam_confidence = int(''.join(filter(str.isdigit, scam_conf_text)))
+        except:
+            pass
+    
+    if "LEGAL_RISK_CONFIDENCE:" in ai_risk_response:
+        try:
+            legal_conf_text = ai_risk_response.split("LEGAL_RISK_CONFIDENCE:")[1].split("\n")[0].strip()
+            legal_risk_confidence = int(''.join(filter(str.isdigit, legal_conf_text)))
+        except:
+            pass
+    
+    if "SCAM_INDICATORS:" in ai_risk_response:
+        indicators_text = ai_risk_response.split("SCAM_INDICATORS:")[1].split("LEGAL_RISK_CONFIDENCE:")[0].strip()
+        if "None" not in indicators_text and indicators_text:
+            scam_indicators = [{"indicator": ind.strip("- ").strip(), "severity": "high", "snippet": ""} 
+                             for ind in indicators_text.split("\n") if ind.strip() and ind.strip() != "None"]
+    
+    if "LEGAL_CONCERNS:" in ai_risk_response:
+        concerns_text = ai_risk_response.split("LEGAL_CONCERNS:")[1].split("RISK_EXPLANATION:")[0].strip()
+        if "None" not in concerns_text and concerns_text:
+            legal_concerns = [c.strip("- ").strip() for c in concerns_text.split("\n") if c.strip() and c.strip() != "None"]
+    
+    if "RISK_EXPLANATION:" in ai_risk_response:
+        risk_explanation = ai_risk_response.split("RISK_EXPLANATION:")[1].strip()
+    
+    return {
+        "scam_confidence": scam_confidence,
+        "legal_risk_confidence": legal_risk_confidence,
+        "scam_indicators": scam_indicators,
+        "legal_concerns": legal_concerns,
+        "risk_explanation": risk_explanation
+    }
 
-@api_router.post("/contract/analyze")
-async def analyze_contract(file: UploadFile = File(...)):
-    try:
-        # Extract text from any supported file type
-        content = await file.read()
-        extracted_text, page_count = extract_text_from_file(content, file.filename)
-        
-        if not extracted_text.strip():
-            raise HTTPException(status_code=400, detail="Could not extract text from file. The file may be empty or corrupted.")
-        
-        logging.info(f"Extracted {len(extracted_text)} characters from {page_count} pages/sections")
-        
-        # AI-POWERED RISK ASSESSMENT - Let AI determine risk level dynamically
-        logging.info("Starting AI-powered risk assessment...")
-        
-        risk_assessment_prompt = f"""You are a legal expert analyzing a document for potential risks and scams.
+# Scam patterns also fire on ordinary contracts, so without the AI assessment they never
+# push the scam confidence up to the "high" (40) or "scam" (70) thresholds
+RULE_BASED_SCAM_CONFIDENCE_MAX = 35
+
+def rule_based_risk(rules: dict) -> dict:
+    """Risk estimate from pattern matches alone, used when the AI assessment is unavailable"""
+    scam_confidence = min(RULE_BASED_SCAM_CONFIDENCE_MAX, sum(15 if ind["severity"] == "high" else 10 for ind in rules["scam_indicators"]))
+    legal_risk_confidence = min(90, 30 * len(rules["clauses_violates"]) + 10 * len(rules["clauses_attention"]))
+    return {
+        "scam_confidence": scam_confidence,
+        "legal_risk_confidence": legal_risk_confidence,
+        "scam_indicators": [],
+        "legal_concerns": [],
+        "risk_explanation": "AI risk assessment is temporarily unavailable. This rating is based on pattern matching of known clauses and scam indicators only."
+    }
 
-DOCUMENT TEXT (First 5000 characters):
-{extracted_text[:5000]}
+RISK_SEVERITY = {"safe": 0, "attention": 1, "violates": 2}
 
-ANALYZE THIS DOCUMENT AND PROVIDE:
+def build_clause_record(text: str, group) -> tuple:
+    """
+    Turn a group of overlapping clause hits into one clause record.
+    The most severe rule decides the bucket; every triggering rule is attached.
+    Returns: (risk, clause_info)
+    """
+    rules = list({match.rule.id: match.rule for match in group.matches}.values())
+    primary = max(rules, key=lambda rule: RISK_SEVERITY.get(rule.data["risk"], 0))
+    
+    clause_info = {
+        "clause": " ".join(text[group.start:group.end].split()),
+        "explanation": primary.data["explanation"],
+        "law": primary.law["title"] if primary.law else "General Legal Principle",
+        "law_link": primary.law["url"] if primary.law else "#",
+        "rules": [
+            {
+                "explanation": rule.data["explanation"],
+                "risk": rule.data["risk"],
+                "law": rule.law["title"] if rule.law else "General Legal Principle",
+                "law_link": rule.law["url"] if rule.law else "#"
+            }
+            for rule in rules
+        ]
+    }
+    return primary.data["risk"], clause_info
 
-1. SCAM ASSESSMENT (0-100% confidence):
-   - Is this a scam, phishing attempt, or fraudulent scheme?
-   - Look for: advance payment requests, lottery scams, urgency tactics, requests for sensitive info, too-good-to-be-true offers
-   - Confidence: 0% (definitely not scam) to 100% (definitely scam)
+def scan_rules(text: str) -> dict:
+    """
+    Single pass of the precompiled rule engine over the full document.
+    Returns clause findings grouped by risk plus pattern-based scam indicators.
+    """
+    clauses = {"safe": [], "attention": [], "violates": []}
+    scam_indicators = []
+    seen_indicators = set()
+    clause_matches = []
+    
+    for match in rule_engine.scan(text):
+        if match.rule.kind != "scam":
+            clause_matches.append(match)
+            continue
+        # One indicator per scam rule, with the first triggering snippet
+        if match.rule.id not in seen_indicators:
+            seen_indicators.add(match.rule.id)
+            scam_indicators.append({
+                "indicator": match.rule.data["indicator"],
+                "severity": match.rule.data["severity"],
+                "snippet": match.snippet(text)
+            })
+    
+    # Overlapping hits become one record; identical text elsewhere in the document is reported once
+    seen_snippets = set()
+    for group in group_overlapping(clause_matches, len(text)):
+        risk, clause_info = build_clause_record(text, group)
+        core = text[group.matches[0].start:max(m.end for m in group.matches)]
+        normalized = " ".join(core.lower().split())
+        if normalized in seen_snippets or risk not in clauses:
+            continue
+        seen_snippets.add(normalized)
+        clauses[risk].append(clause_info)
+    
+    return {
+        "clauses_safe": clauses["safe"],
+        "clauses_attention": clauses["attention"],
+        "clauses_violates": clauses["violates"],
+        "scam_indicators": scam_indicators
+    }
 
-2. LEGAL RISK ASSESSMENT (0-100% confidence):
-   - Are there illegal clauses, unfair terms, or violations of German law?
-   - Look for: excessive fees, unfair termination, liability exclusions, illegal requirements
-   - Confidence: 0% (completely safe) to 100% (severe violations)
+async def analyze_chunk(chunk, use_cache: bool = True) -> str:
+    """Short LLM analysis of a single document section (a chunker.Chunk)"""
+    chunk_prompt = prompt_registry.render("chunk_analysis", section=chunk.label(), chunk=chunk.text)
 
-3. KEY CONCERNS:
-   - List specific problematic clauses or red flags (max 5)
+    try:
+        return await llm.send(CHUNK_SYSTEM_MESSAGE, chunk_prompt, use_cache=use_cache, operation="chunk_analysis")
+    except (asyncio.TimeoutError, LlmUnavailable, LlmError):
+        # One slow or failed section should not sink the whole report
+        return None
 
-Provide response in this EXACT format:
-SCAM_CONFIDENCE: [0-100]
-SCAM_INDICATORS: [List specific scam indicators found, or "None" if not a scam]
-LEGAL_RISK_CONFIDENCE: [0-100]
-LEGAL_CONCERNS: [List specific legal issues found, or "None" if safe]
-RISK_EXPLANATION: [2-3 sentence summary of why this risk level]"""
+def chunk_fingerprint(chunk: str) -> str:
+    """
+    Case/whitespace-insensitive hash used to recognise unchanged sections across uploads.
+    Page markers are left out: an edit earlier in the document moves later page breaks.
+    """
+    normalized = " ".join(PAGE_MARKER_TEXT.sub(" ", chunk).lower().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
 
-        risk_chat = LlmChat(
-            api_key=groq_api_key,
-            session_id=f"risk_{uuid.uuid4()}",
-            system_message="You are a legal risk assessment AI. Be thorough and accurate in detecting scams and legal violations."
-        )
-        risk_chat.with_model("groq", "llama-3.3-70b-versatile")
-        
-        ai_risk_response = await risk_chat.send_message(UserMessage(text=risk_assessment_prompt))
-        logging.info(f"AI Risk Assessment: {ai_risk_response[:200]}...")
-        
-        # Parse AI risk assessment
-        scam_confidence = 0
-        legal_risk_confidence = 0
-        scam_indicators = []
-        legal_concerns = []
-        risk_explanation = "Document analyzed"
-        
-        if "SCAM_CONFIDENCE:" in ai_risk_response:
-            try:
-                scam_conf_text = ai_risk_response.split("SCAM_CONFIDENCE:")[1].split("\n")[0].strip()
-                scam_confidence = int(''.join(filter(str.isdigit, scam_conf_text)))
-            except:
-                pass
-        
-        if "LEGAL_RISK_CONFIDENCE:" in ai_risk_response:
-            try:
-                legal_conf_text = ai_risk_response.split("LEGAL_RISK_CONFIDENCE:")[1].split("\n")[0].strip()
-                legal_risk_confidence = int(''.join(filter(str.isdigit, legal_conf_text)))
-            except:
-                pass
-        
-        if "SCAM_INDICATORS:" in ai_risk_response:
-            indicators_text = ai_risk_response.split("SCAM_INDICATORS:")[1].split("LEGAL_RISK_CONFIDENCE:")[0].strip()
-            if "None" not in indicators_text and indicators_text:
-                scam_indicators = [{"indicator": ind.strip("- ").strip(), "severity": "high", "snippet": ""} 
-                                 for ind in indicators_text.split("\n") if ind.strip() and ind.strip() != "None"]
-        
-        if "LEGAL_CONCERNS:" in ai_risk_response:
-            concerns_text = ai_risk_response.split("LEGAL_CONCERNS:")[1].split("RISK_EXPLANATION:")[0].strip()
-            if "None" not in concerns_text and concerns_text:
-                legal_concerns = [c.strip("- ").strip() for c in concerns_text.split("\n") if c.strip() and c.strip() != "None"]
-        
-        if "RISK_EXPLANATION:" in ai_risk_response:
-            risk_explanation = ai_risk_response.split("RISK_EXPLANATION:")[1].strip()
-        
-        # Determine if it's a scam based on AI confidence
-        is_likely_scam = scam_confidence >= 70
-        
-        logging.info(f"AI Assessment - Scam: {scam_confidence}%, Legal Risk: {legal_risk_confidence}%, Is Scam: {is_likely_scam}")
-        
-        # Split into chunks for analysis if document is large
-        text_chunks = chunk_text(extracted_text, chunk_size=3000)
-        logging.info(f"Split document into {len(text_chunks)} chunks")
-        
-        # Analyze clauses across all chunks
-        clauses_safe = []
-        clauses_attention = []
-        clauses_violates = []
-        
-        for chunk_idx, chunk in enumerate(text_chunks):
-            text_lower = chunk.lower()
-            for clause_pattern in CLAUSE_DATABASE:
-                matches = re.finditer(clause_pattern["pattern"], text_lower, re.IGNORECASE)
-                for match in matches:
-                    snippet = chunk[max(0, match.start()-50):min(len(chunk), match.end()+50)]
-                    law_ref = next((law for law in LAW_DATABASE if law["id"] == clause_pattern.get("law_ref")), None)
-                    
-                    # Check for duplicates
-                    clause_text = snippet.strip()
-                    if any(clause_text in c["clause"] for c in clauses_safe + clauses_attention + clauses_violates):
-                        continue
-                    
-                    clause_info = {
-                        "clause": clause_text,
-                        "explanation": clause_pattern["explanation"],
-                        "law": law_ref["title"] if law_ref else "General Legal Principle",
-                        "law_link": law_ref["url"] if law_ref else "#"
-                    }
-                    
-                    if clause_pattern["risk"] == "safe":
-                        clauses_safe.append(clause_info)
-                    elif clause_pattern["risk"] == "attention":
-                        clauses_attention.append(clause_info)
-                    elif clause_pattern["risk"] == "violates":
-                        clauses_violates.append(clause_info)
-        
-        # AI-POWERED DYNAMIC RISK LEVEL DETERMINATION
-        # Based on confidence scores: 0-20% = Safe/Low, 21-50% = Medium, 51-80% = High, 81-100% = Scam
-        
-        if scam_confidence >= 70:
-            # 100% sure it's a scam
-            risk_level = "scam"
-            risk_confidence = scam_confidence
-        elif scam_confidence >= 40:
-            # Suspicious but not completely sure
-            risk_level = "high"
-            risk_confidence = scam_confidence
-        elif legal_risk_confidence >= 80:
-            # Almost 100% sure of legal violations
-            risk_level = "high"
-            risk_confidence = legal_risk_confidence
-        elif legal_risk_confidence >= 50 or len(clauses_violates) >= 2:
-            # Half sure / multiple violations
-            risk_level = "medium"
-            risk_confidence = legal_risk_confidence
-        elif legal_risk_confidence >= 20 or len(clauses_attention) >= 1 or len(clauses_violates) >= 1:
-            # Not very sure / minor concerns
-            risk_level = "low"
-            risk_confidence = max(legal_risk_confidence, 20)
-        elif legal_risk_confidence <= 10 and scam_confidence <= 10:
-            # 100% sure it's safe
-            risk_level = "safe"
-            risk_confidence = 100 - max(legal_risk_confidence, scam_confidence)
+async def find_previous_chunk_analyses(fingerprints: list) -> tuple:
+    """
+    Find the earlier analysis sharing the most sections with this upload.
+    Returns: (previous_analysis_id, {fingerprint: analysis}) or (None, {})
+    """
+    candidates = await db.contract_analyses.find(
+        {"chunk_fingerprints": {"$in": fingerprints}},
+        {"_id": 0, "id": 1, "chunk_fingerprints": 1, "chunk_analyses": 1}
+    ).sort("timestamp", -1).to_list(10)
+    if not candidates:
+        return None, {}
+    
+    wanted = set(fingerprints)
+    best = max(candidates, key=lambda c: len(wanted & set(c.get("chunk_fingerprints", []))))
+    return best["id"], {c["fingerprint"]: c["analysis"] for c in best.get("chunk_analyses", [])}
+
+async def no_progress(stage: str, **detail):
+    """Default progress reporter for synchronous requests"""
+
+async def analyze_chunks_incremental(text_chunks: list, use_cache: bool = True, progress=no_progress) -> dict:
+    """
+    Analyze document sections (chunker.Chunk objects), reusing the LLM output for
+    sections that are unchanged since the most similar previous upload.
+    """
+    fingerprints = [chunk_fingerprint(chunk.text) for chunk in text_chunks]
+    previous_analysis_id, previous = (None, {})
+    if use_cache and fingerprints:
+        previous_analysis_id, previous = await find_previous_chunk_analyses(fingerprints)
+    
+    chunks_done = 0
+    
+    async def analyze_or_reuse(chunk, fingerprint):
+        nonlocal chunks_done
+        if fingerprint in previous:
+            result = previous[fingerprint]
         else:
-            # Default low risk
-            risk_level = "low"
-            risk_confidence = 100 - legal_risk_confidence
-        
-        logging.info(f"FINAL RISK LEVEL: {risk_level.upper()} ({risk_confidence}% confidence) - Scam: {scam_confidence}%, Legal: {legal_risk_confidence}%, Violations: {len(clauses_violates)}, Attention: {len(clauses_attention)}")
-        
-        # Generate comprehensive AI analysis using chunks
-        law_context = "\n".join([f"- {law['title']}: {law['description']}" for law in LAW_DATABASE])
-        
-        # Analyze document in chunks and merge results
-        chunk_analyses = []
-        for i, chunk in enumerate(text_chunks[:5]):  # Analyze first 5 chunks max
-            chunk_prompt = f"""Analyze this section of a legal document:
-
-Section {i+1}:
-{chunk}
-
-Identify:
-1. Document type (rental/employment/subscription/immigration/tax/other)
-2. Key terms and conditions
-3. Potential risks or concerns
-4. Important deadlines or fees mentioned
-5. Missing information
-
-Provide brief analysis (2-3 sentences)."""
-
-            chat_client = LlmChat(
-                api_key=groq_api_key,
-                session_id=f"analysis_chunk_{uuid.uuid4()}",
-                system_message="You are a legal document analyzer. Be concise and identify key points."
+            result = await analyze_chunk(chunk, use_cache=use_cache)
+        chunks_done += 1
+        await progress("analyzing", chunk=chunks_done, chunks=len(text_chunks))
+        return result
+    
+    results = await asyncio.gather(*[
+        analyze_or_reuse(chunk, fingerprint)
+        for chunk, fingerprint in zip(text_chunks, fingerprints)
+    ])
+    
+    changed_sections = [i + 1 for i, fingerprint in enumerate(fingerprints) if fingerprint not in previous]
+    if previous_analysis_id:
+        logging.info(f"Reused {len(fingerprints) - len(changed_sections)}/{len(fingerprints)} section analyses from {previous_analysis_id}")
+    
+    return {
+        "section_summaries": [
+            f"Section {chunk.label()}: {result if result is not None else 'Analysis unavailable.'}"
+            for chunk, result in zip(text_chunks, results)
+        ],
+        "sections": [chunk.metadata() for chunk in text_chunks],
+        "chunk_fingerprints": fingerprints,
+        # Only successful analyses are stored for reuse
+        "chunk_analyses": [
+            {"fingerprint": fingerprint, "analysis": result}
+            for fingerprint, result in zip(fingerprints, results) if result is not None
+        ],
+        "changed_sections": changed_sections if previous_analysis_id else [],
+        "previous_analysis_id": previous_analysis_id
+    }
+
+async def reduce_section_summaries(summaries: list, use_cache: bool = True) -> list:
+    """
+    Map-reduce step: combine neighbouring section findings, REDUCE_GROUP_SIZE at a
+    time, until all of them fit MERGE_TOKEN_BUDGET. A group whose LLM call fails
+    is kept as its joined findings, so the loop always ends.
+    """
+    level = 0
+    while len(summaries) > 1 and count_tokens("\n".join(summaries)) > MERGE_TOKEN_BUDGET:
+        level += 1
+        groups = [summaries[i:i + REDUCE_GROUP_SIZE] for i in range(0, len(summaries), REDUCE_GROUP_SIZE)]
+
+        async def reduce_group(number, group):
+            first = number * REDUCE_GROUP_SIZE + 1
+            prompt = prompt_registry.render(
+                "reduce_sections",
+                findings="\n\n".join(group),
+                first_section=first,
+                last_section=first + len(group) - 1
             )
-            chat_client.with_model("groq", "llama-3.3-70b-versatile")
+            try:
+                combined = await llm.send(REDUCE_SYSTEM_MESSAGE, prompt, use_cache=use_cache, operation="reduce_sections")
+            except (asyncio.TimeoutError, LlmUnavailable, LlmError):
+                return "\n".join(group)
+            return f"Sections {first}-{first + len(group) - 1}: {combined.strip()}"
+
+        reduced = await asyncio.gather(*[reduce_group(number, group) for number, group in enumerate(groups)])
+        if count_tokens("\n".join(reduced)) >= count_tokens("\n".join(summaries)):
+            # Nothing got shorter (e.g. the LLM is down): stop instead of looping
+            break
+        summaries = reduced
+        logging.info(f"Reduced section findings to {len(summaries)} groups (level {level})")
+    return summaries
+
+def determine_risk_level(scam_confidence: int, legal_risk_confidence: int, clauses_attention: list, clauses_violates: list) -> tuple:
+    """
+    AI-POWERED DYNAMIC RISK LEVEL DETERMINATION
+    Based on confidence scores: 0-20% = Safe/Low, 21-50% = Medium, 51-80% = High, 81-100% = Scam
+    Returns: (risk_level, risk_confidence)
+    """
+    if scam_confidence >= 70:
+        # 100% sure it's a scam
+        return "scam", scam_confidence
+    elif scam_confidence >= 40:
+        # Suspicious but not completely sure
+        return "high", scam_confidence
+    elif legal_risk_confidence >= 80:
+        # Almost 100% sure of legal violations
+        return "high", legal_risk_confidence
+    elif legal_risk_confidence >= 50 or len(clauses_violates) >= 2:
+        # Half sure / multiple violations
+        return "medium", legal_risk_confidence
+    elif legal_risk_confidence >= 20 or len(clauses_attention) >= 1 or len(clauses_violates) >= 1:
+        # Not very sure / minor concerns
+        return "low", max(legal_risk_confidence, 20)
+    elif legal_risk_confidence <= 10 and scam_confidence <= 10:
+        # 100% sure it's safe
+        return "safe", 100 - max(legal_risk_confidence, scam_confidence)
+    else:
+        # Default low risk
+        return "low", 100 - legal_risk_confidence
+
+def parse_final_analysis(ai_analysis: str) -> dict:
+    """Parse the TYPE/SUMMARY/RECOMMENDATIONS/KEY_EXCERPTS/RELEVANT_LAWS reply of the merge prompt"""
+    doc_type = "general"
+    summary = "Document analysis complete."
+    recommendations = "Review all highlighted clauses carefully."
+    key_excerpts = []
+    relevant_laws = []
+    
+    if "TYPE:" in ai_analysis:
+        doc_type = ai_analysis.split("TYPE:")[1].split("\n")[0].strip().lower()
+    if "SUMMARY:" in ai_analysis:
+        summary_text = ai_analysis.split("SUMMARY:")[1]
+        if "RECOMMENDATIONS:" in summary_text:
+            summary = summary_text.split("RECOMMENDATIONS:")[0].strip()
+        else:
+            summary = summary_text.split("KEY_EXCERPTS:")[0].strip() if "KEY_EXCERPTS:" in summary_text else summary_text.strip()
+    if "RECOMMENDATIONS:" in ai_analysis:
+        rec_text = ai_analysis.split("RECOMMENDATIONS:")[1]
+        if "KEY_EXCERPTS:" in rec_text:
+            recommendations = rec_text.split("KEY_EXCERPTS:")[0].strip()
+        elif "RELEVANT_LAWS:" in rec_text:
+            recommendations = rec_text.split("RELEVANT_LAWS:")[0].strip()
+        else:
+            recommendations = rec_text.strip()
+    if "KEY_EXCERPTS:" in ai_analysis:
+        excerpts_text = ai_analysis.split("KEY_EXCERPTS:")[1]
+        if "RELEVANT_LAWS:" in excerpts_text:
+            excerpts_text = excerpts_text.split("RELEVANT_LAWS:")[0]
+        key_excerpts = [e.strip() for e in excerpts_text.split("\n") if e.strip() and not e.strip().startswith('-')][:5]
+    if "RELEVANT_LAWS:" in ai_analysis:
+        laws_text = ai_analysis.split("RELEVANT_LAWS:")[1].strip()
+        # Extract each law line (they should be markdown links)
+        for line in laws_text.split("\n"):
+            if line.strip() and (line.strip().startswith('-') or '[§' in line):
+                relevant_laws.append(line.strip().lstrip('- '))
+    
+    logging.info(f"Parsed relevant laws: {relevant_laws}")
+    
+    return {
+        "document_type": doc_type,
+        "summary": summary,
+        "recommendations": recommendations,
+        "key_excerpts": key_excerpts,
+        "relevant_laws": relevant_laws
+    }
+
+async def run_analysis_pipeline(upload, no_cache: bool = False, progress=no_progress) -> ContractAnalysis:
+    """
+    Full contract analysis for an upload already stored on disk:
+    extraction / OCR, rule scan, LLM risk + section analyses, merge, persist.
+    `progress(stage, **detail)` is awaited as the pipeline advances. The upload is
+    left on disk; callers remove it once it can no longer be needed for a rerun.
+    """
+    # Extract text from any supported file type
+    await progress("extracting")
+    with span("extract") as extract_span:
+        cache_key = extraction_cache_key(upload.sha256)
+        cached = None if no_cache else await extraction_cache.get(cache_key)
+        extract_span.set("cache_hit", bool(cached))
+        if cached:
+            extracted_text, page_count = cached
+            logging.info(f"Extraction cache hit for {upload.filename}")
+        else:
+            async def ocr_progress(pages_done, page_count):
+                await progress("ocr", page=pages_done, pages=page_count)
             
-            chunk_analysis = await chat_client.send_message(UserMessage(text=chunk_prompt))
-            chunk_analyses.append(f"Section {i+1}: {chunk_analysis}")
-        
-        # Merge all chunk analyses into final summary WITH MASKED LAW LINKS
-        merged_prompt = f"""You analyzed a legal document in {len(chunk_analyses)} sections. Here are the findings:
-
-{chr(10).join(chunk_analyses)}
-
-Detected clauses:
-- Safe clauses: {len(clauses_safe)}
-- Attention needed: {len(clauses_attention)}
-- Violations: {len(clauses_violates)}
-
-CRITICAL: You MUST include masked law links in your response.
-
-OFFICIAL GERMAN LAW SOURCES:
-- BGB sections: https://www.gesetze-im-internet.de/bgb/__[section].html
-- Format: [§ XXX BGB – Description](https://www.gesetze-im-internet.de/bgb/__XXX.html)
-
-KEY BGB SECTIONS:
-- § 535: Rental obligations
-- § 551: Rental deposit (max 3 months)
-- § 558: Rent increases
-- § 573: Landlord termination
-- § 611a: Employment basics
-- § 622: Employment notice periods
-- § 626: Extraordinary termination
-- § 312g: Right of withdrawal
-- § 307: Unfair contract terms
-
-Available laws:
-{law_context}
-
-Now provide a comprehensive final analysis in this EXACT format:
-TYPE: [rental/employment/subscription/immigration/tax/other]
-SUMMARY: [3-5 sentence comprehensive summary with MASKED LAW LINKS. Example: "The deposit exceeds [§ 551 BGB – Rental Deposit](https://www.gesetze-im-internet.de/bgb/__551.html) limits."]
-RECOMMENDATIONS: [Specific actionable recommendations with MASKED LAW LINKS where relevant]
-KEY_EXCERPTS: [3-5 most important text excerpts from the document, each 50-100 words]
-RELEVANT_LAWS: [List 2-3 specific German laws being violated or relevant, in MASKED LINK format: [§ XXX BGB – Description](URL)]"""
-        
-        chat_client = LlmChat(
-            api_key=groq_api_key,
-            session_id=f"contract_{uuid.uuid4()}",
-            system_message="You are a professional German legal document analyzer. Provide comprehensive analysis."
-        )
-        chat_client.with_model("groq", "llama-3.3-70b-versatile")
-        
-        ai_analysis = await chat_client.send_message(UserMessage(text=merged_prompt))
-        
-        # Parse AI response
-        doc_type = "general"
-        summary = "Document analysis complete."
-        recommendations = "Review all highlighted clauses carefully."
-        key_excerpts = []
-        relevant_laws = []
-        
-        if "TYPE:" in ai_analysis:
-            doc_type = ai_analysis.split("TYPE:")[1].split("\n")[0].strip().lower()
-        if "SUMMARY:" in ai_analysis:
-            summary_text = ai_analysis.split("SUMMARY:")[1]
-            if "RECOMMENDATIONS:" in summary_text:
-                summary = summary_text.split("RECOMMENDATIONS:")[0].strip()
-            else:
-                summary = summary_text.split("KEY_EXCERPTS:")[0].strip() if "KEY_EXCERPTS:" in summary_text else summary_text.strip()
-        if "RECOMMENDATIONS:" in ai_analysis:
-            rec_text = ai_analysis.split("RECOMMENDATIONS:")[1]
-            if "KEY_EXCERPTS:" in rec_text:
-                recommendations = rec_text.split("KEY_EXCERPTS:")[0].strip()
-            elif "RELEVANT_LAWS:" in rec_text:
-                recommendations = rec_text.split("RELEVANT_LAWS:")[0].strip()
-            else:
-                recommendations = rec_text.strip()
-        if "KEY_EXCERPTS:" in ai_analysis:
-            excerpts_text = ai_analysis.split("KEY_EXCERPTS:")[1]
-            if "RELEVANT_LAWS:" in excerpts_text:
-                excerpts_text = excerpts_text.split("RELEVANT_LAWS:")[0]
-            key_excerpts = [e.strip() for e in excerpts_text.split("\n") if e.strip() and not e.strip().startswith('-')][:5]
-        if "RELEVANT_LAWS:" in ai_analysis:
-            laws_text = ai_analysis.split("RELEVANT_LAWS:")[1].strip()
-            # Extract each law line (they should be markdown links)
-            for line in laws_text.split("\n"):
-                if line.strip() and (line.strip().startswith('-') or '[§' in line):
-                    relevant_laws.append(line.strip().lstrip('- '))
-        
-        logging.info(f"Parsed relevant laws: {relevant_laws}")
-        
-        # Create analysis document
-        analysis = ContractAnalysis(
-            filename=file.filename,
-            extracted_text=extracted_text,
-            document_type=doc_type,
-            risk_level=risk_level,
-            risk_confidence=risk_confidence,
-            scam_confidence=scam_confidence,
-            legal_risk_confidence=legal_risk_confidence,
-            page_count=page_count,
-            is_likely_scam=is_likely_scam,
-            scam_indicators=scam_indicators,
-            risk_explanation=risk_explanation,
-            clauses_safe=clauses_safe,
-            clauses_attention=clauses_attention,
-            clauses_violates=clauses_violates,
-            summary=summary,
-            recommendations=recommendations,
-            relevant_laws=relevant_laws,
-            key_excerpts=key_excerpts
+            try:
+                extracted_text, page_count = await extraction_executor.extract(upload.path, upload.filename, on_progress=ocr_progress)
+            except ExtractionError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if extracted_text.strip():
+                await extraction_cache.set(cache_key, extracted_text, page_count)
+        extract_span.set("pages", page_count)
+    
+    if not extracted_text.strip():
+        raise HTTPException(status_code=400, detail="Could not extract text from file. The file may be empty or corrupted.")
+    
+    logging.info(f"Extracted {len(extracted_text)} characters from {page_count} pages/sections")
+    
+    # Split the whole document into token-sized sections along its structure
+    text_chunks = await timed("chunk", asyncio.to_thread(analysis_chunks, extracted_text))
+    logging.info(f"Split document into {len(text_chunks)} chunks")
+    
+    # Risk assessment, clause scan and per-chunk analyses are independent,
+    # so run them as parallel stages; the LLM scheduler bounds in-flight calls.
+    risk, rules, sections, contract_index = await asyncio.gather(
+        assess_risk(extracted_text, use_cache=not no_cache),
+        timed("rules", asyncio.to_thread(scan_rules, extracted_text)),
+        timed("sections", analyze_chunks_incremental(text_chunks, use_cache=not no_cache, progress=progress), chunks=len(text_chunks)),
+        timed("index", asyncio.to_thread(build_contract_index, extracted_text))
+    )
+    chunk_analyses = sections["section_summaries"]
+    section_count = len(chunk_analyses)
+    degraded = risk is None
+    if degraded:
+        risk = rule_based_risk(rules)
+    clauses_safe = rules["clauses_safe"]
+    clauses_attention = rules["clauses_attention"]
+    clauses_violates = rules["clauses_violates"]
+    
+    # AI-reported indicators first, then pattern hits the AI did not already name
+    scam_indicators = risk["scam_indicators"] + [
+        ind for ind in rules["scam_indicators"]
+        if ind["indicator"] not in {i["indicator"] for i in risk["scam_indicators"]}
+    ]
+    
+    scam_confidence = risk["scam_confidence"]
+    legal_risk_confidence = risk["legal_risk_confidence"]
+    
+    # Determine if it's a scam based on AI confidence
+    is_likely_scam = scam_confidence >= 70
+    
+    logging.info(f"AI Assessment - Scam: {scam_confidence}%, Legal Risk: {legal_risk_confidence}%, Is Scam: {is_likely_scam}")
+    
+    risk_level, risk_confidence = determine_risk_level(scam_confidence, legal_risk_confidence, clauses_attention, clauses_violates)
+    
+    logging.info(f"FINAL RISK LEVEL: {risk_level.upper()} ({risk_confidence}% confidence) - Scam: {scam_confidence}%, Legal: {legal_risk_confidence}%, Violations: {len(clauses_violates)}, Attention: {len(clauses_attention)}")
+    
+    # Merge all chunk analyses into final summary WITH MASKED LAW LINKS
+    await progress("merging")
+    chunk_analyses = await timed("reduce", reduce_section_summaries(chunk_analyses, use_cache=not no_cache))
+    merged_prompt = prompt_registry.render(
+        "merge_analysis",
+        section_count=section_count,
+        findings=chr(10).join(chunk_analyses),
+        safe_count=len(clauses_safe),
+        attention_count=len(clauses_attention),
+        violation_count=len(clauses_violates)
+    )
+    
+    try:
+        ai_analysis = await llm.send(MERGE_SYSTEM_MESSAGE, merged_prompt, use_cache=not no_cache, operation="merge_analysis")
+        final = parse_final_analysis(ai_analysis)
+    except (LlmUnavailable, LlmError, asyncio.TimeoutError) as e:
+        # Fall back to a report built from the regex clause analysis only
+        logging.warning(f"AI summary unavailable, returning pattern-based analysis: {str(e) or type(e).__name__}")
+        degraded = True
+        final = parse_final_analysis("")
+        final["summary"] = (
+            f"AI analysis is temporarily unavailable. Pattern matching found {len(clauses_violates)} potentially "
+            f"violating and {len(clauses_attention)} attention-worthy clauses. Please analyze the document again later for a full summary."
         )
-        
-        # Store in database
-        doc = analysis.model_dump()
-        doc['timestamp'] = doc['timestamp'].isoformat()
+        final["relevant_laws"] = list(dict.fromkeys(
+            f"[{clause['law']}]({clause['law_link']})" for clause in clauses_violates + clauses_attention if clause["law_link"] != "#"
+        ))[:3]
+    
+    # Create analysis document
+    analysis = ContractAnalysis(
+        filename=upload.filename,
+        extracted_text=extracted_text,
+        document_type=final["document_type"],
+        risk_level=risk_level,
+        risk_confidence=risk_confidence,
+        scam_confidence=scam_confidence,
+        legal_risk_confidence=legal_risk_confidence,
+        page_count=page_count,
+        is_likely_scam=is_likely_scam,
+        scam_indicators=scam_indicators,
+        risk_explanation=risk["risk_explanation"],
+        clauses_safe=clauses_safe,
+        clauses_attention=clauses_attention,
+        clauses_violates=clauses_violates,
+        summary=final["summary"],
+        recommendations=final["recommendations"],
+        relevant_laws=final["relevant_laws"],
+        key_excerpts=final["key_excerpts"],
+        chunk_fingerprints=sections["chunk_fingerprints"],
+        chunk_analyses=sections["chunk_analyses"],
+        changed_sections=sections["changed_sections"],
+        sections=sections["sections"],
+        previous_analysis_id=sections["previous_analysis_id"],
+        degraded=degraded
+    )
+    
+    # Store in database
+    await progress("saving")
+    doc = analysis.model_dump()
+    doc['timestamp'] = doc['timestamp'].isoformat()
+    doc['text_length'] = len(doc.pop('extracted_text'))
+    with span("save"):
+        await contract_texts.save(analysis.id, extracted_text)
         await db.contract_analyses.insert_one(doc)
-        
-        return analysis
+        await save_contract_index(analysis.id, contract_index)
+    
+    return analysis
+
+@api_router.post("/contract/analyze")
+async def analyze_contract(request: Request, file: UploadFile = File(...), no_cache: bool = False):
+    upload = None
+    try:
+        check_content_length(request.headers.get("content-length"), UPLOAD_MAX_BYTES)
+        upload = await store_upload(file, UPLOAD_DIR, UPLOAD_MAX_BYTES)
+        return await run_analysis_pipeline(upload, no_cache=no_cache)
     except HTTPException:
         raise
+    except asyncio.TimeoutError:
+        logging.error("Contract analysis error: LLM request timed out")
+        raise HTTPException(status_code=504, detail="AI analysis timed out. Please try again.")
     except Exception as e:
         logging.error(f"Contract analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if upload:
+            upload.remove()
+
+def job_upload(job: dict) -> StoredUpload:
+    return StoredUpload(
+        path=job["upload_path"],
+        filename=job["filename"],
+        sha256=job["upload_sha256"],
+        size=job["upload_size"]
+    )
+
+async def run_analysis_job(job: dict, progress) -> str:
+    """
+    AnalysisJobQueue runner: analyze the stored upload of a job, return the analysis id.
+    The upload is kept until the job is finished (see remove_job_upload), since a busy
+    extraction pool (503) is retried and interrupted jobs are run again.
+    """
+    try:
+        analysis = await run_analysis_pipeline(job_upload(job), no_cache=job.get("no_cache", False), progress=progress)
+        return analysis.id
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="AI analysis timed out. Please try again.")
+
+def remove_job_upload(job: dict):
+    job_upload(job).remove()
+
+# Analysis jobs run inside this process ("inprocess") or in worker.py ("external")
+ANALYSIS_JOB_MODE = os.environ.get('ANALYSIS_JOB_MODE', 'inprocess')
+analysis_jobs = AnalysisJobQueue(
+    db.analysis_jobs,
+    run_analysis_job,
+    concurrency=int(os.environ.get('ANALYSIS_JOB_CONCURRENCY', '2')),
+    cleanup=remove_job_upload,
+    max_attempts=int(os.environ.get('ANALYSIS_JOB_MAX_ATTEMPTS', '5'))
+)
+
+@api_router.post("/contract/jobs", status_code=202)
+async def create_analysis_job(request: Request, file: UploadFile = File(...), no_cache: bool = False):
+    """Queue a contract analysis and return immediately with a job id to poll"""
+    check_content_length(request.headers.get("content-length"), UPLOAD_MAX_BYTES)
+    upload = await store_upload(file, UPLOAD_DIR, UPLOAD_MAX_BYTES)
+    try:
+        job = await analysis_jobs.create(
+            filename=upload.filename,
+            upload_path=upload.path,
+            upload_sha256=upload.sha256,
+            upload_size=upload.size,
+            no_cache=no_cache
+        )
+    except Exception as e:
+        upload.remove()
+        logging.error(f"Create analysis job error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if ANALYSIS_JOB_MODE == "inprocess":
+        analysis_jobs.start_in_process(job["id"])
+    
+    return {"job_id": job["id"], "status": job["status"]}
+
+@api_router.get("/contract/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    """Job status with stage progress; includes the final analysis once completed"""
+    job = await analysis_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    
+    response = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": job.get("progress", {}),
+        "message": job.get("message", job["stage"]),
+        "error": job.get("error"),
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "result": None
+    }
+    if job.get("result_id"):
+        response["result"] = await load_contract_analysis(job["result_id"])
+    return response
+
+def projection_includes(projection: dict, field: str) -> bool:
+    included = [name for name, value in projection.items() if value and name != "_id"]
+    if included:
+        return field in included
+    return projection.get(field, 1) != 0
+
+async def load_contract_analysis(contract_id: str, projection: dict = None):
+    """
+    Analysis document by id, or None. extracted_text is read from the text store
+    only when the projection asks for it (older analyses still carry it inline).
+    """
+    projection = projection or {"_id": 0}
+    analysis = await db.contract_analyses.find_one({"id": contract_id}, projection)
+    if analysis is not None and "extracted_text" not in analysis and projection_includes(projection, "extracted_text"):
+        analysis["extracted_text"] = await contract_texts.load(contract_id) or ""
+    return analysis
+
+def analysis_projection(fields: Optional[str], exclude: Optional[str]) -> dict:
+    """
+    Mongo projection for comma-separated `fields` (only these) or `exclude` (all but these),
+    e.g. exclude=extracted_text for the report without the document text
+    """
+    if fields and exclude:
+        raise HTTPException(status_code=400, detail="Pass either 'fields' or 'exclude', not both")
+    names = [name.strip() for name in (fields or exclude or "").split(",") if name.strip()]
+    unknown = [name for name in names if name not in ContractAnalysis.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown analysis fields: {', '.join(unknown)}")
+    
+    projection = {"_id": 0}
+    if fields:
+        projection.update({name: 1 for name in names}, id=1)
+    elif exclude:
+        projection.update({name: 0 for name in names if name != "id"})
+    return projection
 
 @api_router.get("/contract/{contract_id}")
-async def get_contract_analysis(contract_id: str):
-    analysis = await db.contract_analyses.find_one({"id": contract_id}, {"_id": 0})
+async def get_contract_analysis(contract_id: str, fields: Optional[str] = None, exclude: Optional[str] = None):
+    analysis = await load_contract_analysis(contract_id, analysis_projection(fields, exclude))
     if not analysis:
         raise HTTPException(status_code=404, detail="Contract analysis not found")
     return analysis
 
 @api_router.get("/contract/{contract_id}/download")
-async def download_contract_pdf(contract_id: str):
-    analysis = await db.contract_analyses.find_one({"id": contract_id}, {"_id": 0})
+async def download_contract_pdf(contract_id: str, request: Request):
+    """
+    PDF report for an analysis. Reports are rendered once in the worker pool and
+    cached; clients revalidate with If-None-Match and get 304 while unchanged.
+    """
+    etag = report_etag(contract_id)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": f"attachment; filename=LegalMe_Report_{contract_id[:8]}.pdf"
+    }
+    analysis = await load_contract_analysis(contract_id, {"_id": 0, "extracted_text": 0, "chunk_analyses": 0, "chunk_fingerprints": 0})
     if not analysis:
         raise HTTPException(status_code=404, detail="Contract analysis not found")
     
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    pdf_bytes = await report_cache.get(contract_id)
+    if pdf_bytes is not None:
+        return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
+    
     try:
-        pdf_buffer = generate_contract_pdf(analysis)
-        
-        from fastapi.responses import StreamingResponse
-        return StreamingResponse(
-            pdf_buffer,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename=LegalMe_Report_{contract_id[:8]}.pdf"
-            }
-        )
+        pdf_bytes = await timed("render_pdf", extraction_executor.run(render_contract_pdf, analysis))
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"PDF generation error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"PDF generation failed: {str(e)}")
+    
+    try:
+        await report_cache.set(contract_id, pdf_bytes)
+    except Exception as e:
+        # The report is rendered; it is just not cached for the next download
+        logging.warning(f"Could not cache PDF report for {contract_id}: {str(e)}")
+    
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
+
+@api_router.get("/prompts/stats")
+async def get_prompt_stats():
+    """Version, dynamic slots and static token count of each prompt template"""
+    return prompt_registry.stats()
+
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters for the server-side caches"""
+    return {
+        "extraction": extraction_cache.stats(),
+        "llm": llm.cache.stats() if llm.cache else {"enabled": False},
+        "reports": report_cache.stats()
+    }
+
+EXTRACTION_PENDING = REGISTRY.gauge("legalme_extraction_pending", "Documents running or queued in the extraction pool")
+LLM_CIRCUIT_OPEN = REGISTRY.gauge("legalme_llm_circuit_open", "1 while the LLM circuit breaker rejects calls")
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    EXTRACTION_PENDING.set(extraction_executor.pending)
+    LLM_CIRCUIT_OPEN.set(0 if llm.available() else 1)
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
 
 @api_router.get("/alternatives/{category}")
 async def get_alternatives(category: str):
@@ -1061,45 +1270,49 @@ async def get_alternatives(category: str):
     return alt
 
 @api_router.get("/chat/history")
-async def get_chat_history():
-    """Get all unique chat sessions"""
+async def get_chat_history(response: Response, limit: int = 50, before: Optional[str] = None):
+    """
+    Chat sessions, most recent first. Pass the X-Next-Cursor response header
+    back as `before` to load the next page.
+    """
     try:
-        pipeline = [
-            {"$sort": {"timestamp": -1}},
-            {"$group": {
-                "_id": "$session_id",
-                "last_message": {"$first": "$user_message"},
-                "timestamp": {"$first": "$timestamp"}
-            }},
-            {"$sort": {"timestamp": -1}},
-            {"$limit": 50}
-        ]
-        
-        sessions = await db.chat_messages.aggregate(pipeline).to_list(50)
-        
-        result = []
-        for session in sessions:
-            result.append({
-                "session_id": session["_id"],
-                "preview": session["last_message"][:60] + "..." if len(session["last_message"]) > 60 else session["last_message"],
-                "timestamp": session["timestamp"]
-            })
+        sessions, next_cursor = await chat_sessions.page(clamp_limit(limit, 200), before)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
         
-        return result
+        return [
+            {
+                "session_id": session["session_id"],
+                "name": session.get("title"),
+                "preview": session["preview"],
+                "timestamp": session["timestamp"],
+                "message_count": session.get("message_count", 0)
+            }
+            for session in sessions
+        ]
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Chat history error: {str(e)}")
         return []
 
 @api_router.get("/chat/{session_id}/messages")
-async def get_session_messages(session_id: str):
-    """Get all messages for a specific session"""
+async def get_session_messages(session_id: str, response: Response, limit: int = 1000, before: Optional[str] = None, after: Optional[str] = None):
+    """
+    Messages of a session, oldest first: the latest `limit` by default, or the page
+    before / after a cursor. X-Next-Cursor continues in the same direction. The
+    default limit matches the 1000 messages this endpoint returned before pagination.
+    """
     try:
-        messages = await db.chat_messages.find(
-            {"session_id": session_id},
-            {"_id": 0}
-        ).sort("timestamp", 1).to_list(1000)
+        messages, next_cursor = await keyset_page(
+            db.chat_messages, {"session_id": session_id}, clamp_limit(limit, 1000), before, after
+        )
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
         
         return messages
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Session messages error: {str(e)}")
         return []
@@ -1112,12 +1325,9 @@ async def rename_session(session_id: str, request: dict):
         if not new_name:
             raise HTTPException(status_code=400, detail="Name is required")
         
-        result = await db.chat_messages.update_many(
-            {"session_id": session_id},
-            {"$set": {"session_name": new_name}}
-        )
+        updated = await chat_sessions.rename(session_id, new_name)
         
-        return {"success": True, "updated": result.modified_count}
+        return {"success": True, "updated": int(updated)}
     except HTTPException:
         raise
     except Exception as e:
@@ -1129,36 +1339,41 @@ async def delete_session(session_id: str):
     """Delete a chat session"""
     try:
         result = await db.chat_messages.delete_many({"session_id": session_id})
+        await chat_sessions.delete(session_id)
+        await session_memory.delete(session_id)
         return {"success": True, "deleted": result.deleted_count}
     except Exception as e:
         logging.error(f"Delete session error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.post("/contract/{contract_id}/chat", response_model=ChatResponse)
-async def contract_chat(contract_id: str, request: ChatRequest):
-    """Chat about a specific contract"""
-    try:
-        # Get contract analysis
-        analysis = await db.contract_analyses.find_one({"id": contract_id}, {"_id": 0})
-        if not analysis:
-            raise HTTPException(status_code=404, detail="Contract not found")
-        
-        # Load conversation history for this contract chat
-        chat_history = await db.contract_chats.find(
-            {"contract_id": contract_id, "session_id": request.session_id},
-            {"_id": 0}
-        ).sort("timestamp", 1).to_list(50)
-        
-        # Build conversation context
-        chat_context = ""
-        if chat_history:
-            chat_context = "\n\nPREVIOUS QUESTIONS ABOUT THIS CONTRACT:\n"
-            for msg in chat_history[-5:]:  # Last 5 messages
-                chat_context += f"User asked: {msg['user_message']}\n"
-                chat_context += f"You answered: {msg['ai_response'][:150]}...\n\n"
-        
-        # Create context with contract details
-        contract_context = f"""
+async def get_contract_chat_context(contract_id: str) -> dict:
+    """
+    Per-contract chat context: the rendered analysis header plus the passage index.
+    Cached per process; raises 404 if the contract does not exist.
+    """
+    cached = contract_context_cache.get(contract_id)
+    if cached:
+        return cached
+    
+    analysis = await db.contract_analyses.find_one(
+        {"id": contract_id},
+        {"_id": 0, "document_type": 1, "risk_level": 1, "summary": 1, "recommendations": 1,
+         "clauses_safe": 1, "clauses_attention": 1, "clauses_violates": 1}
+    )
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Contract not found")
+    
+    # Passages are stored as offsets; their text comes from the stored document
+    text_doc = await load_contract_analysis(contract_id, {"_id": 0, "extracted_text": 1})
+    text = (text_doc or {}).get("extracted_text", "")
+    index = await contract_indexes.load(contract_id)
+    if not index or index.get("version") != RETRIEVAL_INDEX_VERSION:
+        # Analyses saved before the index existed (or with an older format) are indexed on first use
+        index = await asyncio.to_thread(build_contract_index, text)
+        await save_contract_index(contract_id, index)
+    index = attach_text(index, text)
+    
+    header = f"""
 CONTRACT CONTEXT:
 Type: {analysis.get('document_type', 'unknown')}
 Risk Level: {analysis.get('risk_level', 'unknown')}
@@ -1169,100 +1384,115 @@ Attention Clauses: {len(analysis.get('clauses_attention', []))}
 Violating Clauses: {len(analysis.get('clauses_violates', []))}
 
 Recommendations: {analysis.get('recommendations', '')}
-
-Contract Text (excerpt):
-{analysis.get('extracted_text', '')[:1500]}
 """
-        
-        law_context = "\\n".join([f"- {law['title']}: {law['description']}" for law in LAW_DATABASE])
-        
-        system_message = f"""You are LegalMe, a professional German legal assistant analyzing a specific contract.
-
-CONTRACT YOU ARE ANALYZING:
-{contract_context}
-
-CRITICAL: LINK FORMATTING (MANDATORY):
-- ALWAYS use markdown links: [Text](URL)
-- NEVER use HTML <a> tags or raw URLs
-- Every law MUST be a masked link
-- Example: [§ 551 BGB – Rental Deposit](https://www.gesetze-im-internet.de/bgb/__551.html)
-
-OFFICIAL GERMAN LAW SOURCES:
-- BGB sections: https://www.gesetze-im-internet.de/bgb/__[section].html
-- Available laws: {law_context}
-
-MANDATORY FOR EVERY RESPONSE:
-1. Answer the user's question about THIS specific contract
-2. Reference exact clauses from the analysis
-3. Cite relevant German laws with official links
-4. Include "Relevant Laws" section with masked links
-5. Professional formatting with headers, bullets
+    context = {"header": header, "index": index}
+    contract_context_cache[contract_id] = context
+    return context
 
-RESPONSE FORMAT:
-[Your answer referencing specific contract clauses]
-
----
-
-## Relevant Laws
-- [§ XXX BGB – Description](official_url)
-
----
-
-## Next Steps
-### 1. [Relevant action]
-[Masked Link](url)
-
-CONVERSATION MEMORY FOR THIS CONTRACT:
-{chat_context}
-
-IMPORTANT:
-- Remember what the user already asked about THIS contract
-- Don't repeat information from previous answers
-- Reference previous Q&A if relevant
-- Keep the conversation flowing naturally
+async def build_contract_chat_system_message(contract_id: str, request: ChatRequest) -> str:
+    """System prompt for chatting about one analyzed contract. Raises 404 if it does not exist"""
+    context = await get_contract_chat_context(contract_id)
+    
+    # Load conversation history for this contract chat
+    chat_history = await db.contract_chats.find(
+        {"contract_id": contract_id, "session_id": request.session_id},
+        {"_id": 0, "user_message": 1, "ai_response": 1}
+    ).sort([("timestamp", -1), ("id", -1)]).limit(5).to_list(5)  # Last 5 messages
+    chat_history.reverse()
+    
+    # Build conversation context
+    chat_context = ""
+    if chat_history:
+        chat_context = "\n\nPREVIOUS QUESTIONS ABOUT THIS CONTRACT:\n"
+        for msg in chat_history:
+            chat_context += f"User asked: {msg['user_message']}\n"
+            chat_context += f"You answered: {msg['ai_response'][:150]}...\n\n"
+    
+    # Contract details plus the passages most relevant to the question
+    passages = select_passages(context["index"], request.message, token_budget=RETRIEVAL_TOKEN_BUDGET, top_k=RETRIEVAL_TOP_K)
+    passage_text = "\n\n".join(f"[{passage_label(context['index'], position)}]\n{text}" for position, text in passages)
+    contract_context = f"""{context["header"]}
+Relevant Contract Text (passages matching the question):
+{passage_text}
+"""
+    
+    system_message = prompt_registry.render(
+        "contract_chat_system",
+        contract_context=contract_context,
+        chat_context=chat_context,
+        question=request.message
+    )
+    
+    return system_message
+
+async def save_contract_chat_message(contract_id: str, session_id: str, user_message: str, ai_response: str) -> dict:
+    chat_doc = {
+        "id": str(uuid.uuid4()),
+        "contract_id": contract_id,
+        "session_id": session_id,
+        "user_message": user_message,
+        "ai_response": ai_response,
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+    await db.contract_chats.insert_one(chat_doc)
+    return chat_doc
 
-User's current question: {request.message}"""
-        
-        # Initialize chat with memory
-        chat_client = LlmChat(
-            api_key=groq_api_key,
-            session_id=f"contract_{contract_id}_{request.session_id}",
-            system_message=system_message
-        )
-        chat_client.with_model("groq", "llama-3.3-70b-versatile")
+@api_router.post("/contract/{contract_id}/chat", response_model=ChatResponse)
+async def contract_chat(contract_id: str, request: ChatRequest):
+    """Chat about a specific contract"""
+    try:
+        system_message = await build_contract_chat_system_message(contract_id, request)
         
         # Send message
-        user_msg = UserMessage(text=request.message)
-        ai_response = await chat_client.send_message(user_msg)
+        ai_response = await llm.send(system_message, request.message, operation="contract_chat")
         
         # Store in contract chat history
-        chat_doc = {
-            "id": str(uuid.uuid4()),
-            "contract_id": contract_id,
-            "session_id": request.session_id,
-            "user_message": request.message,
-            "ai_response": ai_response,
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
-        await db.contract_chats.insert_one(chat_doc)
+        await save_contract_chat_message(contract_id, request.session_id, request.message, ai_response)
         
         return ChatResponse(response=ai_response, session_id=request.session_id)
     except HTTPException:
         raise
+    except (LlmUnavailable, LlmError) as e:
+        logging.error(f"Contract chat error: {str(e)}")
+        raise llm_failure(e)
+    except asyncio.TimeoutError:
+        logging.error("Contract chat error: LLM request timed out")
+        raise HTTPException(status_code=504, detail="AI response timed out. Please try again.")
     except Exception as e:
         logging.error(f"Contract chat error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/contract/{contract_id}/chat/stream")
+async def contract_chat_stream(contract_id: str, request: ChatRequest):
+    """Streaming variant of /contract/{contract_id}/chat using Server-Sent Events"""
+    if not llm.available():
+        raise llm_failure(LlmUnavailable(llm.breaker.retry_after()))
+    try:
+        system_message = await build_contract_chat_system_message(contract_id, request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Contract chat error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def persist(ai_response):
+        return await save_contract_chat_message(contract_id, request.session_id, request.message, ai_response)
+    
+    return sse_response(stream_reply(system_message, request.message, persist, operation="contract_chat_stream"))
+
 @api_router.get("/contract/{contract_id}/chat/history")
-async def get_contract_chat_history(contract_id: str, session_id: str):
-    """Get chat history for a contract"""
+async def get_contract_chat_history(contract_id: str, session_id: str, response: Response, limit: int = 1000, before: Optional[str] = None, after: Optional[str] = None):
+    """Chat history for a contract, paginated like /chat/{session_id}/messages"""
     try:
-        messages = await db.contract_chats.find(
-            {"contract_id": contract_id, "session_id": session_id},
-            {"_id": 0}
-        ).sort("timestamp", 1).to_list(1000)
+        messages, next_cursor = await keyset_page(
+            db.contract_chats, {"contract_id": contract_id, "session_id": session_id}, clamp_limit(limit, 1000), before, after
+        )
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
         
         return messages
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Contract chat history error: {str(e)}")
         return []
@@ -1275,14 +1505,54 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+# Per-route latency histograms for /metrics
+app.add_middleware(MetricsMiddleware)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+# Optional trace export, e.g. OTEL_EXPORTER_OTLP_ENDPOINT=http://localhost:4318
+if os.environ.get('OTEL_EXPORTER_OTLP_ENDPOINT'):
+    configure_tracing(os.environ['OTEL_EXPORTER_OTLP_ENDPOINT'], os.environ.get('OTEL_SERVICE_NAME', 'legalme-backend'))
+
+# Opt-in detection of callbacks that block the event loop (for staging)
+loop_watchdog = LoopWatchdog(
+    threshold=float(os.environ.get('LOOP_WATCHDOG_THRESHOLD_MS', '100')) / 1000,
+    interval=float(os.environ.get('LOOP_WATCHDOG_INTERVAL_MS', '50')) / 1000
+) if os.environ.get('LOOP_WATCHDOG', 'false').lower() == 'true' else None
+
+@app.on_event("startup")
+async def start_loop_watchdog():
+    if loop_watchdog:
+        loop_watchdog.start(asyncio.get_running_loop())
+
+@app.on_event("startup")
+async def prepare_database():
+    if os.environ.get('MONGO_ENSURE_INDEXES', 'true').lower() == 'true':
+        await ensure_indexes(db)
+    try:
+        await chat_sessions.backfill(db.chat_messages)
+    except Exception as e:
+        logging.error(f"Chat session backfill failed: {str(e)}")
+    if os.environ.get('MONGO_QUERY_AUDIT', 'false').lower() == 'true':
+        await audit_query_shapes(db)
+
+@app.on_event("startup")
+async def resume_analysis_jobs():
+    # Picks up jobs left queued or running by a previous process, and retries stale ones
+    if ANALYSIS_JOB_MODE == "inprocess":
+        analysis_jobs.start_worker_in_process()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    if loop_watchdog:
+        await loop_watchdog.stop()
+    client.close()
+    extraction_executor.shutdown()
+    await llm.close()
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+Rolling conversation memory for the general chat.
+
+Each session keeps an LLM-written summary of its older turns (the `session_memory`
+collection) plus the most recent turns verbatim. After a reply is saved, turns that
+have fallen out of the verbatim window are folded into the summary in the background,
+a batch at a time, so the chat prompt stays bounded however long the session gets.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from pagination import encode_cursor, keyset_filter
+
+SUMMARY_SYSTEM_MESSAGE = "You maintain a concise running summary of a legal help conversation."
+
+SUMMARY_PROMPT = """Current summary of the earlier conversation:
+{summary}
+
+Newer turns to fold into the summary:
+{turns}
+
+Rewrite the summary so it also covers the newer turns. Keep the user's situation, facts
+they stated (dates, amounts, contract type), questions asked, laws cited and advice
+already given. At most 200 words, plain text, no preamble."""
+
+
+def format_turns(turns: list, max_chars: int) -> str:
+    lines = []
+    for turn in turns:
+        answer = turn['ai_response']
+        if len(answer) > max_chars:
+            answer = answer[:max_chars] + "..."
+        lines.append(f"User: {turn['user_message']}\nAssistant: {answer}")
+    return "\n\n".join(lines)
+
+
+class SessionMemory:
+    """
+    `recent_turns` turns are always given verbatim; once `summary_batch` more have
+    accumulated, the oldest ones are summarized. A prompt therefore holds the summary
+    and at most recent_turns + summary_batch turns.
+    """
+
+    def __init__(self, collection, messages_collection, llm, recent_turns: int = 6, summary_batch: int = 4, turn_chars: int = 1000):
+        self.collection = collection
+        self.messages = messages_collection
+        self.llm = llm
+        self.recent_turns = recent_turns
+        self.summary_batch = summary_batch
+        self.turn_chars = turn_chars
+        self._refreshing = set()
+        self._tasks = set()
+
+    def _unsummarized(self, session_id: str, memory: dict) -> dict:
+        query = {"session_id": session_id}
+        if memory and memory.get("summarized_until"):
+            query = {"$and": [query, keyset_filter(memory["summarized_until"], "after")]}
+        return query
+
+    async def _memory(self, session_id: str):
+        return await self.collection.find_one({"session_id": session_id}, {"_id": 0})
+
+    async def context(self, session_id: str) -> tuple:
+        """(summary, recent turns oldest first) for building the chat prompt"""
+        memory = await self._memory(session_id)
+        window = self.recent_turns + self.summary_batch
+        turns = await self.messages.find(
+            self._unsummarized(session_id, memory),
+            {"_id": 0, "user_message": 1, "ai_response": 1}
+        ).sort([("timestamp", -1), ("id", -1)]).limit(window).to_list(window)
+        turns.reverse()
+        return (memory or {}).get("summary", ""), turns
+
+    def render(self, summary: str, turns: list) -> str:
+        parts = []
+        if summary:
+            parts.append(f"SUMMARY OF EARLIER CONVERSATION:\n{summary}")
+        if turns:
+            parts.append(f"RECENT MESSAGES:\n{format_turns(turns, self.turn_chars)}")
+        return "\n\n".join(parts)
+
+    async def refresh(self, session_id: str):
+        """Fold turns beyond the verbatim window into the summary, if a full batch is pending"""
+        memory = await self._memory(session_id)
+        query = self._unsummarized(session_id, memory)
+        pending = await self.messages.count_documents(query, limit=self.recent_turns + self.summary_batch)
+        if pending < self.recent_turns + self.summary_batch:
+            return
+
+        fold = await self.messages.find(
+            query, {"_id": 0, "id": 1, "timestamp": 1, "user_message": 1, "ai_response": 1}
+        ).sort([("timestamp", 1), ("id", 1)]).limit(pending - self.recent_turns).to_list(None)
+        previous_summary = (memory or {}).get("summary", "")
+        summary = await self.llm.send(
+            SUMMARY_SYSTEM_MESSAGE,
+            SUMMARY_PROMPT.format(summary=previous_summary or "(none yet)", turns=format_turns(fold, self.turn_chars)),
+            operation="session_summary"
+        )
+
+        # Only apply if no other process folded these turns in the meantime
+        await self.collection.update_one(
+            {"session_id": session_id, "summarized_until": (memory or {}).get("summarized_until")},
+            {"$set": {
+                "session_id": session_id,
+                "summary": summary.strip(),
+                "summarized_until": encode_cursor(fold[-1]["timestamp"], fold[-1]["id"]),
+                "summarized_count": (memory or {}).get("summarized_count", 0) + len(fold),
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }},
+            upsert=memory is None
+        )
+
+    async def _refresh_safely(self, session_id: str):
+        try:
+            await self.refresh(session_id)
+        except Exception as e:
+            # The verbatim window still covers recent turns; the next reply retries
+            logging.warning(f"Session memory refresh failed for {session_id}: {str(e)}")
+        finally:
+            self._refreshing.discard(session_id)
+
+    def schedule_refresh(self, session_id: str):
+        """Refresh in the background; at most one refresh per session at a time"""
+        if session_id in self._refreshing:
+            return
+        self._refreshing.add(session_id)
+        task = asyncio.create_task(self._refresh_safely(session_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def delete(self, session_id: str):
+        await self.collection.delete_one({"session_id": session_id})
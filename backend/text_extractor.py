@@ -0,0 +1,219 @@
+"""
+Text extraction for uploaded documents.
+Kept free of FastAPI / database imports so it can run inside extraction worker processes.
+All extractors read from a file path, so uploads never need to be held in memory as bytes.
+"""
+import logging
+import os
+import re
+
+import pytesseract
+from PIL import Image
+from PyPDF2 import PdfReader
+from docx import Document
+from pdf2image import convert_from_path
+from pptx import Presentation
+from openpyxl import load_workbook
+from odf import text as odf_text, teletype
+from odf.opendocument import load as odf_load
+
+
+# Bump whenever extraction output changes so cached results are not reused
+EXTRACTOR_VERSION = "4"
+
+# OCR settings - Tesseract needs the matching language packs (tesseract-ocr-deu)
+OCR_LANG = os.environ.get('OCR_LANG', 'deu+eng')
+OCR_DPI = int(os.environ.get('OCR_DPI', '200'))
+OCR_RETRY_DPI = int(os.environ.get('OCR_RETRY_DPI', '300'))
+OCR_MIN_PAGE_CHARS = int(os.environ.get('OCR_MIN_PAGE_CHARS', '20'))
+OCR_PAGE_WINDOW = int(os.environ.get('OCR_PAGE_WINDOW', '4'))
+
+
+# Written between pages by format_pages
+PAGE_MARKER = re.compile(r"\n--- Page (\d+) ---\n")
+
+
+class ExtractionError(Exception):
+    """Raised when a file cannot be turned into text; mapped to HTTP 400 by the API"""
+
+
+def extract_pdf_text(path: str) -> tuple:
+    """
+    Extract the embedded text layer of a PDF.
+    Returns: (extracted_text, page_count)
+    """
+    pdf_reader = PdfReader(path)
+    page_count = len(pdf_reader.pages)
+    pages = []
+    
+    for page_number, page in enumerate(pdf_reader.pages, start=1):
+        page_text = page.extract_text()
+        if page_text and page_text.strip():
+            pages.append((page_number, page_text))
+    
+    return format_pages(pages), page_count
+
+def pdf_needs_ocr(extracted_text: str) -> bool:
+    """A PDF with (almost) no text layer is likely a scan"""
+    return len(PAGE_MARKER.sub("", extracted_text).strip()) < 50
+
+def ocr_pdf_window(path: str, first_page: int, last_page: int, dpi: int = OCR_DPI, lang: str = OCR_LANG) -> list:
+    """
+    OCR pages first_page..last_page (1-based, inclusive) of a PDF.
+    Only this window is rasterized, and each page image is released right after OCR.
+    Pages that come back (nearly) empty are re-rendered once at OCR_RETRY_DPI.
+    Returns: [(page_number, text), ...]
+    """
+    images = convert_from_path(path, dpi=dpi, first_page=first_page, last_page=last_page)
+    results = []
+    page_number = first_page
+    while images:
+        image = images.pop(0)
+        try:
+            text = pytesseract.image_to_string(image, lang=lang)
+        finally:
+            image.close()
+        
+        if len(text.strip()) < OCR_MIN_PAGE_CHARS and OCR_RETRY_DPI > dpi:
+            retry_images = convert_from_path(path, dpi=OCR_RETRY_DPI, first_page=page_number, last_page=page_number)
+            for retry_image in retry_images:
+                try:
+                    text = pytesseract.image_to_string(retry_image, lang=lang)
+                finally:
+                    retry_image.close()
+        
+        results.append((page_number, text))
+        page_number += 1
+    return results
+
+def page_windows(page_count: int, window: int = OCR_PAGE_WINDOW) -> list:
+    """Split 1..page_count into [(first_page, last_page), ...] windows"""
+    window = max(1, window)
+    return [(first, min(first + window - 1, page_count)) for first in range(1, page_count + 1, window)]
+
+def format_pages(pages: list) -> str:
+    """Join (page_number, text) pairs with the page markers the chunker uses for page metadata"""
+    return "".join(f"\n--- Page {page_number} ---\n{text}\n" for page_number, text in pages)
+
+def read_text_file(path: str) -> str:
+    with open(path, 'rb') as f:
+        content = f.read()
+    try:
+        return content.decode('utf-8', errors='ignore')
+    except:
+        return content.decode('latin-1', errors='ignore')
+
+def extract_text_from_file(path: str, filename: str) -> tuple:
+    """
+    Extract text from ANY file type (PDF, DOCX, TXT, Images, XLSX, PPTX, etc.)
+    `path` is the uploaded file on disk; `filename` is the client-supplied name used to pick the parser.
+    Returns: (extracted_text, page_count)
+    Handles files of any size with chunking and OCR
+    """
+    file_ext = filename.lower().split('.')[-1]
+    
+    try:
+        # PDF files
+        if file_ext == 'pdf':
+            # Try regular text extraction first
+            extracted_text, page_count = extract_pdf_text(path)
+            
+            # If no text extracted, it's likely a scanned PDF - use OCR window by window
+            if pdf_needs_ocr(extracted_text):
+                logging.info("PDF has no text, attempting OCR...")
+                pages = []
+                for first_page, last_page in page_windows(page_count):
+                    pages.extend(ocr_pdf_window(path, first_page, last_page))
+                extracted_text = format_pages(pages)
+                logging.info(f"OCR extracted {len(extracted_text)} characters")
+            
+            return extracted_text, page_count
+        
+        # DOCX files
+        elif file_ext in ['docx', 'doc']:
+            doc = Document(path)
+            extracted_text = "\n".join([para.text for para in doc.paragraphs])
+            # Also extract from tables
+            for table in doc.tables:
+                for row in table.rows:
+                    for cell in row.cells:
+                        extracted_text += "\n" + cell.text
+            return extracted_text, len(doc.paragraphs) // 20 or 1
+        
+        # Excel files
+        elif file_ext in ['xlsx', 'xls']:
+            # read_only streams rows instead of loading the whole workbook
+            wb = load_workbook(path, data_only=True, read_only=True)
+            try:
+                parts = []
+                for sheet in wb.worksheets:
+                    parts.append(f"\n--- Sheet: {sheet.title} ---\n")
+                    for row in sheet.iter_rows(values_only=True):
+                        parts.append(" | ".join([str(cell) if cell else "" for cell in row]) + "\n")
+                return "".join(parts), len(wb.worksheets)
+            finally:
+                wb.close()
+        
+        # PowerPoint files
+        elif file_ext in ['pptx', 'ppt']:
+            prs = Presentation(path)
+            extracted_text = ""
+            for i, slide in enumerate(prs.slides):
+                extracted_text += f"\n--- Slide {i+1} ---\n"
+                for shape in slide.shapes:
+                    if hasattr(shape, "text"):
+                        extracted_text += shape.text + "\n"
+            return extracted_text, len(prs.slides)
+        
+        # OpenDocument files
+        elif file_ext in ['odt', 'ods']:
+            doc = odf_load(path)
+            extracted_text = ""
+            for para in doc.getElementsByType(odf_text.P):
+                extracted_text += teletype.extractText(para) + "\n"
+            return extracted_text, 1
+        
+        # TXT and other text files
+        elif file_ext in ['txt', 'log', 'md', 'rtf', 'csv']:
+            extracted_text = read_text_file(path)
+            return extracted_text, len(extracted_text) // 3000 or 1
+        
+        # All image files with OCR
+        elif file_ext in ['jpg', 'jpeg', 'png', 'bmp', 'tiff', 'tif', 'gif', 'webp', 'heic', 'heif']:
+            logging.info(f"Processing image file with OCR: {file_ext}")
+            with Image.open(path) as image:
+                # Convert to RGB if needed
+                if image.mode in ('RGBA', 'LA', 'P'):
+                    image = image.convert('RGB')
+                extracted_text = pytesseract.image_to_string(image, lang=OCR_LANG)
+            logging.info(f"OCR extracted {len(extracted_text)} characters from image")
+            return extracted_text, 1
+        
+        # Fallback: Try to extract as text or use OCR
+        else:
+            logging.warning(f"Unknown file type: {file_ext}, attempting extraction...")
+            # Try as text first
+            try:
+                extracted_text = read_text_file(path)
+                if len(extracted_text.strip()) > 50:
+                    return extracted_text, 1
+            except:
+                pass
+            
+            # Try as image with OCR
+            try:
+                with Image.open(path) as image:
+                    extracted_text = pytesseract.image_to_string(image, lang=OCR_LANG)
+                if len(extracted_text.strip()) > 10:
+                    logging.info(f"Fallback OCR succeeded for {file_ext}")
+                    return extracted_text, 1
+            except:
+                pass
+            
+            raise ExtractionError(f"Could not extract text from {file_ext} file. The file may be corrupted or in an unsupported format.")
+    
+    except ExtractionError:
+        raise
+    except Exception as e:
+        logging.error(f"Text extraction error for {file_ext}: {str(e)}")
+        raise ExtractionError(f"Could not extract text from file: {str(e)}")
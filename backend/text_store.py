@@ -0,0 +1,124 @@
+"""
+Compressed storage for a contract's extracted text, kept out of `contract_analyses`.
+
+The text is split at page boundaries into segments of at most SEGMENT_CHARS characters,
+each stored zlib-compressed in its own `contract_texts` document. This keeps every
+document far below Mongo's 16 MB limit, and analysis reads never pull the text unless
+it is asked for. The contract's retrieval index is stored the same way
+(ContractIndexStore), as compressed JSON split into INDEX_SEGMENT_BYTES pieces.
+"""
+import asyncio
+import json
+import re
+import zlib
+from datetime import datetime, timezone
+
+from bson.binary import Binary
+
+SEGMENT_CHARS = 1_000_000
+INDEX_SEGMENT_BYTES = 4 * 1024 * 1024
+COMPRESSION_LEVEL = 6
+
+# Extracted text marks pages with "--- Page N ---" (see text_extractor.format_pages)
+_PAGE_MARKER = re.compile(r"(?=\n--- Page \d+ ---\n)")
+
+
+def split_segments(text: str, max_chars: int = SEGMENT_CHARS) -> list:
+    """Split `text` into consecutive segments, preferring page boundaries"""
+    segments = []
+    current = ""
+    for page in _PAGE_MARKER.split(text):
+        while len(page) > max_chars:
+            if current:
+                segments.append(current)
+                current = ""
+            segments.append(page[:max_chars])
+            page = page[max_chars:]
+        if len(current) + len(page) > max_chars:
+            segments.append(current)
+            current = ""
+        current += page
+    if current or not segments:
+        segments.append(current)
+    return segments
+
+
+def _compress(segments: list) -> list:
+    return [zlib.compress(segment.encode('utf-8'), COMPRESSION_LEVEL) for segment in segments]
+
+
+def _decompress(blobs: list) -> str:
+    return "".join(zlib.decompress(blob).decode('utf-8') for blob in blobs)
+
+
+def _compress_json(value) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def _decompress_json(blobs: list):
+    return json.loads(zlib.decompress(b"".join(blobs)).decode('utf-8'))
+
+
+class ContractTextStore:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def save(self, contract_id: str, text: str):
+        segments = split_segments(text)
+        blobs = await asyncio.to_thread(_compress, segments)
+        created_at = datetime.now(timezone.utc).isoformat()
+        await self.collection.delete_many({"contract_id": contract_id})
+        await self.collection.insert_many([
+            {
+                "contract_id": contract_id,
+                "seq": seq,
+                "chars": len(segment),
+                "data": Binary(blob),
+                "created_at": created_at
+            }
+            for seq, (segment, blob) in enumerate(zip(segments, blobs))
+        ])
+
+    async def load(self, contract_id: str):
+        """The full extracted text, or None if nothing is stored for this contract"""
+        docs = await self.collection.find(
+            {"contract_id": contract_id}, {"_id": 0, "seq": 1, "data": 1}
+        ).sort("seq", 1).to_list(None)
+        if not docs:
+            return None
+        return await asyncio.to_thread(_decompress, [bytes(doc["data"]) for doc in docs])
+
+
+class ContractIndexStore:
+    """A contract's retrieval index (a JSON-serializable dict), compressed and segmented"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def save(self, contract_id: str, index: dict):
+        blob = await asyncio.to_thread(_compress_json, index)
+        pieces = [blob[i:i + INDEX_SEGMENT_BYTES] for i in range(0, len(blob), INDEX_SEGMENT_BYTES)]
+        created_at = datetime.now(timezone.utc).isoformat()
+        await self.collection.delete_many({"contract_id": contract_id})
+        await self.collection.insert_many([
+            {
+                "contract_id": contract_id,
+                "seq": seq,
+                "segments": len(pieces),
+                "data": Binary(piece),
+                "created_at": created_at
+            }
+            for seq, piece in enumerate(pieces)
+        ])
+
+    async def load(self, contract_id: str):
+        """The stored index, or None if there is none (or only part of one, mid-rewrite)"""
+        docs = await self.collection.find(
+            {"contract_id": contract_id}, {"_id": 0, "seq": 1, "segments": 1, "data": 1}
+        ).sort("seq", 1).to_list(None)
+        if not docs or len(docs) != docs[0]["segments"]:
+            return None
+        try:
+            return await asyncio.to_thread(_decompress_json, [bytes(doc["data"]) for doc in docs])
+        except (zlib.error, ValueError):
+            return None
@@ -0,0 +1,29 @@
+"""
+Token counting for prompt budgets.
+
+Uses tiktoken's cl100k_base encoding as an approximation of the provider's tokenizer;
+falls back to ~4 characters per token if the encoding cannot be loaded (e.g. offline).
+"""
+import logging
+from functools import lru_cache
+
+TOKEN_ENCODING = "cl100k_base"
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception as e:
+        logging.warning(f"tiktoken unavailable, estimating token counts: {str(e)}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,65 @@
+"""
+Streaming storage for uploaded documents.
+Uploads are copied chunk by chunk into a temp file on disk (hashing and size-checking
+as they go), so no request ever holds a whole document in memory. Extraction workers
+then open the file by path.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+
+from fastapi import HTTPException, UploadFile
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class StoredUpload:
+    path: str
+    filename: str
+    sha256: str
+    size: int
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def check_content_length(content_length: str, max_bytes: int):
+    """Reject obviously oversized requests before reading the body"""
+    # Allow some slack for multipart boundaries and headers
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + 64 * 1024:
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum upload size is {max_bytes // (1024 * 1024)} MB.")
+
+
+async def store_upload(file: UploadFile, directory: str, max_bytes: int) -> StoredUpload:
+    """Stream `file` to disk under `directory`, enforcing `max_bytes` while copying"""
+    os.makedirs(directory, exist_ok=True)
+    suffix = os.path.splitext(file.filename or "")[1][:16]
+    digest = hashlib.sha256()
+    size = 0
+
+    tmp = tempfile.NamedTemporaryFile(dir=directory, prefix="upload_", suffix=suffix, delete=False)
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"File too large. Maximum upload size is {max_bytes // (1024 * 1024)} MB.")
+            digest.update(chunk)
+            await asyncio.to_thread(tmp.write, chunk)
+        tmp.close()
+    except BaseException:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise
+
+    logging.info(f"Stored upload {file.filename} ({size} bytes) at {tmp.name}")
+    return StoredUpload(path=tmp.name, filename=file.filename, sha256=digest.hexdigest(), size=size)
@@ -0,0 +1,30 @@
+"""
+Standalone worker for queued contract analyses.
+
+Run alongside the API with ANALYSIS_JOB_MODE=external set on the API side:
+
+    python worker.py
+
+The worker must see the same UPLOAD_DIR as the API (same host or a shared volume).
+"""
+import asyncio
+import logging
+
+from server import analysis_jobs, client, extraction_executor
+
+
+async def main():
+    # work_forever also requeues jobs whose process died
+    try:
+        await analysis_jobs.work_forever()
+    finally:
+        client.close()
+        extraction_executor.shutdown()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(main())
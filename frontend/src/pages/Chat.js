@@ -23,8 +23,17 @@ const Chat = () => {
 
   const loadSessionMessages = async (sid) => {
     try {
-      const response = await axios.get(`${API}/chat/${sid}/messages`);
-      const loadedMessages = response.data.map(msg => ([
+      // The first page holds the latest messages; follow X-Next-Cursor back to older ones
+      let history = [];
+      let before = null;
+      do {
+        const response = await axios.get(`${API}/chat/${sid}/messages`, {
+          params: before ? { limit: 1000, before } : { limit: 1000 }
+        });
+        history = [...response.data, ...history];
+        before = response.headers['x-next-cursor'];
+      } while (before);
+      const loadedMessages = history.map(msg => ([
         { role: 'user', content: msg.user_message },
         { role: 'assistant', content: msg.ai_response }
       ])).flat();
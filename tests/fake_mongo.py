@@ -0,0 +1,149 @@
+"""
+Minimal in-memory stand-in for the Motor collection methods the backend modules use.
+Supports equality, $lt/$lte/$gt/$gte/$in/$ne, $and/$or filters and $set/$inc/$unset/$setOnInsert updates.
+"""
+import copy
+from types import SimpleNamespace
+
+from pymongo import ReturnDocument
+
+_OPERATORS = {
+    "$lt": lambda value, arg: value is not None and value < arg,
+    "$lte": lambda value, arg: value is not None and value <= arg,
+    "$gt": lambda value, arg: value is not None and value > arg,
+    "$gte": lambda value, arg: value is not None and value >= arg,
+    "$in": lambda value, arg: value in arg or (isinstance(value, list) and any(v in arg for v in value)),
+    "$ne": lambda value, arg: value != arg,
+}
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(matches(doc, part) for part in condition):
+                return False
+            continue
+        if field == "$or":
+            if not any(matches(doc, part) for part in condition):
+                return False
+            continue
+        value = doc.get(field)
+        if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+            if not all(_OPERATORS[op](value, arg) for op, arg in condition.items()):
+                return False
+        elif value != condition and not (isinstance(value, list) and condition in value):
+            return False
+    return True
+
+
+def project(doc: dict, projection: dict) -> dict:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    included = [field for field, flag in projection.items() if flag and field != "_id"]
+    if included:
+        return {field: doc[field] for field in included if field in doc}
+    return {field: value for field, value in doc.items() if projection.get(field, 1)}
+
+
+def apply_update(doc: dict, update: dict, inserting: bool = False):
+    for field, value in update.get("$set", {}).items():
+        doc[field] = copy.deepcopy(value)
+    for field, amount in update.get("$inc", {}).items():
+        doc[field] = doc.get(field, 0) + amount
+    for field in update.get("$unset", {}):
+        doc.pop(field, None)
+    if inserting:
+        for field, value in update.get("$setOnInsert", {}).items():
+            doc[field] = copy.deepcopy(value)
+
+
+class FakeCursor:
+    def __init__(self, docs: list, projection: dict = None):
+        self._docs = docs
+        self._projection = projection
+
+    def sort(self, key, direction: int = 1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            self._docs.sort(key=lambda doc: doc.get(field), reverse=order < 0)
+        return self
+
+    def limit(self, count: int):
+        if count:
+            self._docs = self._docs[:count]
+        return self
+
+    async def to_list(self, length=None):
+        docs = self._docs if length is None else self._docs[:length]
+        return [project(doc, self._projection) for doc in docs]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._docs:
+            yield project(doc, self._projection)
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = []
+
+    async def insert_one(self, doc: dict):
+        self.docs.append(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_id=doc.get("id"))
+
+    async def insert_many(self, docs: list):
+        for doc in docs:
+            await self.insert_one(doc)
+
+    async def find_one(self, query: dict, projection: dict = None):
+        for doc in self.docs:
+            if matches(doc, query):
+                return project(doc, projection)
+        return None
+
+    def find(self, query: dict = None, projection: dict = None) -> FakeCursor:
+        # Sorting sees whole documents, as in Mongo; the projection applies to the results
+        return FakeCursor([doc for doc in self.docs if matches(doc, query or {})], projection)
+
+    async def find_one_and_update(self, query: dict, update: dict, sort=None, projection: dict = None,
+                                  return_document=ReturnDocument.BEFORE, upsert: bool = False):
+        candidates = [doc for doc in self.docs if matches(doc, query)]
+        for field, order in reversed(sort or []):
+            candidates.sort(key=lambda doc: doc.get(field), reverse=order < 0)
+        if not candidates:
+            return None
+        doc = candidates[0]
+        before = project(doc, projection)
+        apply_update(doc, update)
+        return project(doc, projection) if return_document == ReturnDocument.AFTER else before
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        for doc in self.docs:
+            if matches(doc, query):
+                apply_update(doc, update)
+                return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            doc = {field: value for field, value in query.items() if not field.startswith("$") and not isinstance(value, dict)}
+            apply_update(doc, update, inserting=True)
+            self.docs.append(doc)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc.get("id"))
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def count_documents(self, query: dict, limit: int = 0) -> int:
+        count = sum(1 for doc in self.docs if matches(doc, query))
+        return min(count, limit) if limit else count
+
+    async def delete_one(self, query: dict):
+        for doc in self.docs:
+            if matches(doc, query):
+                self.docs.remove(doc)
+                return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    async def delete_many(self, query: dict):
+        before = len(self.docs)
+        self.docs = [doc for doc in self.docs if not matches(doc, query)]
+        return SimpleNamespace(deleted_count=before - len(self.docs))
@@ -0,0 +1,218 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+
+import analysis_jobs
+from analysis_jobs import JOB_COMPLETED, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, AnalysisJobQueue, retry_delay
+from tests.fake_mongo import FakeCollection
+
+CONTRACT_TEXT = (
+    "§ 1 Mietgegenstand\nVermietet wird die Wohnung im zweiten Obergeschoss.\n\n"
+    "§ 2 Miete\nDie Miete beträgt monatlich 900 EUR und ist bis zum dritten Werktag zu zahlen.\n"
+)
+
+
+def _server(tmp_path):
+    # server.py reads its configuration at import; keep it away from real services
+    os.environ.setdefault("MONGODB_URI", "mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=100")
+    os.environ.setdefault("GROQ_API_KEY", "test")
+    os.environ.setdefault("EXTRACTION_CACHE", "off")
+    os.environ.setdefault("UPLOAD_DIR", str(tmp_path / "uploads"))
+    os.environ.setdefault("REPORT_CACHE_DIR", str(tmp_path / "reports"))
+    import server
+    return server
+
+
+def _age(collection: FakeCollection, job_id: str, seconds: int):
+    old = (datetime.now(timezone.utc) - timedelta(seconds=seconds)).isoformat()
+    for doc in collection.docs:
+        if doc["id"] == job_id:
+            doc["updated_at"] = old
+
+
+def test_job_interrupted_during_llm_stages_keeps_its_upload_for_the_rerun(tmp_path, monkeypatch):
+    server = _server(tmp_path)
+    upload_path = tmp_path / "lease.txt"
+    upload_path.write_text(CONTRACT_TEXT)
+
+    async def extract(path, filename, on_progress=None):
+        with open(path, encoding="utf-8") as f:
+            return f.read(), 1
+
+    llm_called = asyncio.Event()
+
+    async def hanging_send(*args, **kwargs):
+        llm_called.set()
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(server.extraction_executor, "extract", extract)
+    monkeypatch.setattr(server.llm, "send", hanging_send)
+
+    async def crash_and_requeue():
+        collection = FakeCollection()
+        queue = AnalysisJobQueue(collection, server.run_analysis_job, cleanup=server.remove_job_upload)
+        job = await queue.create(filename="lease.txt", upload_path=str(upload_path), upload_sha256="0" * 64, upload_size=upload_path.stat().st_size)
+        claimed = await queue.claim(job["id"])
+
+        # The process dies while the analysis waits for the LLM
+        run = asyncio.create_task(queue.run(claimed))
+        await asyncio.wait_for(llm_called.wait(), 5)
+        run.cancel()
+        await asyncio.gather(run, return_exceptions=True)
+        assert (await queue.get(job["id"]))["status"] == JOB_RUNNING
+
+        _age(collection, job["id"], 600)
+        await queue.requeue_stale()
+        return await queue.get(job["id"]), await queue.claim(job["id"])
+
+    requeued, reclaimed = asyncio.run(crash_and_requeue())
+
+    assert requeued["status"] == JOB_QUEUED
+    assert reclaimed["attempts"] == 2
+    assert upload_path.exists()
+
+
+class StatusWriteFailingCollection(FakeCollection):
+    """Mongo goes away right when the final job status is written"""
+
+    async def update_one(self, query, update, upsert=False):
+        if "status" in update.get("$set", {}):
+            raise ConnectionError("mongo is down")
+        return await super().update_one(query, update, upsert)
+
+
+def test_upload_is_kept_when_the_final_status_cannot_be_written():
+    cleaned = []
+
+    async def failing_runner(job, progress):
+        raise ValueError("broken document")
+
+    async def run_job():
+        queue = AnalysisJobQueue(StatusWriteFailingCollection(), failing_runner, cleanup=cleaned.append)
+        job = await queue.create(filename="lease.pdf")
+        try:
+            await queue.run(await queue.claim(job["id"]))
+        except ConnectionError:
+            pass
+        return await queue.get(job["id"])
+
+    job = asyncio.run(run_job())
+
+    assert job["status"] == JOB_RUNNING
+    assert cleaned == []
+
+
+def test_claim_takes_the_oldest_queued_job_and_counts_the_attempt():
+    async def claim_all():
+        queue = AnalysisJobQueue(FakeCollection(), runner=None)
+        first = await queue.create(filename="a.pdf", created_at="2024-01-01T00:00:00+00:00")
+        await queue.create(filename="b.pdf", created_at="2024-01-02T00:00:00+00:00")
+        claimed = [await queue.claim(), await queue.claim(), await queue.claim()]
+        return first, claimed
+
+    first, (oldest, newer, none_left) = asyncio.run(claim_all())
+
+    assert oldest["id"] == first["id"]
+    assert (oldest["status"], oldest["attempts"]) == (JOB_RUNNING, 1)
+    assert newer["filename"] == "b.pdf"
+    assert none_left is None
+
+
+def test_running_job_sends_heartbeats(monkeypatch):
+    monkeypatch.setattr(analysis_jobs, "JOB_HEARTBEAT_SECONDS", 0.01)
+
+    async def slow_runner(job, progress):
+        await asyncio.sleep(0.1)
+        return "analysis-1"
+
+    async def run_job():
+        collection = FakeCollection()
+        queue = AnalysisJobQueue(collection, slow_runner)
+        job = await queue.create(filename="a.pdf")
+        claimed = await queue.claim(job["id"])
+        run = asyncio.create_task(queue.run(claimed))
+        await asyncio.sleep(0.05)
+        heartbeat = await queue.get(job["id"])
+        await run
+        return claimed, heartbeat, await queue.get(job["id"])
+
+    claimed, heartbeat, finished = asyncio.run(run_job())
+
+    assert heartbeat["status"] == JOB_RUNNING
+    assert heartbeat["updated_at"] > claimed["updated_at"]
+    assert (finished["status"], finished["result_id"]) == (JOB_COMPLETED, "analysis-1")
+
+
+def test_retry_delay_backs_off_for_busy_extraction_only():
+    busy = HTTPException(status_code=503, detail="busy")
+
+    assert [retry_delay(busy, attempt) for attempt in (1, 2, 3)] == [10, 20, 40]
+    assert retry_delay(HTTPException(status_code=503, detail="busy", headers={"Retry-After": "3"}), 2) == 6
+    assert retry_delay(HTTPException(status_code=400, detail="bad file"), 1) is None
+    assert retry_delay(ValueError("boom"), 1) is None
+
+
+def test_busy_job_is_retried_until_max_attempts_then_failed_and_cleaned_up():
+    runs = []
+    cleaned = []
+
+    async def busy_runner(job, progress):
+        runs.append(job["id"])
+        raise HTTPException(status_code=503, detail="Server busy", headers={"Retry-After": "0"})
+
+    async def run_job():
+        queue = AnalysisJobQueue(FakeCollection(), busy_runner, cleanup=cleaned.append, max_attempts=3)
+        job = await queue.create(filename="a.pdf")
+        await queue.run(await queue.claim(job["id"]))
+        return await queue.get(job["id"])
+
+    job = asyncio.run(run_job())
+
+    assert len(runs) == 3
+    assert (job["status"], job["attempts"], job["error"]) == (JOB_FAILED, 3, "Server busy")
+    assert [c["id"] for c in cleaned] == [job["id"]]
+
+
+def test_busy_job_completes_once_the_pool_frees_up():
+    outcomes = [HTTPException(status_code=503, detail="busy", headers={"Retry-After": "0"}), "analysis-7"]
+
+    async def runner(job, progress):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def run_job():
+        queue = AnalysisJobQueue(FakeCollection(), runner)
+        job = await queue.create(filename="a.pdf")
+        await queue.run(await queue.claim(job["id"]))
+        return await queue.get(job["id"])
+
+    job = asyncio.run(run_job())
+
+    assert (job["status"], job["result_id"], job["attempts"]) == (JOB_COMPLETED, "analysis-7", 2)
+
+
+def test_requeue_stale_skips_live_jobs_and_fails_exhausted_ones():
+    cleaned = []
+
+    async def requeue():
+        collection = FakeCollection()
+        queue = AnalysisJobQueue(collection, runner=None, cleanup=cleaned.append, max_attempts=2)
+        live, stale, exhausted = [await queue.create(filename=name) for name in ("live.pdf", "stale.pdf", "exhausted.pdf")]
+        for job in (live, stale, exhausted):
+            await queue.claim(job["id"])
+        await collection.update_one({"id": exhausted["id"]}, {"$inc": {"attempts": 1}})
+        _age(collection, stale["id"], 600)
+        _age(collection, exhausted["id"], 600)
+        await queue.requeue_stale()
+        return [await queue.get(job["id"]) for job in (live, stale, exhausted)]
+
+    live, stale, exhausted = asyncio.run(requeue())
+
+    assert live["status"] == JOB_RUNNING
+    assert (stale["status"], stale["message"]) == (JOB_QUEUED, "requeued")
+    assert exhausted["status"] == JOB_FAILED
+    assert [c["id"] for c in cleaned] == [exhausted["id"]]
@@ -0,0 +1,54 @@
+import asyncio
+
+from pymongo.errors import DuplicateKeyError
+
+from chat_sessions import ChatSessionStore
+from tests.fake_mongo import FakeCollection
+
+
+class RacingCollection(FakeCollection):
+    """Another request creates the session between this upsert's match and its insert"""
+
+    def __init__(self):
+        super().__init__()
+        self.raced = False
+
+    async def update_one(self, query, update, upsert=False):
+        if upsert and not self.raced:
+            self.raced = True
+            await super().update_one(query, {
+                "$set": {"preview": "first", "timestamp": "2024-01-01T00:00:00"},
+                "$inc": {"message_count": 1},
+                "$setOnInsert": {"title": None, "created_at": "2024-01-01T00:00:00"}
+            }, upsert=True)
+            raise DuplicateKeyError("E11000 duplicate key error collection: chat_sessions index: session_id_unique")
+        return await super().update_one(query, update, upsert)
+
+
+def test_concurrent_first_messages_both_count():
+    collection = RacingCollection()
+    store = ChatSessionStore(collection)
+
+    asyncio.run(store.record_message("s1", "second message", "2024-01-01T00:00:01"))
+
+    [session] = collection.docs
+    assert session["message_count"] == 2
+    assert session["preview"] == "second message"
+    assert session["created_at"] == "2024-01-01T00:00:00"
+
+
+def test_sessions_page_newest_first():
+    store = ChatSessionStore(FakeCollection())
+
+    async def record_and_page():
+        for n in range(5):
+            await store.record_message(f"s{n}", f"question {n}", f"2024-01-01T00:00:0{n}")
+        first, cursor = await store.page(limit=3)
+        rest, end = await store.page(limit=3, before=cursor)
+        return first, rest, end
+
+    first, rest, end = asyncio.run(record_and_page())
+
+    assert [s["session_id"] for s in first] == ["s4", "s3", "s2"]
+    assert [s["session_id"] for s in rest] == ["s1", "s0"]
+    assert end is None
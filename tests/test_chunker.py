@@ -0,0 +1,92 @@
+import random
+import re
+
+import chunker
+from chunker import PAGE_MARKER_TEXT, _split_oversized, chunk_size_for, iter_chunks
+from tokenizer import count_tokens
+
+WORDS = (
+    "der die das Mieter Vermieter Wohnung Miete Kaution Frist Kündigung Vertrag Zahlung Monat "
+    "Nebenkosten Schaden Reparatur Haftung Übergabe Schlüssel Garten Keller Heizung Wasser Strom"
+).split()
+
+
+def contract(seed: int = 1, sections: int = 60) -> str:
+    """A long lease-like document: § headings followed by one to four paragraphs"""
+    rng = random.Random(seed)
+    lines = []
+    page = 1
+    for number in range(1, sections + 1):
+        if number % 6 == 0:
+            page += 1
+            lines.append(f"--- Page {page} ---")
+        lines.append(f"§ {number} {rng.choice(WORDS).capitalize()} und {rng.choice(WORDS)}")
+        for _ in range(rng.randint(1, 4)):
+            lines.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 90))) + ".")
+            lines.append("")
+    # As text_extractor.format_pages writes them
+    return "\n--- Page 1 ---\n" + "\n".join(lines)
+
+
+def fingerprints(text: str) -> list:
+    # Like server.chunk_fingerprint: page markers and whitespace do not count
+    return [" ".join(PAGE_MARKER_TEXT.sub("", chunk.text).split()) for chunk in iter_chunks(text, 1500, 100, anchored=True)]
+
+
+def test_chunks_cover_the_document_within_budget():
+    text = contract()
+
+    chunks = list(iter_chunks(text, max_tokens=1500, overlap_tokens=100, anchored=True))
+
+    assert not text[:chunks[0].start].strip()
+    assert chunks[-1].end == len(text)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        # Overlapping, or separated by nothing but the blank lines between blocks
+        assert not text[previous.end:chunk.start].strip()
+    assert all(chunk.tokens <= 1500 for chunk in chunks)
+    assert chunks[0].page_start == 1
+    assert chunks[-1].page_end == 11
+
+
+def test_anchored_chunks_outside_an_edit_stay_the_same():
+    original = contract()
+    position = original.index("§ 20 ")
+    edited = original[:position] + "Der Mieter darf keine Haustiere halten.\n\n" + original[position:]
+
+    before, after = fingerprints(original), fingerprints(edited)
+
+    reused = [chunk for chunk in after if chunk in set(before)]
+    assert len(reused) >= 0.75 * len(after)
+    assert len(after) - len(reused) >= 1
+
+
+def test_oversized_block_is_split_at_sentence_ends():
+    sentence = "Der Mieter zahlt die Nebenkosten monatlich im Voraus an den Vermieter. "
+    text = sentence * 40
+
+    pieces = list(_split_oversized(text, 0, len(text), max_tokens=100))
+
+    assert len(pieces) > 1
+    assert pieces[0][0] == 0 and pieces[-1][1] == len(text)
+    for (_, end, _), (start, _, _) in zip(pieces, pieces[1:]):
+        assert end == start
+    for start, end, tokens in pieces:
+        assert text[start:end].endswith(". ")
+        assert count_tokens(text[start:end]) <= 100
+
+
+def test_hard_split_recounts_dense_text(monkeypatch):
+    # Digit runs take far more tokens than the 4 chars per token the split starts from
+    monkeypatch.setattr(chunker, "count_tokens", lambda text: len(re.findall(r"\d", text)) + len(re.sub(r"\d", "", text)) // 4)
+    text = "Kontonummer " + "0123456789" * 60
+
+    pieces = list(_split_oversized(text, 0, len(text), max_tokens=100))
+
+    assert "".join(text[start:end] for start, end, _ in pieces) == text
+    assert all(tokens == chunker.count_tokens(text[start:end]) <= 100 for start, end, tokens in pieces)
+
+
+def test_chunk_size_doubles_for_long_documents():
+    assert chunk_size_for(5_000, 1500, 16, 6000) == 1500
+    assert chunk_size_for(30_000, 1500, 16, 6000) == 3000
+    assert chunk_size_for(500_000, 1500, 16, 6000) == 6000
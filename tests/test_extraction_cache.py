@@ -0,0 +1,19 @@
+import asyncio
+import logging
+
+from extraction_cache import DiskExtractionCache
+
+
+def test_concurrent_writes_of_one_document_all_land(tmp_path, caplog):
+    cache = DiskExtractionCache(str(tmp_path))
+
+    async def extract_many():
+        await asyncio.gather(*(cache.set("doc:1", f"text {i}", 1) for i in range(200)))
+        return await cache.get("doc:1")
+
+    with caplog.at_level(logging.WARNING):
+        text, pages = asyncio.run(extract_many())
+
+    assert text.startswith("text ") and pages == 1
+    assert "cache write failed" not in caplog.text
+    assert [path.suffix for path in tmp_path.iterdir()] == [".json"]
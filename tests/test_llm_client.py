@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from llm_client import CircuitBreaker, LlmError, LlmResponseCache, LlmScheduler, LlmUnavailable, TokenBucket
+
+
+class FakeProvider:
+    """Answers /chat/completions with the queued status codes, then 200"""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status != 200:
+            return httpx.Response(status, text="provider trouble")
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": f"answer {self.calls}"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 2}
+        })
+
+
+def scheduler_for(provider: FakeProvider, **options) -> LlmScheduler:
+    scheduler = LlmScheduler("test-key", backoff_base=0.0, **options)
+    scheduler._http = httpx.AsyncClient(base_url=scheduler.base_url, transport=httpx.MockTransport(provider.handler))
+    return scheduler
+
+
+def test_breaker_opens_then_lets_one_probe_through(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    breaker.before_call()
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    with pytest.raises(LlmUnavailable):
+        breaker.before_call()
+
+    now[0] += 31
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(LlmUnavailable):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_the_breaker(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+
+    now[0] += 31
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.retry_after() == 30
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(rate_per_minute=600, capacity=1)
+
+    async def take_two():
+        return await bucket.acquire(1), await bucket.acquire(1)
+
+    first, second = asyncio.run(take_two())
+
+    assert first == 0.0
+    assert second == pytest.approx(0.1, abs=0.02)
+
+
+def test_retries_until_success_and_throttles_every_attempt():
+    provider = FakeProvider([429, 503])
+    scheduler = scheduler_for(provider, requests_per_minute=6000, max_retries=3)
+    acquired = []
+    acquire = scheduler._request_bucket.acquire
+
+    async def counting_acquire(amount=1.0):
+        acquired.append(amount)
+        return await acquire(amount)
+
+    scheduler._request_bucket.acquire = counting_acquire
+
+    completion = asyncio.run(scheduler.send("system", "prompt"))
+
+    assert completion == "answer 3"
+    assert provider.calls == 3
+    assert scheduler.retries == 2
+    assert len(acquired) == 3
+
+
+def test_gives_up_after_max_retries_and_does_not_retry_rejections():
+    provider = FakeProvider([500, 500, 500, 400])
+    scheduler = scheduler_for(provider, max_retries=2)
+
+    async def call_twice():
+        errors = []
+        for _ in range(2):
+            try:
+                await scheduler.send("system", "prompt")
+            except LlmError as e:
+                errors.append(e.status_code)
+        return errors
+
+    assert asyncio.run(call_twice()) == [500, 400]
+    assert provider.calls == 4
+    assert scheduler.retries == 2
+
+
+def test_response_cache_hit_expiry_and_bypass():
+    provider = FakeProvider()
+    scheduler = scheduler_for(provider, cache=LlmResponseCache(ttl=0.2))
+
+    async def calls():
+        first = await scheduler.send("system", "prompt", use_cache=True)
+        hit = await scheduler.send("system", "prompt", use_cache=True)
+        bypass = await scheduler.send("system", "prompt")
+        await asyncio.sleep(0.3)
+        expired = await scheduler.send("system", "prompt", use_cache=True)
+        return first, hit, bypass, expired
+
+    first, hit, bypass, expired = asyncio.run(calls())
+
+    assert (first, hit, bypass, expired) == ("answer 1", "answer 1", "answer 2", "answer 3")
+    assert scheduler.cache.stats()["hits"] == 1
+    assert scheduler.cache.stats()["misses"] == 2
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from pagination import decode_cursor, encode_cursor, keyset_page
+from tests.fake_mongo import FakeCollection
+
+
+def messages(count: int) -> FakeCollection:
+    collection = FakeCollection()
+    # Pairs of messages share a timestamp, so the id has to break ties
+    collection.docs = [
+        {"id": f"m{i:02d}", "session_id": "s1", "timestamp": f"2024-01-01T00:00:{i // 2:02d}"}
+        for i in range(count)
+    ]
+    return collection
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("2024-01-01T00:00:00+00:00", "a/b+c")
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == ("2024-01-01T00:00:00+00:00", "a/b+c")
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", encode_cursor("t", "x")[:-3], "WzEsMl0"])
+def test_malformed_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+
+    assert error.value.status_code == 400
+
+
+def test_paging_back_visits_every_item_once_in_order():
+    collection = messages(11)
+
+    async def walk_back():
+        pages = []
+        items, cursor = await keyset_page(collection, {"session_id": "s1"}, limit=4)
+        pages.append(items)
+        while cursor:
+            items, cursor = await keyset_page(collection, {"session_id": "s1"}, limit=4, before=cursor)
+            pages.append(items)
+        return pages
+
+    pages = asyncio.run(walk_back())
+
+    assert [len(page) for page in pages] == [4, 4, 3]
+    ids = [item["id"] for page in reversed(pages) for item in page]
+    assert ids == [f"m{i:02d}" for i in range(11)]
+
+
+def test_paging_forward_from_a_cursor():
+    collection = messages(6)
+
+    async def forward():
+        first, _ = await keyset_page(collection, {"session_id": "s1"}, limit=2, before=encode_cursor("2024-01-01T00:00:01", "m02"))
+        newer, cursor = await keyset_page(collection, {"session_id": "s1"}, limit=2, after=encode_cursor(first[-1]["timestamp"], first[-1]["id"]))
+        rest, end = await keyset_page(collection, {"session_id": "s1"}, limit=2, after=cursor)
+        return first, newer, rest, end
+
+    first, newer, rest, end = asyncio.run(forward())
+
+    assert [item["id"] for item in first] == ["m00", "m01"]
+    assert [item["id"] for item in newer] == ["m02", "m03"]
+    assert [item["id"] for item in rest] == ["m04", "m05"]
+    assert end is None
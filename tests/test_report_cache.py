@@ -0,0 +1,39 @@
+import asyncio
+
+from report_cache import ReportCache, etag_matches, report_etag
+
+
+def test_concurrent_writes_of_one_report_all_succeed(tmp_path):
+    cache = ReportCache(str(tmp_path))
+
+    async def render_many():
+        await asyncio.gather(*(cache.set("contract-1", b"%PDF-" + bytes([i % 256])) for i in range(200)))
+        return await cache.get("contract-1")
+
+    data = asyncio.run(render_many())
+
+    assert data.startswith(b"%PDF-")
+    assert [path.name for path in tmp_path.iterdir()] == [cache._path("contract-1").name]
+
+
+def test_evicted_report_is_a_miss(tmp_path):
+    cache = ReportCache(str(tmp_path), max_bytes=10)
+
+    async def write_two():
+        await cache.set("old", b"x" * 8)
+        await cache.set("new", b"y" * 8)
+        return await cache.get("old"), await cache.get("new")
+
+    old, new = asyncio.run(write_two())
+
+    assert old is None
+    assert new == b"y" * 8
+    assert cache.stats()["misses"] == 1
+
+
+def test_weak_etag_matches_strong_and_listed_tags():
+    etag = report_etag("abc")
+
+    assert etag_matches(etag.replace("W/", ""), etag)
+    assert etag_matches(f'"other", {etag}', etag)
+    assert not etag_matches('"other"', etag)
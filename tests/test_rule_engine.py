@@ -0,0 +1,46 @@
+from rule_engine import RuleEngine, group_overlapping
+
+# Entries as in server.py's CLAUSE_DATABASE / LAW_DATABASE
+DEPOSIT_CLAUSE = {
+    "pattern": r"(kaution|deposit|security).{0,50}([4-9]|[1-9][0-9]).{0,20}(monat|month)",
+    "risk": "violates",
+    "explanation": "Deposit exceeds legal maximum of 3 months rent",
+    "law_ref": "mietrecht_1"
+}
+LAWS = [{"id": "mietrecht_1", "title": "Mietrecht § 535 BGB", "url": "https://www.gesetze-im-internet.de/bgb/__535.html"}]
+
+
+def test_clause_wrapped_across_lines_is_flagged():
+    engine = RuleEngine([DEPOSIT_CLAUSE], [], LAWS)
+    text = "§ 3 Mietsicherheit\nDer Mieter zahlt eine Kaution in Höhe von\n5 Monatsmieten vor Einzug."
+
+    matches = engine.scan(text)
+
+    assert len(matches) == 1
+    assert text[matches[0].start:matches[0].end] == "Kaution in Höhe von\n5 Monat"
+    assert matches[0].snippet(text).endswith("Kaution in Höhe von 5 Monatsmieten vor Einzug.")
+
+
+def test_offsets_map_back_past_collapsed_whitespace():
+    engine = RuleEngine([DEPOSIT_CLAUSE], [], LAWS)
+    text = "Präambel\n\n\n   Seite 1\n\n§ 3\tKaution:   6\n\n  Monatsmieten."
+
+    [match] = engine.scan(text)
+    [group] = group_overlapping([match], len(text))
+
+    assert text[match.start:match.end] == "Kaution:   6\n\n  Monat"
+    assert group.matches == [match]
+
+
+def test_word_bounded_scam_pattern_keeps_prefilter():
+    # Entry as in server.py's SCAM_PATTERNS
+    sensitive = {
+        "pattern": r"\b(bank account|bankkonto|credit card|kreditkarte|password|passwort|pin|social security|personal information|ssn)\b",
+        "indicator": "Requests sensitive personal information",
+        "severity": "high"
+    }
+    engine = RuleEngine([], [sensitive], LAWS)
+
+    assert engine.rules[0].keywords == ("bank account", "bankkonto", "credit card", "kreditkarte", "password", "passwort", "pin", "social security", "personal information", "ssn")
+    assert engine.scan("Aushänge im Treppenhaus erfolgen an der Pinnwand.") == []
+    assert len(engine.scan("Bitte senden Sie uns Ihre PIN.")) == 1
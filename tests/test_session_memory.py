@@ -0,0 +1,69 @@
+import asyncio
+
+from session_memory import SessionMemory
+from tests.fake_mongo import FakeCollection
+
+
+class FakeLlm:
+    def __init__(self):
+        self.prompts = []
+
+    async def send(self, system_message, prompt, operation="completion", **kwargs):
+        self.prompts.append(prompt)
+        return f"summary {len(self.prompts)}"
+
+
+def chat(turns: int) -> FakeCollection:
+    messages = FakeCollection()
+    messages.docs = [
+        {"id": f"t{i:02d}", "session_id": "s1", "timestamp": f"2024-01-01T00:{i:02d}:00",
+         "user_message": f"question {i}", "ai_response": f"answer {i}"}
+        for i in range(turns)
+    ]
+    return messages
+
+
+def test_refresh_waits_for_a_full_batch():
+    llm = FakeLlm()
+    memory = SessionMemory(FakeCollection(), chat(9), llm, recent_turns=6, summary_batch=4)
+
+    summary, turns = asyncio.run(_refresh_and_read(memory))
+
+    assert llm.prompts == []
+    assert summary == ""
+    assert len(turns) == 9
+
+
+def test_older_turns_are_folded_into_the_summary():
+    llm = FakeLlm()
+    messages = chat(10)
+    memory = SessionMemory(FakeCollection(), messages, llm, recent_turns=6, summary_batch=4)
+
+    summary, turns = asyncio.run(_refresh_and_read(memory))
+
+    assert summary == "summary 1"
+    assert "question 3" in llm.prompts[0] and "question 4" not in llm.prompts[0]
+    assert [turn["user_message"] for turn in turns] == [f"question {i}" for i in range(4, 10)]
+
+    # The next batch continues from where the first one stopped
+    messages.docs += chat(14).docs[10:]
+    summary, turns = asyncio.run(_refresh_and_read(memory))
+
+    assert summary == "summary 2"
+    assert "summary 1" in llm.prompts[1]
+    assert "question 7" in llm.prompts[1] and "question 3" not in llm.prompts[1]
+    assert len(turns) == 6
+
+
+def test_rendered_context_truncates_long_answers():
+    memory = SessionMemory(FakeCollection(), chat(0), FakeLlm(), turn_chars=5)
+
+    rendered = memory.render("Tenant asked about the deposit.", [{"user_message": "Hi", "ai_response": "a long answer"}])
+
+    assert rendered.startswith("SUMMARY OF EARLIER CONVERSATION:\nTenant asked about the deposit.")
+    assert "Assistant: a lon..." in rendered
+
+
+async def _refresh_and_read(memory: SessionMemory):
+    await memory.refresh("s1")
+    return await memory.context("s1")
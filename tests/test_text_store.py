@@ -0,0 +1,69 @@
+import asyncio
+
+import text_store
+from chunker import iter_chunks
+from retrieval import attach_text, build_index, passage_label, select_passages
+from tests.fake_mongo import FakeCollection
+from text_store import ContractIndexStore, ContractTextStore, split_segments
+
+DOCUMENT = (
+    "\n--- Page 1 ---\n§ 1 Mietsache\nVermietet wird eine Dreizimmerwohnung mit Balkon und Kellerabteil.\n\n"
+    "§ 2 Miete\nDie monatliche Miete beträgt 900 EUR zuzüglich Betriebskosten.\n"
+    "\n--- Page 2 ---\n§ 3 Kaution\nDer Mieter leistet eine Kaution von drei Monatsmieten.\n\n"
+    "§ 4 Haustiere\nDie Haltung von Hunden und Katzen bedarf der Zustimmung des Vermieters.\n"
+)
+
+
+def test_segments_prefer_page_boundaries():
+    segments = split_segments(DOCUMENT, max_chars=200)
+
+    assert "".join(segments) == DOCUMENT
+    assert segments[1].startswith("\n--- Page 2 ---")
+    assert len(segments) == 2
+
+
+def test_text_round_trip_across_segments(monkeypatch):
+    # save() splits with the default segment size
+    monkeypatch.setattr(text_store.split_segments, "__defaults__", (100,))
+    collection = FakeCollection()
+    store = ContractTextStore(collection)
+
+    async def round_trip():
+        await store.save("c1", DOCUMENT)
+        await store.save("c1", DOCUMENT)  # a rewrite replaces the old segments
+        return await store.load("c1"), await store.load("missing")
+
+    text, missing = asyncio.run(round_trip())
+
+    assert text == DOCUMENT
+    assert missing is None
+    assert len(collection.docs) == len(split_segments(DOCUMENT, 100)) > 1
+
+
+def test_index_round_trip_and_partial_index_is_a_miss(monkeypatch):
+    monkeypatch.setattr(text_store, "INDEX_SEGMENT_BYTES", 64)
+    collection = FakeCollection()
+    store = ContractIndexStore(collection)
+    index = build_index(list(iter_chunks(DOCUMENT, max_tokens=30, overlap_tokens=0)))
+
+    async def round_trip():
+        await store.save("c1", index)
+        loaded = await store.load("c1")
+        collection.docs.pop()  # a concurrent rewrite has not inserted every segment yet
+        return loaded, await store.load("c1")
+
+    loaded, partial = asyncio.run(round_trip())
+
+    assert loaded == index
+    assert partial is None
+
+
+def test_passages_are_selected_by_relevance_and_cited_with_pages():
+    index = build_index(list(iter_chunks(DOCUMENT, max_tokens=30, overlap_tokens=0)))
+    assert all("text" not in passage for passage in index["passages"])
+
+    selected = select_passages(attach_text(index, DOCUMENT), "Wie hoch ist die Kaution?", token_budget=40, top_k=2)
+
+    position, text = selected[0]
+    assert "Kaution von drei Monatsmieten" in text
+    assert passage_label(index, position) == f"Passage {position + 1}, page 2"